@@ -0,0 +1,277 @@
+'''
+Mainstay v0.4 - Copyright 2025 James Slaughter,
+This file is part of Mainstay v0.4.
+
+Mainstay v0.4 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Mainstay v0.4 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Mainstay v0.4.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+"""
+batch.py - Batch processing for Mainstay v0.4
+
+This module runs one or more prompts over every item in a directory or JSONL file from a single process.  Items
+are dispatched concurrently through the engine's worker pool, one output file is written per item and prompt, and
+a manifest records the status, latency and token usage of each.  A re-run with the same output directory skips
+everything the manifest already records as complete, so an interrupted batch resumes where it stopped.
+
+Classes:
+    batch: Loads batch items, runs them through the engine and maintains the manifest.
+
+Copyright 2025 James Slaughter. Licensed under GPL v3 or later.
+"""
+
+#python imports
+import os
+import re
+import json
+import hashlib
+from concurrent.futures import as_completed
+
+#programmer generated imports
+#none
+
+'''
+batch
+Class: This class is responsible for running prompts over a directory or JSONL file of inputs
+'''
+class batch:
+    """
+    The batch class drives a batch run through an engine object.
+    """
+    '''
+    Constructor
+    '''
+    def __init__(self, ENG):
+        """
+        Initializes the batch class.
+
+        Args:
+            ENG: The engine used to run each item.
+        """
+        self.ENG = ENG
+
+    '''
+    LoadItems()
+    Function: - Reads the batch items from a directory or a JSONL file
+    '''
+    def LoadItems(self, source):
+        """
+        Loads the items to process.
+
+        A directory yields one item per regular file, identified by its file name.  A JSONL file yields one item
+        per line; each line is an object with "input" (or "text") and optional "id" and "url" fields.
+
+        Args:
+            source: Path to a directory or a .jsonl file.
+
+        Returns:
+            list: Dictionaries with id, input and url.
+
+        Raises:
+            Exception: If the source cannot be read.
+        """
+        items = []
+
+        if (os.path.isdir(source)):
+            for name in sorted(os.listdir(source)):
+                path = os.path.join(source, name)
+                if (not os.path.isfile(path)):
+                    continue
+                with open(path, 'r', encoding='utf-8', errors='replace') as read_file:
+                    items.append({'id': name, 'input': read_file.read(), 'url': ''})
+        else:
+            with open(source, 'r', encoding='utf-8') as read_file:
+                for number, line in enumerate(read_file, 1):
+                    if (line.strip() == ''):
+                        continue
+                    record = json.loads(line)
+                    items.append({'id': str(record.get('id', 'item' + str(number))),
+                                  'input': record.get('input', record.get('text', '')),
+                                  'url': record.get('url', '')})
+
+        return items
+
+    '''
+    LoadManifest()
+    Function: - Returns the (id, prompt) pairs a previous run completed successfully
+    '''
+    def LoadManifest(self, manifest):
+        """
+        Reads an existing manifest.
+
+        Returns:
+            set: (id, prompt) tuples whose last recorded status is 'ok'.
+        """
+        completed = set()
+
+        if (not os.path.exists(manifest)):
+            return completed
+
+        with open(manifest, 'r', encoding='utf-8') as read_file:
+            for line in read_file:
+                try:
+                    record = json.loads(line)
+                except Exception:
+                    # A crash can leave a partial last line behind
+                    continue
+                if (record.get('status') == 'ok'):
+                    completed.add((record['id'], record['prompt']))
+                else:
+                    completed.discard((record['id'], record['prompt']))
+
+        return completed
+
+    '''
+    Stems()
+    Function: - Returns a safe and distinct output file name stem for each item id
+    '''
+    def Stems(self, items):
+        """
+        Replaces the characters of each item id that are unsafe in a file name with '_'.  Ids that only differ in
+        those characters, such as "a b" and "a_b", would then share a stem and overwrite each other's outputs, so
+        each altered id in such a group gets the first 8 hex digits of the SHA-256 of the raw id appended.  The
+        stems depend only on the ids, so a resumed run writes to the same files.
+
+        Returns:
+            dict: Item id -> stem.
+        """
+        groups = {}
+        for item in items:
+            groups.setdefault(re.sub(r'[^A-Za-z0-9._-]', '_', item['id']), set()).add(item['id'])
+
+        stems = {}
+        for stem, ids in groups.items():
+            for itemid in ids:
+                if ((len(ids) > 1) and (itemid != stem)):
+                    stems[itemid] = stem + '-' + hashlib.sha256(itemid.encode('utf-8')).hexdigest()[:8]
+                else:
+                    stems[itemid] = stem
+
+        return stems
+
+    '''
+    OutputName()
+    Function: - Builds the output file name for an item's stem and prompt
+    '''
+    def OutputName(self, stem, prompt):
+        return stem + '_' + prompt + '.md'
+
+    '''
+    Record()
+    Function: - Appends the outcome of one item and prompt to the manifest
+    '''
+    def Record(self, write_file, job, result):
+        """
+        Appends one manifest line and flushes it, so a crash loses at most the line being written.
+
+        Args:
+            write_file: The open manifest file.
+            job: Dictionary with id, prompt and output.
+            result: Result dictionary from the engine.
+
+        Returns:
+            dict: The record written.
+        """
+        record = {
+            'id': job['id'],
+            'prompt': job['prompt'],
+            'status': result['status'],
+            'error': result['error'],
+            'model': result['model'],
+            'latency': round(result['elapsed'], 3),
+            'input_tokens': result['usage'].get('input_tokens', 0),
+            'output_tokens': result['usage'].get('output_tokens', 0),
+            'cache_read_tokens': result['usage'].get('cache_read_tokens', 0),
+            'cache_write_tokens': result['usage'].get('cache_write_tokens', 0),
+            'cached': result['cached'],
+            'coalesced': result['coalesced'],
+            'output': job['output']
+        }
+        write_file.write(json.dumps(record) + '\n')
+        write_file.flush()
+
+        return record
+
+    '''
+    Execute()
+    Function: - Runs the batch described by the controller
+    '''
+    def Execute(self, CON, LOG):
+        """
+        Runs every prompt in CON.prompt (comma separated) over every item in CON.batch and writes the outputs and
+        manifest.jsonl into the CON.output directory.
+
+        Args:
+            CON: Controller object populated by mainstay.py.
+            LOG: Logger object for colored output.
+
+        Returns:
+            int: 0 if every item succeeded, -1 otherwise.
+        """
+        prompts = [prompt.strip() for prompt in CON.prompt.split(',') if prompt.strip() != '']
+        manifest = os.path.join(CON.output, 'manifest.jsonl')
+
+        try:
+            os.makedirs(CON.output, exist_ok=True)
+            items = self.LoadItems(CON.batch)
+            completed = self.LoadManifest(manifest)
+        except Exception as e:
+            print (LOG.colored('[x] Unable to load batch: ' + str(e), 'echoerror', bold=True))
+            return -1
+
+        jobs = []
+        stems = self.Stems(items)
+        for item in items:
+            for prompt in prompts:
+                if ((item['id'], prompt) in completed):
+                    continue
+                jobs.append({'id': item['id'], 'input': item['input'], 'url': item['url'], 'prompt': prompt,
+                             'output': os.path.join(CON.output, self.OutputName(stems[item['id']], prompt))})
+
+        print (LOG.colored('[*] Batch: ' + str(len(items)) + ' items x ' + str(len(prompts)) + ' prompts, ' +
+                           str(len(completed)) + ' already complete, ' + str(len(jobs)) + ' to run', 'echoinfo', bold=True))
+
+        failures = 0
+        done = 0
+        futures = {}
+
+        for job in jobs:
+            future = self.ENG.pool.submit(self.ENG.Run, input_text=job['input'], prompt=job['prompt'], ai=CON.ai,
+                                          model=CON.model, output=job['output'], url=job['url'], debug=CON.debug,
+                                          nocache=CON.nocache, refresh=CON.refresh, chunking=CON.chunking,
+                                          hedge=CON.hedge)
+            futures[future] = job
+
+        with open(manifest, 'a', encoding='utf-8') as write_file:
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {'status': 'error', 'error': str(e), 'elapsed': 0.0, 'usage': {}, 'cached': False, 'coalesced': False, 'model': CON.model}
+
+                record = self.Record(write_file, job, result)
+
+                done += 1
+                if (result['status'] == 'ok'):
+                    print ('[-] ' + str(done) + '/' + str(len(jobs)) + ' ' + job['id'] + ' ' + job['prompt'] + ' ok ' + str(record['latency']) + 's')
+                else:
+                    failures += 1
+                    print (LOG.colored('[x] ' + str(done) + '/' + str(len(jobs)) + ' ' + job['id'] + ' ' + job['prompt'] + ' ' + result['error'], 'echoerror', bold=True))
+
+        print (LOG.colored('\r\n[*] Batch complete: ' + str(len(jobs) - failures) + ' succeeded, ' + str(failures) + ' failed.  Manifest: ', 'echoinfo', bold=True) + LOG.colored(manifest, 'echolink', bold=True))
+
+        if (failures > 0):
+            return -1
+
+        return 0
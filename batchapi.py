@@ -0,0 +1,230 @@
+'''
+Mainstay v0.4 - Copyright 2025 James Slaughter,
+This file is part of Mainstay v0.4.
+
+Mainstay v0.4 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Mainstay v0.4 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Mainstay v0.4.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+"""
+batchapi.py - Provider Batch API submission for Mainstay v0.4
+
+This module sends a batch run through the OpenAI Batch API or the Anthropic Message Batches API instead of making
+one synchronous call per item.  The requests are built from the prompt files in promptdir, submitted as a single
+job, polled until the provider finishes, and the results are written out as one file per item and prompt with
+the same manifest as a synchronous batch.  The submitted job is recorded in batchapi.json in the output
+directory, so an interrupted run resumes polling the same job instead of submitting a new one.
+
+Classes:
+    batchapi: Builds, submits, polls and collects provider batch jobs.
+
+Copyright 2025 James Slaughter. Licensed under GPL v3 or later.
+"""
+
+#python imports
+import os
+import json
+import time
+
+#programmer generated imports
+from batch import batch
+
+'''
+batchapi
+Class: This class is responsible for running a batch through a provider's asynchronous Batch API
+'''
+class batchapi:
+    """
+    The batchapi class drives a provider batch job through an engine object.
+    """
+    '''
+    Constructor
+    '''
+    def __init__(self, ENG):
+        """
+        Initializes the batchapi class.
+
+        Args:
+            ENG: The engine holding the configuration and providers.
+        """
+        self.ENG = ENG
+        self.BATCH = batch(ENG)
+        self.pollseconds = int(ENG.config.get('batchpollseconds', 60))#seconds between status checks
+
+    '''
+    Build()
+    Function: - Builds the list of requests for the items not yet completed
+    '''
+    def Build(self, CON, prompts, manifest):
+        """
+        Builds one request per item and prompt that the manifest does not already record as complete.
+
+        Returns:
+            tuple: (requests, entries) - requests is a list of (custom_id, system_input, user_input) tuples and
+                   entries maps each custom_id to the item id, prompt, output path, url and cache key.
+        """
+        requests = []
+        entries = {}
+        systems = {}
+        provider = self.ENG.providers[CON.ai]
+
+        items = self.BATCH.LoadItems(CON.batch)
+        completed = self.BATCH.LoadManifest(manifest)
+
+        for prompt in prompts:
+            systems[prompt] = self.ENG.prompts.Get(prompt)
+
+        stems = self.BATCH.Stems(items)
+        for item in items:
+            for prompt in prompts:
+                if ((item['id'], prompt) in completed):
+                    continue
+                # custom_id is limited to 64 characters, so use a sequence number and keep the mapping
+                custom_id = 'mainstay-' + str(len(requests))
+                requests.append((custom_id, systems[prompt]['text'], item['input']))
+                entries[custom_id] = {'id': item['id'], 'prompt': prompt, 'url': item['url'],
+                                      'output': os.path.join(CON.output, self.BATCH.OutputName(stems[item['id']], prompt)),
+                                      'key': self.ENG.cache.Key(CON.ai, CON.model, provider.params, systems[prompt]['text'], item['input'], systems[prompt]['hash'])}
+
+        return requests, entries
+
+    '''
+    SaveState()
+    Function: - Records the submitted job so an interrupted run can resume it
+    '''
+    def SaveState(self, statefile, state):
+        temp = statefile + '.tmp'
+        with open(temp, 'w', encoding='utf-8') as write_file:
+            json.dump(state, write_file)
+        os.replace(temp, statefile)
+
+    '''
+    Collect()
+    Function: - Writes the results of a finished job to the output files and manifest
+    '''
+    def Collect(self, CON, LOG, apikey, state, manifest):
+        """
+        Downloads the results of a finished job, writes one output per item and appends each outcome to the
+        manifest.  Successful responses are also stored in the response cache.
+
+        Returns:
+            int: Number of requests that failed.
+        """
+        provider = self.ENG.providers[CON.ai]
+        results = provider.BatchResults(apikey, state['batchid'])
+        elapsed = time.time() - state['submitted']
+        failures = 0
+
+        with open(manifest, 'a', encoding='utf-8') as write_file:
+            for custom_id, entry in state['entries'].items():
+                result = {'status': 'error', 'error': 'No result returned by the provider', 'model': CON.model,
+                          'elapsed': elapsed, 'usage': {}, 'cached': False, 'coalesced': False}
+                outcome = results.get(custom_id, {})
+
+                if ('response' in outcome):
+                    try:
+                        self.ENG.WriteOutput(entry['output'], entry['url'], outcome['response'])
+                        self.ENG.search.Add(entry['output'], '\n'.join([outcome['response']['text']] + outcome['response']['citations']),
+                                            entry['url'], entry['prompt'], CON.model, CON.ai)
+                        self.ENG.cache.Put(entry['key'], outcome['response'])
+                        result['status'] = 'ok'
+                        result['error'] = ''
+                        result['usage'] = outcome['response']['usage']
+                    except Exception as e:
+                        result['error'] = 'Unable to complete task: ' + str(e)
+                elif ('error' in outcome):
+                    result['error'] = outcome['error']
+
+                self.BATCH.Record(write_file, entry, result)
+
+                if (result['status'] != 'ok'):
+                    failures += 1
+                    print (LOG.colored('[x] ' + entry['id'] + ' ' + entry['prompt'] + ' ' + result['error'], 'echoerror', bold=True))
+
+        return failures
+
+    '''
+    Execute()
+    Function: - Submits (or resumes) a provider batch job and waits for it to finish
+    '''
+    def Execute(self, CON, LOG):
+        """
+        Runs every prompt in CON.prompt (comma separated) over every item in CON.batch through the provider's
+        Batch API, writing the outputs and manifest.jsonl into the CON.output directory.
+
+        Args:
+            CON: Controller object populated by mainstay.py.
+            LOG: Logger object for colored output.
+
+        Returns:
+            int: 0 if every request succeeded, -1 otherwise.
+        """
+        provider = self.ENG.providers.get(CON.ai)
+        if ((provider is None) or (not hasattr(provider, 'SubmitBatch'))):
+            print (LOG.colored('[x] ' + CON.ai + ' does not offer a Batch API.  Use --batch without --batchapi instead.', 'echoerror', bold=True))
+            return -1
+
+        apikey = self.ENG.GetAPIKey(CON)
+        if (apikey == ''):
+            print (LOG.colored('[x] ' + self.ENG.vendors[CON.ai] + ' apikey value not input.  Please add one to /opt/mainstay/mainstay.conf', 'echoerror', bold=True))
+            return -1
+
+        if (CON.model == ''):
+            CON.model = self.ENG.GetDefaultModel(CON)
+        if (CON.model == ''):
+            print (LOG.colored('[x] No model specified and no default model configured for ' + CON.ai, 'echoerror', bold=True))
+            return -1
+
+        prompts = [prompt.strip() for prompt in CON.prompt.split(',') if prompt.strip() != '']
+        manifest = os.path.join(CON.output, 'manifest.jsonl')
+        statefile = os.path.join(CON.output, 'batchapi.json')
+        state = None
+
+        try:
+            os.makedirs(CON.output, exist_ok=True)
+            if (os.path.exists(statefile)):
+                with open(statefile, 'r', encoding='utf-8') as read_file:
+                    state = json.load(read_file)
+                if ((state['ai'] != CON.ai) or (state['model'] != CON.model)):
+                    print (LOG.colored('[x] ' + statefile + ' belongs to a ' + state['ai'] + '/' + state['model'] + ' job.  Finish it or remove the file.', 'echoerror', bold=True))
+                    return -1
+                print (LOG.colored('[*] Resuming batch job ' + state['batchid'], 'echoinfo', bold=True))
+            else:
+                requests, entries = self.Build(CON, prompts, manifest)
+                if (len(requests) == 0):
+                    print (LOG.colored('[*] Nothing to submit, the manifest records every item as complete.', 'echoinfo', bold=True))
+                    return 0
+                batchid = provider.SubmitBatch(CON, LOG, apikey, requests)
+                state = {'batchid': batchid, 'ai': CON.ai, 'model': CON.model, 'submitted': time.time(), 'entries': entries}
+                self.SaveState(statefile, state)
+                print (LOG.colored('[*] Submitted batch job ' + batchid + ' with ' + str(len(requests)) + ' requests', 'echoinfo', bold=True))
+
+            while True:
+                status = provider.BatchStatus(apikey, state['batchid'])
+                print ('[-] ' + time.strftime('%H:%M:%S') + ' batch ' + state['batchid'] + ' status: ' + str(status['status']))
+                if (status['done'] == True):
+                    break
+                time.sleep(self.pollseconds)
+
+            failures = self.Collect(CON, LOG, apikey, state, manifest)
+            os.remove(statefile)
+        except Exception as e:
+            print (LOG.colored('[x] Unable to complete batch job: ' + str(e), 'echoerror', bold=True))
+            return -1
+
+        print (LOG.colored('\r\n[*] Batch job complete: ' + str(len(state['entries']) - failures) + ' succeeded, ' + str(failures) + ' failed.  Manifest: ', 'echoinfo', bold=True) + LOG.colored(manifest, 'echolink', bold=True))
+
+        if (failures > 0):
+            return -1
+
+        return 0
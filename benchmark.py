@@ -0,0 +1,466 @@
+#! /usr/bin/env python3
+'''
+Mainstay v0.4 - Copyright 2025 James Slaughter,
+This file is part of Mainstay v0.4.
+
+Mainstay v0.4 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Mainstay v0.4 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Mainstay v0.4.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+"""
+benchmark.py - Offline benchmark of Mainstay's own overhead for Mainstay v0.4
+
+This script measures the time Mainstay spends apart from waiting on the AI provider.  The providers are replaced by
+benchmock.py, which answers in the OpenAI, Anthropic and Perplexity wire formats with a configurable latency, token
+rate and error rate, and reports how long it spent on each request.  That time is subtracted from each end-to-end
+measurement to give Mainstay's overhead.  A temporary mainstay.conf, prompt directory, cache and log root are used,
+so nothing under /opt/mainstay is read or written.
+
+Measured:
+    startup:       mainstay.py --listprompts, against a bare Python interpreter.
+    confread:      mainstay.ConfRead(), including loading the prompt collection.
+    prompts:       Loading every prompt into a new promptstore, and reading them again from a loaded one.
+    output:        Writing a response with engine.WriteOutput() and rendering it with rich.
+    execute:       engine.Execute() for each AI, with and without streaming.
+    cli:           mainstay.py end to end for each AI.
+    daemon:        The same commands forwarded to a running mainstay.py --daemon.
+    neomainstay:   Requests per second through the web interface's POST / with concurrent clients.
+
+A benchmark whose dependencies are not installed is reported with an error instead of timings.
+
+Usage: ./benchmark.py [--runs N] [--latency S] [--tokenrate N] [--tokens N] [--errorrate F] [--json] [--save FILE]
+
+Copyright 2025 James Slaughter. Licensed under GPL v3 or later.
+"""
+
+#python imports
+import io
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import platform
+import statistics
+import contextlib
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+#programmer generated imports
+from benchmock import mockserver
+from benchstartup import HERE, TimeCommand
+
+AIS = ['chatgpt', 'claude', 'perplexity']
+MODELS = {'openai': 'gpt-4o-mini', 'anthropic': 'claude-3-5-haiku-latest', 'perplexity': 'sonar'}
+SAMPLE = 'Summarize the following incident notes. ' + ' '.join('Host %d beaconed to 203.0.113.%d over TLS.' % (number, number % 250) for number in range(60))
+
+'''
+Configure()
+Function: - Writes a mainstay.conf that points every provider at the stand-in server
+'''
+def Configure(workdir, baseurls):
+    """
+    Creates the prompt directory, log root and caches under workdir and writes mainstay.conf there.
+
+    Returns:
+        dict: The configuration written.
+    """
+    promptdir = os.path.join(workdir, 'prompts')
+    shutil.copytree(os.path.join(HERE, 'prompts'), promptdir)
+    os.makedirs(os.path.join(workdir, 'logs'))
+
+    config = {'logger': 'false', 'logroot': os.path.join(workdir, 'logs'), 'promptdir': promptdir, 'defaultai': 'chatgpt',
+              'defaultmodels': [{vendor: model} for vendor, model in MODELS.items()],
+              'apikeys': [{vendor: 'benchmock'} for vendor in MODELS], 'baseurls': baseurls,
+              'cachedir': os.path.join(workdir, 'cache'), 'urlcachedir': os.path.join(workdir, 'urlcache'),
+              'statedir': os.path.join(workdir, 'state'), 'jobdb': os.path.join(workdir, 'jobs.db'), 'searchdb': os.path.join(workdir, 'outputs.db'),
+              'daemonsocket': os.path.join(workdir, 'mainstay.sock')}
+    with open(os.path.join(workdir, 'mainstay.conf'), 'w') as write_file:
+        json.dump(config, write_file, indent=2)
+
+    return config
+
+'''
+Timed()
+Function: - Calls a function several times and returns the wall clock times in milliseconds
+'''
+def Timed(function, runs):
+    times = []
+
+    for run in range(runs):
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1000)
+
+    return times
+
+'''
+Summarize()
+Function: - Reduces a list of timings to min, median and max, to the microsecond
+'''
+def Summarize(times):
+    return {'min_ms': round(min(times), 3), 'median_ms': round(statistics.median(times), 3), 'max_ms': round(max(times), 3)}
+
+'''
+Quiet()
+Function: - Captures what a benchmarked call prints
+'''
+def Quiet(buffer=None):
+    return contextlib.redirect_stdout(buffer if (buffer is not None) else io.StringIO())
+
+'''
+LastError()
+Function: - Returns the last error line Mainstay printed, without its colors
+'''
+def LastError(printed):
+    lines = [re.sub(r'\x1b\[[0-9;]*m', '', line).strip() for line in printed.splitlines() if ('[x]' in line)]
+
+    return lines[-1] if (len(lines) > 0) else 'no error printed'
+
+'''
+Overhead()
+Function: - Summarizes end-to-end timings and subtracts the time the stand-in server spent on them
+'''
+def Overhead(times, stats):
+    """
+    Args:
+        times: End-to-end timings in milliseconds.
+        stats: The stand-in server's counters for the same requests.
+
+    Returns:
+        dict: Summarize() of times plus the server's mean time per request and the mean overhead above it.
+    """
+    summary = Summarize(times)
+    requests = sum(counter['requests'] for counter in stats.values())
+    seconds = sum(counter['seconds'] for counter in stats.values())
+    summary['requests'] = requests
+    summary['provider_errors'] = sum(counter['errors'] for counter in stats.values())
+    if (requests > 0):
+        summary['server_mean_ms'] = round(seconds * 1000 / requests, 1)
+        summary['overhead_mean_ms'] = round((sum(times) - seconds * 1000) / len(times), 1)
+
+    return summary
+
+'''
+BenchStartup()
+Function: - Measures CLI startup for a command that makes no AI call
+'''
+def BenchStartup(runs):
+    baseline = Summarize(TimeCommand([sys.executable, '-c', 'pass'], runs))
+    listprompts = Summarize(TimeCommand([sys.executable, 'mainstay.py', '--listprompts', '--ai', 'chatgpt'], runs))
+    listprompts['over_interpreter_ms'] = round(listprompts['median_ms'] - baseline['median_ms'], 1)
+
+    return {'python -c pass': baseline, '--listprompts': listprompts}
+
+'''
+BenchConfRead()
+Function: - Measures reading mainstay.conf and loading the prompt collection
+'''
+def BenchConfRead(runs):
+    import mainstay
+    from logger import logger
+    from controller import controller
+
+    mainstay.LOG = logger()
+    mainstay.CON = controller()
+    if (mainstay.ConfRead() != 0):
+        return {'error': 'ConfRead() could not read ' + os.environ['MAINSTAY_CONF']}
+
+    return Summarize(Timed(mainstay.ConfRead, runs))
+
+'''
+BenchPrompts()
+Function: - Measures loading prompts cold and reading them from a loaded store
+'''
+def BenchPrompts(runs, promptdir):
+    from promptstore import promptstore
+
+    def Cold():
+        store = promptstore(promptdir)
+        for name in store.List():
+            store.Get(name)
+
+    store = promptstore(promptdir)
+    names = store.List()
+
+    def Warm():
+        for name in names:
+            store.Get(name)
+
+    return {'prompts': len(names), 'cold': Summarize(Timed(Cold, runs)), 'warm': Summarize(Timed(Warm, runs))}
+
+'''
+BenchOutput()
+Function: - Measures writing a response to disk and rendering it to the terminal
+'''
+def BenchOutput(runs, workdir, tokens):
+    from engine import engine
+
+    ENG = engine({'cachedir': os.path.join(workdir, 'cache'), 'statedir': os.path.join(workdir, 'state')})
+    text = '# Summary\n\n' + ' '.join('lorem' if (number % 2 == 0) else 'ipsum' for number in range(tokens)) + '\n\n- one\n- two\n'
+    response = {'text': text, 'citations': ['https://example.com/benchmock']}
+    output = os.path.join(workdir, 'logs', 'output.md')
+    results = {'write': Summarize(Timed(lambda: ENG.WriteOutput(output, '', response), runs))}
+
+    try:
+        from rich.console import Console
+        from rich.markdown import Markdown
+    except ImportError as e:
+        results['render'] = {'error': str(e)}
+        return results
+
+    console = Console(file=io.StringIO(), width=120)
+    results['render'] = Summarize(Timed(lambda: console.print(Markdown(text)), runs))
+
+    return results
+
+'''
+BenchExecute()
+Function: - Measures engine.Execute() against the stand-in server for each AI
+'''
+def BenchExecute(runs, config, mock):
+    from engine import engine
+    from logger import logger
+
+    LOG = logger()
+    ENG = engine(config)
+    results = {}
+
+    for ai in AIS:
+        for stream in [False, True]:
+            name = ai + (' --stream' if (stream == True) else '')
+            times = []
+            failed = ''
+
+            # The first call loads the provider and opens its connection, so it is reported on its own
+            for run in range(runs + 1):
+                CON = ENG.NewController(SAMPLE, 'summarize', ai, output=os.path.join(config['logroot'], ai + '.md'), nocache=True)
+                CON.stream = stream
+                if (run == 1):
+                    mock.Stats(reset=True)
+                printed = io.StringIO()
+                start = time.perf_counter()
+                with Quiet(printed):
+                    ret = ENG.Execute(CON, LOG)
+                elapsed = (time.perf_counter() - start) * 1000
+                if (ret != 0):
+                    failed = LastError(printed.getvalue())
+                    break
+                if (run == 0):
+                    first = elapsed
+                else:
+                    times.append(elapsed)
+
+            if (failed != ''):
+                results[name] = {'error': 'Execute() failed: ' + failed}
+                continue
+
+            results[name] = Overhead(times, mock.Stats(reset=True))
+            results[name]['first_ms'] = round(first, 1)
+
+    return results
+
+'''
+TimeCLI()
+Function: - Runs mainstay.py with piped input several times and returns the wall clock times in milliseconds
+'''
+def TimeCLI(command, runs):
+    times = []
+
+    for run in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=HERE, input=SAMPLE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, text=True)
+        times.append((time.perf_counter() - start) * 1000)
+
+    return times
+
+'''
+BenchCLI()
+Function: - Measures mainstay.py end to end against the stand-in server for each AI
+'''
+def BenchCLI(runs, config, mock, daemon=False):
+    results = {}
+
+    for ai in AIS:
+        output = os.path.join(config['logroot'], 'cli-' + ai + '.md')
+        # The input is piped in, as the CLI is normally used
+        command = [sys.executable, 'mainstay.py', '--prompt', 'summarize', '--ai', ai, '--no-cache', '--output', output]
+        if (daemon == False):
+            command.append('--no-daemon')
+        check = subprocess.run(command, cwd=HERE, input=SAMPLE, capture_output=True, text=True)
+        if ((check.returncode != 0) or (not os.path.exists(output))):
+            results[ai] = {'error': 'mainstay.py failed: ' + LastError(check.stdout + check.stderr)}
+            continue
+
+        mock.Stats(reset=True)
+        results[ai] = Overhead(TimeCLI(command, runs), mock.Stats(reset=True))
+
+    return results
+
+'''
+BenchDaemon()
+Function: - Measures mainstay.py end to end with its commands forwarded to a running daemon
+'''
+def BenchDaemon(runs, config, mock):
+    """
+    Starts mainstay.py --daemon on the benchmark configuration and runs the BenchCLI() commands through it, so the
+    results can be compared with BenchCLI() to see what the daemon saves per command.
+    """
+    process = subprocess.Popen([sys.executable, 'mainstay.py', '--daemon'], cwd=HERE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 30
+        while (not os.path.exists(config['daemonsocket'])):
+            if (process.poll() is not None):
+                return {'error': 'mainstay.py --daemon exited with ' + str(process.returncode)}
+            if (time.monotonic() > deadline):
+                return {'error': 'mainstay.py --daemon did not start listening within 30s'}
+            time.sleep(0.05)
+        return BenchCLI(runs, config, mock, daemon=True)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+'''
+BenchNeomainstay()
+Function: - Measures the web interface's request throughput with concurrent clients
+'''
+def BenchNeomainstay(requests, concurrency, config, mock):
+    """
+    Posts requests form submissions of one prompt each to POST / from concurrency threads.  Every submission has
+    distinct input so each one reaches the stand-in server.
+
+    Returns:
+        dict: requests, concurrency, requests_per_second, latency summary, failures and the stand-in server's
+              counters.
+    """
+    try:
+        with Quiet():
+            import neomainstay
+    except ImportError as e:
+        return {'error': str(e)}
+
+    app = neomainstay.app
+
+    def Post(number):
+        form = {'pastedInput': SAMPLE + ' Request ' + str(number) + '.', 'prompt': 'summarize', 'ai': AIS[number % len(AIS)],
+                'model': '', 'output': os.path.join(config['logroot'], 'web.md'), 'filename': 'web' + str(number) + '.md'}
+        start = time.perf_counter()
+        response = app.test_client().post('/', data=form)
+        elapsed = (time.perf_counter() - start) * 1000
+        ok = ((response.status_code == 200) and (response.get_json().get('has_errors') == False))
+
+        return elapsed, ok
+
+    with Quiet():
+        Post(0)#warm up the providers and connections
+        mock.Stats(reset=True)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(Post, range(1, requests + 1)))
+        wall = time.perf_counter() - start
+
+    times = [elapsed for elapsed, ok in outcomes]
+    results = {'requests': requests, 'concurrency': concurrency, 'requests_per_second': round(requests / wall, 1),
+               'latency': Summarize(times), 'failures': sum(1 for elapsed, ok in outcomes if (ok == False)),
+               'server': mock.Stats(reset=True)}
+    results['latency']['p95_ms'] = round(sorted(times)[max(int(len(times) * 0.95) - 1, 0)], 1)
+
+    return results
+
+'''
+Attempt()
+Function: - Runs one benchmark and records its exception instead of stopping
+'''
+def Attempt(function, *args):
+    try:
+        return function(*args)
+    except Exception as e:
+        return {'error': type(e).__name__ + ': ' + str(e)}
+
+'''
+Report()
+Function: - Prints the results for a person to read
+'''
+def Report(results, indent='[-] '):
+    for name, value in results.items():
+        if (isinstance(value, dict) and ('median_ms' in value)):
+            line = indent + name.ljust(22) + ' median ' + str(value['median_ms']) + ' ms  (min ' + str(value['min_ms']) + ', max ' + str(value['max_ms']) + ')'
+            for extra in ['over_interpreter_ms', 'overhead_mean_ms', 'first_ms', 'requests_per_second']:
+                if (extra in value):
+                    line += '  ' + extra + ' ' + str(value[extra])
+            print (line)
+        elif (isinstance(value, dict) and ('error' in value)):
+            print (indent + name.ljust(22) + ' skipped: ' + value['error'])
+        elif (isinstance(value, dict)):
+            print (indent + name)
+            Report(value, '    ' + indent)
+        else:
+            print (indent + name.ljust(22) + ' ' + str(value))
+
+'''
+This is the mainline section of the program
+'''
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Measure Mainstay\'s overhead against stand-in provider APIs.')
+    parser.add_argument('--runs', type=int, default=10, help='Runs per measurement (default 10)')
+    parser.add_argument('--latency', type=float, default=0.05, help='Stand-in seconds before the first token (default 0.05)')
+    parser.add_argument('--tokenrate', type=float, default=0, help='Stand-in tokens per second, 0 for no delay (default 0)')
+    parser.add_argument('--tokens', type=int, default=200, help='Tokens per stand-in response (default 200)')
+    parser.add_argument('--errorrate', type=float, default=0.0, help='Share of stand-in requests answered with 429 (default 0)')
+    parser.add_argument('--requests', type=int, default=50, help='neomainstay requests for the throughput test (default 50)')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent neomainstay clients (default 8)')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    parser.add_argument('--save', help='Append the results as one JSON line to this file, to track them over time')
+    args = parser.parse_args()
+
+    MOCK = mockserver(latency=args.latency, tokenrate=args.tokenrate, tokens=args.tokens, errorrate=args.errorrate)
+    workdir = tempfile.mkdtemp(prefix='mainstay-benchmark-')
+    config = Configure(workdir, MOCK.Start())
+    os.environ['MAINSTAY_CONF'] = os.path.join(workdir, 'mainstay.conf')
+    sys.path.insert(0, HERE)
+
+    results = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'python': sys.version.split()[0], 'platform': platform.platform(),
+               'commit': subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, capture_output=True, text=True).stdout.strip(),
+               'settings': {'runs': args.runs, 'latency': args.latency, 'tokenrate': args.tokenrate, 'tokens': args.tokens,
+                            'errorrate': args.errorrate},
+               'benchmarks': {}}
+
+    try:
+        benchmarks = results['benchmarks']
+        benchmarks['startup'] = Attempt(BenchStartup, args.runs)
+        benchmarks['confread'] = Attempt(BenchConfRead, args.runs)
+        benchmarks['prompts'] = Attempt(BenchPrompts, args.runs, config['promptdir'])
+        benchmarks['output'] = Attempt(BenchOutput, args.runs, workdir, args.tokens)
+        benchmarks['execute'] = Attempt(BenchExecute, args.runs, config, MOCK)
+        benchmarks['cli'] = Attempt(BenchCLI, args.runs, config, MOCK)
+        benchmarks['daemon'] = Attempt(BenchDaemon, args.runs, config, MOCK)
+        benchmarks['neomainstay'] = Attempt(BenchNeomainstay, args.requests, args.concurrency, config, MOCK)
+    finally:
+        MOCK.Stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if (args.save):
+        with open(args.save, 'a') as write_file:
+            write_file.write(json.dumps(results) + '\n')
+
+    if (args.json == True):
+        print (json.dumps(results, indent=2))
+    else:
+        print ('[*] Python ' + results['python'] + ', ' + str(args.runs) + ' runs, stand-in latency ' + str(args.latency) + ' s')
+        Report(results['benchmarks'])
+        if (args.save):
+            print ('[*] Results appended to ' + args.save)
@@ -0,0 +1,608 @@
+#! /usr/bin/env python3
+'''
+Mainstay v0.4 - Copyright 2025 James Slaughter,
+This file is part of Mainstay v0.4.
+
+Mainstay v0.4 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Mainstay v0.4 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Mainstay v0.4.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+"""
+benchmock.py - Local stand-in for the provider HTTP APIs for Mainstay v0.4
+
+This module serves the parts of the OpenAI, Anthropic and Perplexity HTTP APIs that Mainstay calls, so the
+benchmark and manual tests can run without network access or API keys.  Chat completions and messages are
+answered with and without streaming, in the wire format each provider's SDK expects.  The OpenAI Files and
+Batch APIs and the Anthropic Message Batches API are served too, so --batchapi runs can be submitted, polled and
+collected offline; a job ends batchseconds after it is submitted.  The time to the first token, the token rate,
+the response length and the share of requests rejected with an error are configurable.
+The server records how long it spent on each request, so a benchmark can subtract it and report Mainstay's own
+overhead.
+
+Point mainstay.conf at it with:
+    "baseurls": {"openai": "http://127.0.0.1:8700/v1", "anthropic": "http://127.0.0.1:8700", "perplexity": "http://127.0.0.1:8700"}
+
+Usage: ./benchmock.py [--port 8700] [--latency 0.5] [--tokenrate 100] [--tokens 200] [--errorrate 0] [--batchseconds 5]
+
+Classes:
+    mockhandler: Answers one HTTP request in the format of the provider the path belongs to.
+    mockserver: Runs the handler on a background thread and keeps the request counters, files and batch jobs.
+
+Copyright 2025 James Slaughter. Licensed under GPL v3 or later.
+"""
+
+#python imports
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+'''
+mockhandler
+Class: This class is responsible for answering one request the way the provider would
+'''
+class mockhandler(BaseHTTPRequestHandler):
+    """
+    The mockhandler class routes /v1/chat/completions, /v1/files and /v1/batches to OpenAI, /v1/messages and
+    /v1/messages/batches to Anthropic and /chat/completions to Perplexity.  Its settings come from the mockserver
+    it belongs to.
+    """
+    protocol_version = 'HTTP/1.1'#keep connections alive, as the real APIs do
+
+    def log_message(self, format, *args):
+        pass
+
+    '''
+    Send()
+    Function: - Sends a complete JSON response
+    '''
+    def Send(self, status, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    '''
+    StartEvents()
+    Function: - Starts a chunked text/event-stream response
+    '''
+    def StartEvents(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+    '''
+    Event()
+    Function: - Writes one Server-Sent Event as an HTTP chunk
+    '''
+    def Event(self, data, event=None):
+        text = ''
+        if (event is not None):
+            text += 'event: ' + event + '\n'
+        text += 'data: ' + (data if isinstance(data, str) else json.dumps(data)) + '\n\n'
+        payload = text.encode('utf-8')
+        self.wfile.write(('%x\r\n' % len(payload)).encode('ascii') + payload + b'\r\n')
+        self.wfile.flush()
+
+    '''
+    EndEvents()
+    Function: - Ends a chunked response
+    '''
+    def EndEvents(self):
+        self.wfile.write(b'0\r\n\r\n')
+        self.wfile.flush()
+
+    '''
+    Words()
+    Function: - Returns the pieces of the response text, one per token
+    '''
+    def Words(self):
+        return ['lorem ' if (number % 2 == 0) else 'ipsum ' for number in range(self.server.mock.tokens)]
+
+    '''
+    Pace()
+    Function: - Waits the time between two tokens
+    '''
+    def Pace(self):
+        if (self.server.mock.tokenrate > 0):
+            time.sleep(1.0 / self.server.mock.tokenrate)
+
+    '''
+    InputTokens()
+    Function: - Estimates the input tokens of a request at four characters per token
+    '''
+    def InputTokens(self, request):
+        return max(len(json.dumps(request.get('messages', []))) + len(json.dumps(request.get('system', ''))), 4) // 4
+
+    '''
+    Rejected()
+    Function: - Returns True if this request should be answered with errorstatus
+    '''
+    def Rejected(self):
+        return (random.random() < self.server.mock.errorrate)
+
+    '''
+    Completion()
+    Function: - Returns a complete OpenAI or Perplexity chat completion body
+    '''
+    def Completion(self, request, provider):
+        words = self.Words()
+        usage = {'prompt_tokens': self.InputTokens(request), 'completion_tokens': len(words),
+                 'total_tokens': self.InputTokens(request) + len(words), 'prompt_tokens_details': {'cached_tokens': 0}}
+        body = {'id': 'chatcmpl-benchmock', 'object': 'chat.completion', 'created': int(time.time()), 'model': request.get('model', 'mock-model'),
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': ''.join(words)}, 'finish_reason': 'stop'}],
+                'usage': usage}
+        if (provider == 'perplexity'):
+            body['citations'] = ['https://example.com/benchmock']
+
+        return body
+
+    '''
+    Message()
+    Function: - Returns a complete Anthropic message body
+    '''
+    def Message(self, request):
+        words = self.Words()
+        usage = {'input_tokens': self.InputTokens(request), 'output_tokens': len(words),
+                 'cache_creation_input_tokens': 0, 'cache_read_input_tokens': 0}
+
+        return {'id': 'msg_benchmock', 'type': 'message', 'role': 'assistant', 'model': request.get('model', 'mock-model'),
+                'content': [{'type': 'text', 'text': ''.join(words)}], 'stop_reason': 'end_turn',
+                'stop_sequence': None, 'usage': usage}
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        mock = self.server.mock
+        parts = self.path.split('?')[0].strip('/').split('/')
+
+        if (parts[-1] == 'models'):
+            self.Send(200, {'object': 'list', 'data': [{'id': 'mock-model', 'object': 'model', 'created': 0, 'owned_by': 'benchmock'}]})
+        elif ((parts[:2] == ['v1', 'batches']) and (len(parts) == 3) and (mock.Job(parts[2]) is not None)):
+            self.Send(200, self.BatchObject(mock.Job(parts[2])))
+        elif ((parts[:2] == ['v1', 'files']) and (len(parts) == 4) and (parts[3] == 'content') and (parts[2] in mock.files)):
+            self.SendData(mock.files[parts[2]]['data'])
+        elif ((parts[:3] == ['v1', 'messages', 'batches']) and (len(parts) >= 4) and (mock.Job(parts[3]) is not None)):
+            job = mock.Job(parts[3])
+            if (len(parts) == 4):
+                self.Send(200, self.MessageBatchObject(job))
+            elif ((parts[4] == 'results') and (job['ended'] == True)):
+                self.SendData(mock.files[job['output']]['data'] if (job['output'] is not None) else b'')
+            else:
+                self.Send(404, {'type': 'error', 'error': {'type': 'not_found_error', 'message': 'Results not available yet'}})
+        else:
+            self.Send(404, {'error': {'type': 'not_found_error', 'message': 'Unknown path ' + self.path}})
+
+    '''
+    SendData()
+    Function: - Sends a file as it was stored
+    '''
+    def SendData(self, data):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/binary')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        start = time.perf_counter()
+        mock = self.server.mock
+        length = int(self.headers.get('Content-Length', 0))
+        data = self.rfile.read(length)
+        path = self.path.split('?')[0].rstrip('/')
+
+        if (path.endswith('/v1/files')):
+            self.CreateFile(data)
+            mock.Record('openai', time.perf_counter() - start)
+            return
+
+        try:
+            request = json.loads(data or b'{}')
+        except ValueError:
+            request = {}
+
+        if (path.endswith('/v1/batches')):
+            self.CreateBatch(request)
+            mock.Record('openai', time.perf_counter() - start)
+            return
+        elif (path.endswith('/v1/messages/batches')):
+            self.CreateMessageBatch(request)
+            mock.Record('anthropic', time.perf_counter() - start)
+            return
+        elif (path.endswith('/v1/messages')):
+            provider = 'anthropic'
+        elif (path.endswith('/chat/completions')):
+            provider = 'openai' if path.endswith('/v1/chat/completions') else 'perplexity'
+        else:
+            self.Send(404, {'error': {'type': 'not_found_error', 'message': 'Unknown path ' + self.path}})
+            return
+
+        if (self.Rejected() == True):
+            status = mock.errorstatus
+            self.Send(status, {'type': 'error', 'error': {'type': 'rate_limit_error' if (status == 429) else 'api_error', 'message': 'benchmock rejected the request'}},
+                      {'Retry-After': '0'} if (status == 429) else None)
+            mock.Record(provider, time.perf_counter() - start, error=True)
+            return
+
+        time.sleep(mock.latency)
+        stream = (request.get('stream') == True)
+
+        if (provider == 'anthropic'):
+            self.Anthropic(request, stream)
+        else:
+            self.OpenAI(request, stream, provider)
+
+        mock.Record(provider, time.perf_counter() - start)
+
+    '''
+    OpenAI()
+    Function: - Answers an OpenAI or Perplexity chat completion
+    '''
+    def OpenAI(self, request, stream, provider):
+        words = self.Words()
+        model = request.get('model', 'mock-model')
+        usage = self.Completion(request, provider)['usage']
+        extra = {'citations': ['https://example.com/benchmock']} if (provider == 'perplexity') else {}
+
+        if (stream == False):
+            for word in words:
+                self.Pace()
+            self.Send(200, self.Completion(request, provider))
+            return
+
+        self.StartEvents()
+        for word in words:
+            chunk = {'id': 'chatcmpl-benchmock', 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': model,
+                     'choices': [{'index': 0, 'delta': {'content': word}, 'finish_reason': None}]}
+            chunk.update(extra)
+            self.Event(chunk)
+            self.Pace()
+        final = {'id': 'chatcmpl-benchmock', 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': model,
+                 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]}
+        final.update(extra)
+        if (provider == 'perplexity'):
+            final['usage'] = usage
+        self.Event(final)
+        if (provider == 'openai'):
+            self.Event({'id': 'chatcmpl-benchmock', 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': model,
+                        'choices': [], 'usage': usage})
+        self.Event('[DONE]')
+        self.EndEvents()
+
+    '''
+    Anthropic()
+    Function: - Answers an Anthropic message
+    '''
+    def Anthropic(self, request, stream):
+        words = self.Words()
+        model = request.get('model', 'mock-model')
+        usage = self.Message(request)['usage']
+
+        if (stream == False):
+            for word in words:
+                self.Pace()
+            self.Send(200, self.Message(request))
+            return
+
+        self.StartEvents()
+        self.Event({'type': 'message_start', 'message': {'id': 'msg_benchmock', 'type': 'message', 'role': 'assistant', 'model': model,
+                    'content': [], 'stop_reason': None, 'stop_sequence': None, 'usage': dict(usage, output_tokens=1)}}, 'message_start')
+        self.Event({'type': 'content_block_start', 'index': 0, 'content_block': {'type': 'text', 'text': ''}}, 'content_block_start')
+        for word in words:
+            self.Event({'type': 'content_block_delta', 'index': 0, 'delta': {'type': 'text_delta', 'text': word}}, 'content_block_delta')
+            self.Pace()
+        self.Event({'type': 'content_block_stop', 'index': 0}, 'content_block_stop')
+        self.Event({'type': 'message_delta', 'delta': {'stop_reason': 'end_turn', 'stop_sequence': None},
+                    'usage': {'output_tokens': len(words)}}, 'message_delta')
+        self.Event({'type': 'message_stop'}, 'message_stop')
+        self.EndEvents()
+
+    '''
+    CreateFile()
+    Function: - Stores a file uploaded to the OpenAI Files API
+    '''
+    def CreateFile(self, data):
+        # The upload is multipart/form-data, which the email parser reads once it has the Content-Type header
+        form = BytesParser().parsebytes(b'Content-Type: ' + self.headers.get('Content-Type', '').encode('latin-1') + b'\r\n\r\n' + data)
+        upload = None
+        purpose = ''
+        for part in form.get_payload() if form.is_multipart() else []:
+            if (part.get_param('name', header='content-disposition') == 'file'):
+                upload = part
+            elif (part.get_param('name', header='content-disposition') == 'purpose'):
+                purpose = part.get_payload(decode=True).decode('utf-8')
+
+        if (upload is None):
+            self.Send(400, {'error': {'type': 'invalid_request_error', 'message': 'No file in the upload'}})
+            return
+
+        fileobject = self.server.mock.AddFile(upload.get_payload(decode=True), upload.get_filename() or 'upload', purpose)
+        self.Send(200, self.FileObject(fileobject))
+
+    '''
+    FileObject()
+    Function: - Returns the OpenAI description of a stored file
+    '''
+    def FileObject(self, fileobject):
+        return {'id': fileobject['id'], 'object': 'file', 'bytes': len(fileobject['data']), 'created_at': int(fileobject['created']),
+                'filename': fileobject['filename'], 'purpose': fileobject['purpose'], 'status': 'processed'}
+
+    '''
+    CreateBatch()
+    Function: - Starts an OpenAI Batch API job over an uploaded file of chat completion requests
+    '''
+    def CreateBatch(self, request):
+        mock = self.server.mock
+        upload = mock.files.get(request.get('input_file_id', ''))
+        if (upload is None):
+            self.Send(400, {'error': {'type': 'invalid_request_error', 'message': 'Unknown input_file_id'}})
+            return
+
+        output = []
+        errors = []
+        lines = [json.loads(line) for line in upload['data'].decode('utf-8').splitlines() if (line.strip() != '')]
+        for number, line in enumerate(lines):
+            if (self.Rejected() == True):
+                errors.append({'id': 'batch_req_' + str(number), 'custom_id': line['custom_id'], 'error': None,
+                               'response': {'status_code': mock.errorstatus, 'request_id': 'req_' + str(number),
+                                            'body': {'error': {'type': 'api_error', 'message': 'benchmock rejected the request'}}}})
+            else:
+                output.append({'id': 'batch_req_' + str(number), 'custom_id': line['custom_id'], 'error': None,
+                               'response': {'status_code': 200, 'request_id': 'req_' + str(number), 'body': self.Completion(line['body'], 'openai')}})
+
+        job = mock.AddJob('batch_', len(lines), output, errors)
+        job.update({'endpoint': request.get('endpoint', '/v1/chat/completions'), 'input_file_id': upload['id'],
+                    'completion_window': request.get('completion_window', '24h')})
+        self.Send(200, self.BatchObject(job))
+
+    '''
+    BatchObject()
+    Function: - Returns the OpenAI description of a batch job
+    '''
+    def BatchObject(self, job):
+        ended = (job['ended'] == True)
+        return {'id': job['id'], 'object': 'batch', 'endpoint': job['endpoint'], 'input_file_id': job['input_file_id'],
+                'completion_window': job['completion_window'], 'status': 'completed' if (ended == True) else 'in_progress',
+                'created_at': int(job['created']), 'output_file_id': job['output'] if (ended == True) else None,
+                'error_file_id': job['errors'] if (ended == True) else None,
+                'request_counts': {'total': job['total'], 'completed': job['succeeded'] if (ended == True) else 0,
+                                   'failed': job['failed'] if (ended == True) else 0}}
+
+    '''
+    CreateMessageBatch()
+    Function: - Starts an Anthropic Message Batches job
+    '''
+    def CreateMessageBatch(self, request):
+        mock = self.server.mock
+        output = []
+        entries = request.get('requests', [])
+        for entry in entries:
+            if (self.Rejected() == True):
+                output.append({'custom_id': entry['custom_id'], 'result': {'type': 'errored', 'error': {'type': 'error',
+                               'error': {'type': 'api_error', 'message': 'benchmock rejected the request'}}}})
+            else:
+                output.append({'custom_id': entry['custom_id'], 'result': {'type': 'succeeded', 'message': self.Message(entry.get('params', {}))}})
+
+        job = mock.AddJob('msgbatch_', len(entries), [line for line in output if (line['result']['type'] == 'succeeded')],
+                          [line for line in output if (line['result']['type'] != 'succeeded')], together=True)
+        self.Send(200, self.MessageBatchObject(job))
+
+    '''
+    MessageBatchObject()
+    Function: - Returns the Anthropic description of a message batch
+    '''
+    def MessageBatchObject(self, job):
+        ended = (job['ended'] == True)
+        created = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(job['created']))
+        base = 'http://' + self.headers.get('Host', '127.0.0.1:' + str(self.server.mock.port))
+        return {'id': job['id'], 'type': 'message_batch', 'processing_status': 'ended' if (ended == True) else 'in_progress',
+                'request_counts': {'processing': 0 if (ended == True) else job['total'], 'succeeded': job['succeeded'] if (ended == True) else 0,
+                                   'errored': job['failed'] if (ended == True) else 0, 'canceled': 0, 'expired': 0},
+                'created_at': created, 'expires_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(job['created'] + 86400)),
+                'ended_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(job['created'] + self.server.mock.batchseconds)) if (ended == True) else None,
+                'cancel_initiated_at': None, 'archived_at': None,
+                'results_url': base + '/v1/messages/batches/' + job['id'] + '/results' if (ended == True) else None}
+
+'''
+mockserver
+Class: This class is responsible for running the stand-in provider API on a background thread
+'''
+class mockserver:
+    """
+    The mockserver class owns the HTTP server and the per-provider request counters.
+    """
+    '''
+    Constructor
+    '''
+    def __init__(self, port=0, latency=0.0, tokenrate=0, tokens=50, errorrate=0.0, errorstatus=429, batchseconds=0.0):
+        """
+        Initializes the server.  Nothing listens until Start() is called.
+
+        Args:
+            port: Port to listen on, 0 for any free port.
+            latency: Seconds before the first token.
+            tokenrate: Tokens sent per second, 0 for as fast as possible.
+            tokens: Tokens in each response.
+            errorrate: Share of requests, 0 to 1, answered with errorstatus instead.
+            errorstatus: HTTP status of the rejected requests.  429 is sent with Retry-After: 0.
+            batchseconds: Seconds from submitting a batch job until it has ended.  The rejected share of its
+                          requests fails inside the job.
+        """
+        self.port = port
+        self.latency = latency
+        self.tokenrate = tokenrate
+        self.tokens = tokens
+        self.errorrate = errorrate
+        self.errorstatus = errorstatus
+        self.batchseconds = batchseconds
+        self.lock = threading.Lock()
+        self.counters = {}#provider -> {'requests', 'errors', 'seconds'}
+        self.files = {}#file id -> {'id', 'data', 'filename', 'purpose', 'created'}
+        self.jobs = {}#batch id -> {'id', 'created', 'total', 'succeeded', 'failed', 'output', 'errors', ...}
+        self.server = None
+
+    '''
+    Start()
+    Function: - Starts listening on a background thread
+    '''
+    def Start(self):
+        """
+        Returns:
+            dict: The baseurls entry that points Mainstay at this server.
+        """
+        self.server = ThreadingHTTPServer(('127.0.0.1', self.port), mockhandler)
+        self.server.daemon_threads = True
+        self.server.mock = self
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, name='benchmock', daemon=True).start()
+
+        return self.BaseURLs()
+
+    '''
+    Stop()
+    Function: - Stops the server
+    '''
+    def Stop(self):
+        if (self.server is not None):
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    '''
+    BaseURLs()
+    Function: - Returns the baseurls entry for mainstay.conf
+    '''
+    def BaseURLs(self):
+        base = 'http://127.0.0.1:' + str(self.port)
+        return {'openai': base + '/v1', 'anthropic': base, 'perplexity': base}
+
+    '''
+    Record()
+    Function: - Counts one request and the time the server spent on it
+    '''
+    def Record(self, provider, seconds, error=False):
+        with self.lock:
+            counter = self.counters.setdefault(provider, {'requests': 0, 'errors': 0, 'seconds': 0.0})
+            counter['requests'] += 1
+            counter['seconds'] += seconds
+            if (error == True):
+                counter['errors'] += 1
+
+    '''
+    AddFile()
+    Function: - Stores a file and returns its record
+    '''
+    def AddFile(self, data, filename, purpose):
+        with self.lock:
+            fileobject = {'id': 'file-benchmock' + str(len(self.files)), 'data': data, 'filename': filename,
+                          'purpose': purpose, 'created': time.time()}
+            self.files[fileobject['id']] = fileobject
+
+        return fileobject
+
+    '''
+    AddJob()
+    Function: - Records a batch job whose results are already known and returns its record
+    '''
+    def AddJob(self, prefix, total, output, errors, together=False):
+        """
+        Args:
+            prefix: Start of the job ID, batch_ for OpenAI and msgbatch_ for Anthropic.
+            total: Number of requests in the job.
+            output: Result lines of the requests that succeeded.
+            errors: Result lines of the requests that failed.
+            together: Keep every result in the output file, as Anthropic does, instead of a separate error file.
+
+        Returns:
+            dict: The job record.
+        """
+        lines = [output + errors] if (together == True) else [output, errors]
+        files = [self.AddFile(''.join(json.dumps(line) + '\n' for line in part).encode('utf-8'), 'results.jsonl', 'batch_output')['id']
+                 if (len(part) > 0) else None for part in lines]
+
+        with self.lock:
+            job = {'id': prefix + 'benchmock' + str(len(self.jobs)), 'created': time.time(), 'total': total,
+                   'succeeded': len(output), 'failed': len(errors), 'output': files[0],
+                   'errors': files[1] if (together == False) else None, 'ended': (self.batchseconds <= 0)}
+            self.jobs[job['id']] = job
+
+        return job
+
+    '''
+    Job()
+    Function: - Returns a batch job with its ended flag brought up to date, or None
+    '''
+    def Job(self, batchid):
+        with self.lock:
+            job = self.jobs.get(batchid)
+            if (job is not None):
+                job['ended'] = (time.time() - job['created'] >= self.batchseconds)
+
+        return job
+
+    '''
+    Stats()
+    Function: - Returns and optionally resets the request counters
+    '''
+    def Stats(self, reset=False):
+        """
+        Returns:
+            dict: provider -> requests, errors and seconds spent by the server.
+        """
+        with self.lock:
+            stats = json.loads(json.dumps(self.counters))
+            if (reset == True):
+                self.counters = {}
+
+        return stats
+
+'''
+This is the mainline section of the program
+'''
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Serve stand-in OpenAI, Anthropic and Perplexity APIs for offline testing.')
+    parser.add_argument('--port', type=int, default=8700, help='Port to listen on (default 8700)')
+    parser.add_argument('--latency', type=float, default=0.5, help='Seconds before the first token (default 0.5)')
+    parser.add_argument('--tokenrate', type=float, default=100, help='Tokens per second, 0 for no delay (default 100)')
+    parser.add_argument('--tokens', type=int, default=200, help='Tokens per response (default 200)')
+    parser.add_argument('--errorrate', type=float, default=0.0, help='Share of requests rejected, 0 to 1 (default 0)')
+    parser.add_argument('--errorstatus', type=int, default=429, help='HTTP status of rejected requests (default 429)')
+    parser.add_argument('--batchseconds', type=float, default=5, help='Seconds until a batch job has ended (default 5)')
+    args = parser.parse_args()
+
+    MOCK = mockserver(args.port, args.latency, args.tokenrate, args.tokens, args.errorrate, args.errorstatus, args.batchseconds)
+    baseurls = MOCK.Start()
+    print ('[*] benchmock listening, add this to mainstay.conf:')
+    print ('    "baseurls": ' + json.dumps(baseurls))
+
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        print ('[*] Requests served: ' + json.dumps(MOCK.Stats()))
+        MOCK.Stop()
+        sys.exit(0)
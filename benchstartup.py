@@ -0,0 +1,135 @@
+#! /usr/bin/env python3
+'''
+Mainstay v0.4 - Copyright 2025 James Slaughter,
+This file is part of Mainstay v0.4.
+
+Mainstay v0.4 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Mainstay v0.4 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Mainstay v0.4.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+"""
+benchstartup.py - CLI startup benchmark for Mainstay v0.4
+
+This script measures how long mainstay.py takes to start and finish commands that make no AI call, such as
+--listprompts, and reports the time spent above a bare Python interpreter.  It also checks that loading Mainstay
+does not import any provider SDK or rich, and reports how long each provider takes to load on first use.  No
+network access is needed.
+
+Usage: ./benchstartup.py [--runs N] [--json]
+
+Copyright 2025 James Slaughter. Licensed under GPL v3 or later.
+"""
+
+#python imports
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+HEAVY = ['openai', 'anthropic', 'httpx', 'requests', 'rich']#modules that must not be loaded at startup
+
+'''
+TimeCommand()
+Function: - Runs a command several times and returns the wall clock times in milliseconds
+'''
+def TimeCommand(command, runs):
+    times = []
+
+    for run in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=HERE, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append((time.perf_counter() - start) * 1000)
+
+    return times
+
+'''
+Summarize()
+Function: - Reduces a list of timings to min, median and max
+'''
+def Summarize(times):
+    return {'min_ms': round(min(times), 1), 'median_ms': round(statistics.median(times), 1), 'max_ms': round(max(times), 1)}
+
+'''
+LoadedModules()
+Function: - Returns the heavy modules present after importing Mainstay's entry points
+'''
+def LoadedModules():
+    code = ('import sys, mainstay, engine; ENG = engine.engine({"cachedir": "/tmp/mainstay-benchstartup"}); '
+            'print(" ".join(m for m in ' + repr(HEAVY) + ' if m in sys.modules))')
+    output = subprocess.run([sys.executable, '-c', code], cwd=HERE, capture_output=True, text=True)
+
+    return output.stdout.split()
+
+'''
+ProviderLoadTimes()
+Function: - Measures how long each built-in provider takes to load on first use
+'''
+def ProviderLoadTimes():
+    loadtimes = {}
+
+    for ai in ['chatgpt', 'claude', 'perplexity']:
+        code = ('import time, engine; ENG = engine.engine({"cachedir": "/tmp/mainstay-benchstartup"}); '
+                'start = time.perf_counter(); provider = ENG.providers["' + ai + '"]; '
+                'client = ENG.clients.OpenAI("x") if "' + ai + '" == "chatgpt" else '
+                '(ENG.clients.Anthropic("x") if "' + ai + '" == "claude" else ENG.clients.Session()); '
+                'print((time.perf_counter() - start) * 1000)')
+        output = subprocess.run([sys.executable, '-c', code], cwd=HERE, capture_output=True, text=True)
+        try:
+            loadtimes[ai] = round(float(output.stdout.strip()), 1)
+        except ValueError:
+            loadtimes[ai] = None
+
+    return loadtimes
+
+'''
+This is the mainline section of the program
+'''
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Measure Mainstay CLI startup time.')
+    parser.add_argument('--runs', type=int, default=10, help='Runs per command (default 10)')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    args = parser.parse_args()
+
+    results = {'python': sys.version.split()[0], 'runs': args.runs, 'commands': {}}
+
+    baseline = Summarize(TimeCommand([sys.executable, '-c', 'pass'], args.runs))
+    results['commands']['python -c pass'] = baseline
+
+    # --ai is given because the default AI is checked before mainstay.conf is read
+    for name, command in [('--listprompts', ['--listprompts', '--ai', 'chatgpt']), ('--viewprompt', ['--viewprompt', '--prompt', 'summarize', '--ai', 'chatgpt']), ('--usage', ['--usage'])]:
+        summary = Summarize(TimeCommand([sys.executable, 'mainstay.py'] + command, args.runs))
+        summary['over_interpreter_ms'] = round(summary['median_ms'] - baseline['median_ms'], 1)
+        results['commands'][name] = summary
+
+    results['heavy_modules_at_startup'] = LoadedModules()
+    results['provider_first_use_ms'] = ProviderLoadTimes()
+
+    if (args.json == True):
+        print (json.dumps(results, indent=2))
+    else:
+        print ('[*] Python ' + results['python'] + ', ' + str(args.runs) + ' runs per command')
+        for name, summary in results['commands'].items():
+            line = '[-] ' + name.ljust(16) + ' median ' + str(summary['median_ms']) + ' ms  (min ' + str(summary['min_ms']) + ', max ' + str(summary['max_ms']) + ')'
+            if ('over_interpreter_ms' in summary):
+                line += '  +' + str(summary['over_interpreter_ms']) + ' ms over the interpreter'
+            print (line)
+        print ('[-] Heavy modules loaded at startup: ' + (', '.join(results['heavy_modules_at_startup']) or 'none'))
+        for ai, loadtime in results['provider_first_use_ms'].items():
+            print ('[-] ' + ai + ' first use: ' + str(loadtime) + ' ms')
+        if (not os.path.exists('/opt/mainstay/mainstay.conf')):
+            print ('[!] /opt/mainstay/mainstay.conf not found, so --listprompts stopped at the configuration error')
@@ -0,0 +1,321 @@
+'''
+Mainstay v0.4 - Copyright 2025 James Slaughter,
+This file is part of Mainstay v0.4.
+
+Mainstay v0.4 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Mainstay v0.4 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Mainstay v0.4.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+"""
+cache.py - On-disk response cache for Mainstay v0.4
+
+This module stores provider responses on disk, keyed on everything that determines the answer: the AI provider,
+the model, the sampling parameters, the content of the prompt file and the input text.  Entries are evicted
+least-recently-used first once the cache grows past its size limit, and entries older than the age limit are
+discarded.
+
+Classes:
+    responsecache: Content-addressed store of provider responses with LRU eviction and hit/miss counters.
+
+Copyright 2025 James Slaughter. Licensed under GPL v3 or later.
+"""
+
+#python imports
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+
+'''
+responsecache
+Class: This class is responsible for storing and retrieving provider responses on disk
+'''
+class responsecache:
+    """
+    The responsecache class keeps one JSON file per response under cachedir/<first two hex digits of the key>/.
+    A file's modification time records when the entry was last used and drives LRU eviction.  Eviction only
+    touches those shard directories and entry files, so other files kept under cachedir are left alone.
+    """
+    SHARD = re.compile(r'^[0-9a-f]{2}$')#name of a shard directory
+    ENTRY = re.compile(r'^[0-9a-f]{64}\.json$')#name of an entry file, the key it holds
+    '''
+    Constructor
+    '''
+    def __init__(self, cachedir, maxbytes=256 * 1024 * 1024, maxage=30 * 86400):
+        """
+        Initializes the cache.
+
+        Args:
+            cachedir: Directory holding the cache entries.  It is created if it does not exist.
+            maxbytes: Total size the cache is trimmed back to.
+            maxage: Seconds an entry stays valid after it was stored.
+        """
+        self.cachedir = cachedir
+        self.maxbytes = maxbytes
+        self.maxage = maxage
+        self.lock = threading.Lock()
+        self.size = -1#total bytes on disk, -1 until the first scan
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.enabled = True
+
+        try:
+            os.makedirs(self.cachedir, exist_ok=True)
+        except Exception as e:
+            print ('[x] Unable to create response cache directory, caching disabled: ' + str(e))
+            self.enabled = False
+
+    '''
+    Hash()
+    Function: - Returns the SHA-256 hex digest of a string
+    '''
+    def Hash(self, text):
+        """
+        Returns the SHA-256 hex digest of text.
+        """
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    '''
+    Key()
+    Function: - Builds the cache key for a request
+    '''
+    def Key(self, ai, model, params, system_input, user_input, prompthash=None, history=None):
+        """
+        Builds the cache key for a request.
+
+        Args:
+            ai: chatgpt, perplexity or claude.
+            model: Model name.
+            params: Dictionary of sampling parameters sent with the request.
+            system_input: Content of the prompt file.
+            user_input: The input text.
+            prompthash: Hash() of system_input when the caller already has it, such as the prompt store's hash.
+            history: Messages of a session sent before user_input.  The same input has a different answer in
+                     another conversation.
+
+        Returns:
+            str: Hex digest identifying the request.
+        """
+        if (prompthash is None):
+            prompthash = self.Hash(system_input)
+
+        keydata = {
+            'ai': ai,
+            'model': model,
+            'params': params,
+            'prompt': prompthash,
+            'input': self.Hash(user_input)
+        }
+        if (history):
+            keydata['history'] = self.Hash(json.dumps(history, sort_keys=True))
+
+        return self.Hash(json.dumps(keydata, sort_keys=True))
+
+    '''
+    Path()
+    Function: - Returns the file that holds the entry for a key
+    '''
+    def Path(self, key):
+        return os.path.join(self.cachedir, key[:2], key + '.json')
+
+    '''
+    Get()
+    Function: - Returns a cached response, or None on a miss
+    '''
+    def Get(self, key):
+        """
+        Looks up a response.  A hit refreshes the entry's position in the LRU order.
+
+        Returns:
+            dict: The cached response, or None if there is no valid entry.
+        """
+        if (self.enabled == False):
+            return None
+
+        path = self.Path(key)
+
+        try:
+            with open(path, 'r', encoding='utf-8') as read_file:
+                entry = json.load(read_file)
+        except Exception:
+            with self.lock:
+                self.misses += 1
+            return None
+
+        if ((time.time() - entry.get('created', 0)) > self.maxage):
+            self.Remove(path)
+            with self.lock:
+                self.misses += 1
+            return None
+
+        try:
+            os.utime(path, None)
+        except Exception:
+            pass
+
+        with self.lock:
+            self.hits += 1
+
+        return entry['response']
+
+    '''
+    Put()
+    Function: - Stores a response and trims the cache if it is over size
+    '''
+    def Put(self, key, response):
+        """
+        Stores a response under key.  The file is written to a temporary name and renamed into place so
+        concurrent readers never see a partial entry.
+        """
+        if (self.enabled == False):
+            return -1
+
+        path = self.Path(key)
+        temp = path + '.' + str(os.getpid()) + '.' + str(threading.get_ident()) + '.tmp'
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(temp, 'w', encoding='utf-8') as write_file:
+                json.dump({'created': time.time(), 'response': response}, write_file)
+            written = os.path.getsize(temp)
+            os.replace(temp, path)
+        except Exception as e:
+            print ('[x] Unable to write response cache entry: ' + str(e))
+            self.Remove(temp)
+            return -1
+
+        with self.lock:
+            self.stores += 1
+            if (self.size >= 0):
+                self.size += written
+            oversize = ((self.size < 0) or (self.size > self.maxbytes))
+
+        if (oversize == True):
+            self.Evict()
+
+        return 0
+
+    '''
+    Remove()
+    Function: - Deletes a cache file, ignoring files that have already gone
+    '''
+    def Remove(self, path):
+        try:
+            os.remove(path)
+        except Exception:
+            pass
+
+    '''
+    Scan()
+    Function: - Returns the modification time, size and path of every entry on disk
+    '''
+    def Scan(self):
+        """
+        Lists the entries in the cache's shard directories.  Files that are not cache entries, such as the
+        temporary files of writes in progress, are left out.
+        """
+        entries = []
+
+        try:
+            shards = [name for name in os.listdir(self.cachedir) if (self.SHARD.match(name) is not None)]
+        except OSError:
+            shards = []
+
+        for shard in shards:
+            try:
+                names = os.listdir(os.path.join(self.cachedir, shard))
+            except OSError:
+                continue
+            for name in names:
+                if (self.ENTRY.match(name) is None):
+                    continue
+                path = os.path.join(self.cachedir, shard, name)
+                try:
+                    stat = os.stat(path)
+                except Exception:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        return entries
+
+    '''
+    Evict()
+    Function: - Deletes expired entries, then least recently used entries until under the size limit
+    '''
+    def Evict(self):
+        """
+        Scans the cache's shard directories, deletes entries not used within maxage and then deletes the least
+        recently used entries until the total size is under maxbytes.  Files that are not cache entries, such as
+        the temporary files of writes in progress, are neither counted nor deleted.
+
+        Returns:
+            int: Number of entries deleted.
+        """
+        entries = []
+        total = 0
+        removed = 0
+        now = time.time()
+
+        for mtime, size, path in self.Scan():
+            if ((now - mtime) > self.maxage):
+                self.Remove(path)
+                removed += 1
+                continue
+            entries.append((mtime, size, path))
+            total += size
+
+        entries.sort()
+        for mtime, size, path in entries:
+            if (total <= self.maxbytes):
+                break
+            self.Remove(path)
+            total -= size
+            removed += 1
+
+        with self.lock:
+            self.size = total
+            self.evictions += removed
+
+        return removed
+
+    '''
+    Size()
+    Function: - Returns the bytes held on disk, scanning the cache once when no eviction has counted them yet
+    '''
+    def Size(self):
+        with self.lock:
+            if (self.size >= 0):
+                return self.size
+
+        total = sum(size for mtime, size, path in self.Scan())
+        with self.lock:
+            if (self.size < 0):
+                self.size = total
+
+            return self.size
+
+    '''
+    Stats()
+    Function: - Returns the cache counters
+    '''
+    def Stats(self):
+        """
+        Returns the hit, miss, store and eviction counters for this process.
+        """
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'stores': self.stores,
+                    'evictions': self.evictions, 'bytes': self.size}
@@ -19,7 +19,7 @@ along with Mainstay v0.4.  If not, see <http://www.gnu.org/licenses/>.
 """
 chatgpt.py - Handles connecting to the OpenAI API for Mainstay v0.4
 
-This module provides functionality to list available OpenAI LLM models and to send prompts to the OpenAI API, saving the responses to a file. It is designed to be used as part of the Mainstay framework.
+This module provides functionality to list available OpenAI LLM models and to send prompts to the OpenAI API, returning the responses to the engine. It is designed to be used as part of the Mainstay framework.
 
 Classes:
     chatgpt: Handles model listing and API interaction for OpenAI.
@@ -28,15 +28,10 @@ Copyright 2025 James Slaughter. Licensed under GPL v3 or later.
 """
 
 #python imports
-import os
 import json
-import datetime
-import requests
-from openai import OpenAI
+import hashlib
 from collections import defaultdict
 from array import *
-from rich.console import Console
-from rich.markdown import Markdown
 
 #programmer generated imports
 from controller import controller
@@ -48,17 +43,20 @@ Class: This class is is responsible for keeping global settings available throug
 class chatgpt:
     """
     The chatgpt class provides methods to interact with the OpenAI API.
-    It can list available models and execute prompts using the API.
+    It can list available models and send prompts to the API.
     """
     '''
     Constructor
     '''
-    def __init__(self):
+    def __init__(self, clients):
         """
         Initializes the chatgpt class.
-        Currently, no properties are set in the constructor.
+
+        Args:
+            clients: The process-wide client registry that owns the OpenAI connection pool.
         """
-        fn = ''
+        self.clients = clients
+        self.params = {'temperature': 0.0, 'top_p': 1, 'frequency_penalty': 0.1, 'presence_penalty': 0.1}#sampling parameters sent with every request
 
     '''
     ListModels()
@@ -94,7 +92,7 @@ class chatgpt:
                     print ('\r\n[*] API key located!')
                     apikey = value
 
-        openai_url = 'https://api.openai.com/v1/models'
+        openai_url = self.clients.BaseURL('openai') + '/models'
 
         print ('[*] Retrieving List...\n\r')
 
@@ -103,7 +101,7 @@ class chatgpt:
             }
     
         try:
-            response = requests.get(openai_url, headers=session_headers)
+            response = self.clients.Session().get(openai_url, headers=session_headers, timeout=self.clients.Timeout())
         except Exception as e:
             print (LOG.colored('[x] OpenAI exception raised...' + str(e), 'echoerror', bold=True))
             return -1
@@ -132,100 +130,210 @@ class chatgpt:
         return 0
 
     '''
-    Execute()
-    Function: - Does the doing against a target
+    Messages()
+    Function: - Builds the message list with the prompt first so OpenAI's prefix cache can reuse it
+    '''
+    def Messages(self, system_input, user_input, history=None):
+        """
+        Returns the system message, the history of the session if there is one, and the user message.  OpenAI
+        caches the longest prefix of a request it has recently seen, so the prompt, which is the same on every call
+        that uses it, has to come before the input, which changes.  A session's history only grows at its end, so
+        each turn also finds the earlier turns in the cache.
+        """
+        return [{"role": "system", "content": system_input}] + list(history or []) + [{"role": "user", "content": f"{user_input}"}]
+
+    '''
+    CacheOptions()
+    Function: - Returns the request options that route calls sharing a prompt to the same prefix cache
+    '''
+    def CacheOptions(self, CON, system_input):
+        """
+        Returns a prompt_cache_key derived from the prompt, so calls with the same prompt are routed to servers that
+        already hold its prefix.  The turns of a session share a longer prefix, the prompt and the earlier turns,
+        so their key is derived from the session ID as well.  Empty when promptcaching is "false" in mainstay.conf,
+        for endpoints that reject the field.
+        """
+        if (str(CON.config.get('promptcaching', 'true')).lower() == 'false'):
+            return {}
+
+        routing = system_input if (CON.history == '') else system_input + '\n' + CON.history
+
+        return {'prompt_cache_key': 'mainstay-' + hashlib.sha256(routing.encode('utf-8')).hexdigest()[:32]}
+
+    '''
+    Usage()
+    Function: - Converts OpenAI usage into the usage dictionary returned to the engine
     '''
-    def Execute(self, CON, LOG):
+    def Usage(self, usage):
         """
-        Sends a prompt to the OpenAI API and writes the response to a file.
+        Returns input_tokens, output_tokens and cache_read_tokens, the part of the input served from the prompt
+        cache.  usage is the SDK object or, for Batch API results, the parsed JSON.  OpenAI does not charge for
+        cache writes, so cache_write_tokens is always 0.
+        """
+        if (usage is None):
+            return {'input_tokens': 0, 'output_tokens': 0, 'cache_write_tokens': 0, 'cache_read_tokens': 0}
+        if (isinstance(usage, dict)):
+            details = usage.get('prompt_tokens_details') or {}
+            return {'input_tokens': usage.get('prompt_tokens', 0), 'output_tokens': usage.get('completion_tokens', 0),
+                    'cache_write_tokens': 0, 'cache_read_tokens': details.get('cached_tokens', 0) or 0}
+
+        details = getattr(usage, 'prompt_tokens_details', None)
+        return {'input_tokens': usage.prompt_tokens, 'output_tokens': usage.completion_tokens, 'cache_write_tokens': 0,
+                'cache_read_tokens': (getattr(details, 'cached_tokens', 0) or 0) if (details is not None) else 0}
+
+    '''
+    Query()
+    Function: - Sends a prompt and input to the OpenAI API
+              - Returns the response text and metadata to the caller
+    '''
+    def Query(self, CON, LOG, apikey, system_input, user_input):
+        """
+        Sends a single prompt to the OpenAI API and returns the response.
 
         Args:
-            CON: Controller object containing configuration, input, and state.
+            CON: Controller object containing the model and debug settings.
             LOG: Logger object for colored output.
+            apikey: The OpenAI API key.
+            system_input: Content of the prompt file, sent as the system message.
+            user_input: The text to analyze, sent as the user message after the session history in
+                        CON.conversational_history, if any.
 
         Returns:
-            int: 0 on success, -1 on error (e.g., missing API key or prompt file).
-        """
-        user_input = ''
-        system_input = ''
-        prompt_read = ''        
-        promptfile = ''
-        sendpackage = []
-        current_dateTime = datetime.date.today()
-        apikey = ''
-        output = ''
-
-        if (len(CON.output) != 0):
-            output = CON.output
-        else:
-            output = CON.logroot + '/' + str(current_dateTime) + '.md'
+            dict: Response text, citations and token usage.
 
-        for apikeys in CON.apikeys: 
-            for key, value in apikeys.items():
-                if (CON.debug == True):
-                    print ('[DEBUG] API: ' + str(key) + ' | API Key: ' + str(value))
-                if (key == 'openai'):
-                    print ('\r\n[*] API key located!')
-                    apikey = value            
+        Raises:
+            Exception: Any error raised by the OpenAI client.
+        """
+        sendpackage = self.Messages(system_input, user_input, CON.conversational_history)
 
-        if (apikey == ''):
-            print (LOG.colored('\r\n[x] Unable to execute Mainstay - OpenAI apikey value not input.  Please add one to /opt/mainstay/mainstay.conf', 'echoerror', bold=True))
-            return -1        
-        else:
-            os.environ["OPENAI_API_KEY"] = apikey       
-            CON.openaiconstruct = OpenAI()
+        if (CON.debug == True):
+            print ('[DEBUG] sendpackage: ' + str(sendpackage))
 
-        console = Console()
+        response = self.clients.OpenAI(apikey).chat.completions.create(
+        model=CON.model,
+        messages=sendpackage,
+        extra_body=self.CacheOptions(CON, system_input),
+        **self.params
+        )
 
-        print ('[*] Model is: ' + CON.model + '\r\n')
+        return {'text': response.choices[0].message.content, 'citations': [], 'usage': self.Usage(response.usage)}
 
-        if (len(CON.input) != 0):
-            user_input = {"role": "user", "content": f"{CON.input}"}
-        else:
-            user_input = {"role": "user", "content": f"{CON.pipe}"}
+    '''
+    Stream()
+    Function: - Sends a prompt and input to the OpenAI API using the streaming interface
+              - Yields the response a token at a time as it arrives
+    '''
+    def Stream(self, CON, LOG, apikey, system_input, user_input, opened=None):
+        """
+        Streaming counterpart of Query().  opened, when given, is called with the open stream before the first
+        token so another thread can end it with clients.Abort().
 
-        promptfile = CON.promptdir + '/' + CON.prompt + '.md'
+        Yields:
+            dict: {'text': <delta>} for each piece of the response, then {'response': <dict as returned by Query()>}.
 
-        try:
-            with open(promptfile, "r+") as read_file:
-                prompt_read = read_file.read()            
-                system_input = {"role": "system", "content": prompt_read}  
-        except Exception as e:
-            print (LOG.colored('[x] Unable to find prompt file: ' + str(e), 'echoerror', bold=True))
-            return -1   
-    
-        sendpackage = [system_input, user_input]
+        Raises:
+            Exception: Any error raised by the OpenAI client.
+        """
+        sendpackage = self.Messages(system_input, user_input, CON.conversational_history)
+        text = []
+        usage = self.Usage(None)
 
         if (CON.debug == True):
-            print ('[DEBUG] sendpackage: ' + sendpackage)    
+            print ('[DEBUG] sendpackage: ' + str(sendpackage))
+
+        stream = self.clients.OpenAI(apikey).chat.completions.create(
+        model=CON.model,
+        messages=sendpackage,
+        stream=True,
+        stream_options={"include_usage": True},
+        extra_body=self.CacheOptions(CON, system_input),
+        **self.params
+        )
+        if (opened is not None):
+            opened(stream)
+
+        for chunk in stream:
+            if ((len(chunk.choices) > 0) and (chunk.choices[0].delta.content)):
+                text.append(chunk.choices[0].delta.content)
+                yield {'text': chunk.choices[0].delta.content}
+            if (chunk.usage is not None):
+                usage = self.Usage(chunk.usage)
+
+        yield {'response': {'text': ''.join(text), 'citations': [], 'usage': usage}}
 
-        try:
-            response = CON.openaiconstruct.chat.completions.create(
-            model=CON.model,
-            messages=sendpackage,
-            temperature=0.0,
-            top_p=1,
-            frequency_penalty=0.1,
-            presence_penalty=0.1,
-            )
-            print (LOG.colored('[*] Prompt response...\r\n', 'echoinfo', bold=True))
-            console.print(Markdown(response.choices[0].message.content))        
-        except Exception as e:
-            print (LOG.colored('[x] Unable to complete task: ' + str(e), 'echoerror', bold=True))
-            return -1
+    '''
+    SubmitBatch()
+    Function: - Uploads a batch file of requests and starts an OpenAI Batch API job
+    '''
+    def SubmitBatch(self, CON, LOG, apikey, requests):
+        """
+        Submits requests through the OpenAI Batch API.
 
-        try:
-            with open(output, "w") as write_file:
-                # Write header lines
-                write_file.write("\n")  # Blank line
-                write_file.write(f"URL: {CON.url}\n")  # URL line - populated with actual URL if available
-                write_file.write("TAGS: \n")  # Tags line
-                write_file.write("\n")  # Another blank line
-                # Write the actual content
-                write_file.write(response.choices[0].message.content)
-            print (LOG.colored('\r\n[*] Prompt response has been written to file here: ', 'echoinfo', bold=True) + LOG.colored(output, 'echolink', bold=True))
-        except Exception as e:
-            print (LOG.colored('[x] Unable to complete task: ' + str(e), 'echoerror', bold=True))
-            return -1
+        Args:
+            CON: Controller object containing the model.
+            LOG: Logger object for colored output.
+            apikey: The OpenAI API key.
+            requests: List of (custom_id, system_input, user_input) tuples.
 
-        return 0
+        Returns:
+            str: The batch ID.
+
+        Raises:
+            Exception: Any error raised by the OpenAI client.
+        """
+        client = self.clients.OpenAI(apikey).with_options(max_retries=2)
+        lines = []
+
+        for custom_id, system_input, user_input in requests:
+            body = {'model': CON.model, 'messages': self.Messages(system_input, user_input)}
+            body.update(self.CacheOptions(CON, system_input))
+            body.update(self.params)
+            lines.append(json.dumps({'custom_id': custom_id, 'method': 'POST', 'url': '/v1/chat/completions', 'body': body}))
+
+        batchfile = client.files.create(file=('mainstay_batch.jsonl', ('\n'.join(lines) + '\n').encode('utf-8')), purpose='batch')
+        job = client.batches.create(input_file_id=batchfile.id, endpoint='/v1/chat/completions', completion_window='24h')
+
+        return job.id
+
+    '''
+    BatchStatus()
+    Function: - Returns the state of an OpenAI Batch API job
+    '''
+    def BatchStatus(self, apikey, batchid):
+        """
+        Returns:
+            dict: done (True once the job has finished, successfully or not) and the provider's status string.
+        """
+        job = self.clients.OpenAI(apikey).with_options(max_retries=2).batches.retrieve(batchid)
+
+        return {'done': job.status in ('completed', 'failed', 'expired', 'cancelled'), 'status': job.status}
+
+    '''
+    BatchResults()
+    Function: - Downloads the results of a finished OpenAI Batch API job
+    '''
+    def BatchResults(self, apikey, batchid):
+        """
+        Returns:
+            dict: custom_id -> {'response': <dict as returned by Query()>} or {'error': <message>}.
+        """
+        client = self.clients.OpenAI(apikey).with_options(max_retries=2)
+        job = client.batches.retrieve(batchid)
+        results = {}
+
+        for fileid in [job.output_file_id, job.error_file_id]:
+            if (not fileid):
+                continue
+            for line in client.files.content(fileid).text.splitlines():
+                if (line.strip() == ''):
+                    continue
+                record = json.loads(line)
+                response = record.get('response') or {}
+                if (response.get('status_code') == 200):
+                    body = response['body']
+                    results[record['custom_id']] = {'response': {'text': body['choices'][0]['message']['content'], 'citations': [], 'usage': self.Usage(body.get('usage', {}))}}
+                else:
+                    error = record.get('error') or response.get('body', {}).get('error') or 'HTTP ' + str(response.get('status_code'))
+                    results[record['custom_id']] = {'error': str(error)}
+
+        return results
@@ -0,0 +1,243 @@
+'''
+Mainstay v0.4 - Copyright 2025 James Slaughter,
+This file is part of Mainstay v0.4.
+
+Mainstay v0.4 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Mainstay v0.4 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Mainstay v0.4.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+"""
+chunker.py - Map-reduce processing of oversized input for Mainstay v0.4
+
+This module handles input that will not fit in the model's context window alongside the prompt.  The input is
+split on structural boundaries (markdown headings, then paragraphs, then lines, then sentences), the selected
+prompt is run over every chunk in parallel, and a reduce step merges the partial results into one response.
+Chunk size is derived from the model's context limit and a local token count.
+
+Classes:
+    chunker: Decides when input is oversized, splits it and runs the map and reduce steps through the engine.
+
+Copyright 2025 James Slaughter. Licensed under GPL v3 or later.
+"""
+
+#python imports
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+#programmer generated imports
+#none
+
+'''
+chunker
+Class: This class is responsible for splitting oversized input and merging the per-chunk results
+'''
+class chunker:
+    """
+    The chunker class runs map-reduce over input that exceeds the model's context window.
+    """
+    '''
+    Constructor
+    '''
+    def __init__(self, ENG):
+        """
+        Initializes the chunker.
+
+        Args:
+            ENG: The engine used to send each chunk.  Context limits and the response reserve come from its token
+                 counter.  The optional mainstay.conf key reduceprompt names a prompt used for the reduce step
+                 instead of the selected prompt.
+        """
+        self.ENG = ENG
+        self.reduceprompt = ENG.config.get('reduceprompt', '')
+        # Chunks get their own pool: the outer request may already be running on the engine's pool
+        self.pool = ThreadPoolExecutor(max_workers=int(ENG.config.get('maxworkers', 8)), thread_name_prefix='mainstay-chunk')
+
+    '''
+    Budget()
+    Function: - Returns the number of input tokens that fit beside a system prompt and the session's history
+    '''
+    def Budget(self, CON, system_input):
+        return self.ENG.tokens.Budget(CON.ai, CON.model, self.ENG.tokens.Count(CON.ai, CON.model, system_input) + self.ENG.sessions.Tokens(CON))
+
+    '''
+    Oversize()
+    Function: - Returns True when a request will not fit in the model's context window
+    '''
+    def Oversize(self, CON, request):
+        return (self.ENG.tokens.Count(CON.ai, CON.model, request['user_input']) > self.Budget(CON, request['system_input']))
+
+    '''
+    MaxChars()
+    Function: - Converts a token budget into a chunk size in characters for a given text
+    '''
+    def MaxChars(self, CON, text, budget):
+        """
+        Returns the number of characters of text that hold about budget tokens, using the text's own ratio of
+        characters to tokens so dense input such as code or hex gets smaller chunks.
+        """
+        tokens = max(self.ENG.tokens.Count(CON.ai, CON.model, text), 1)
+
+        return max(int(budget * len(text) / tokens), 1)
+
+    '''
+    Pieces()
+    Function: - Breaks text into structural pieces no larger than maxchars
+    '''
+    def Pieces(self, text, maxchars, level=0):
+        """
+        Splits text on the coarsest boundary that works: markdown headings, blank lines, line breaks and sentence
+        ends, in that order.  Pieces still larger than maxchars are split on the next boundary, and text with
+        no usable boundary is cut at maxchars.  Joining the pieces gives back the original text.
+        """
+        boundaries = [r'(?=\n#{1,6} )', r'(?<=\n\n)', r'(?<=\n)', r'(?<=[.!?] )']
+
+        if (len(text) <= maxchars):
+            return [text]
+
+        if (level >= len(boundaries)):
+            return [text[i:i + maxchars] for i in range(0, len(text), maxchars)]
+
+        pieces = []
+        for part in re.split(boundaries[level], text):
+            if (part == ''):
+                continue
+            pieces.extend(self.Pieces(part, maxchars, level + 1))
+
+        return pieces
+
+    '''
+    Split()
+    Function: - Packs the structural pieces of text into chunks of up to maxchars
+    '''
+    def Split(self, text, maxchars):
+        chunks = []
+        current = ''
+
+        for piece in self.Pieces(text, maxchars):
+            if ((current != '') and (len(current) + len(piece) > maxchars)):
+                chunks.append(current)
+                current = ''
+            current += piece
+
+        if (current != ''):
+            chunks.append(current)
+
+        return chunks
+
+    '''
+    ReduceInstructions()
+    Function: - Builds the system prompt for the reduce step
+    '''
+    def ReduceInstructions(self, CON, system_input):
+        """
+        Returns the system prompt used to merge partial results.  By default the selected prompt is kept and
+        preceded by an instruction to merge, so the merged answer follows the prompt's output format.
+        """
+        if (self.reduceprompt != ''):
+            return self.ENG.prompts.Text(self.reduceprompt)
+
+        return ('The input consists of partial responses, each produced by applying the instructions below to one '
+                'consecutive section of a document that was too long to process at once.  Merge them into a single, '
+                'complete response that follows the instructions below exactly as if the whole document had been '
+                'processed in one pass.  Remove duplication between the parts and keep every distinct finding.\n\n'
+                + system_input)
+
+    '''
+    Map()
+    Function: - Runs one system prompt over several inputs in parallel
+    '''
+    def Map(self, CON, request, system_input, inputs):
+        """
+        Sends each input with system_input, in parallel, through the engine's cache and provider limits.
+
+        Returns:
+            list: Responses in the same order as inputs.
+
+        Raises:
+            Exception: The first error raised by any of the calls.
+        """
+        futures = []
+
+        for user_input in inputs:
+            subrequest = self.ENG.Request(CON, request['provider'], request['apikey'], system_input, user_input)
+            futures.append(self.pool.submit(self.ENG.Complete, CON, subrequest))
+
+        return [future.result()[0] for future in futures]
+
+    '''
+    MapReduce()
+    Function: - Runs a request whose input exceeds the context window
+    '''
+    def MapReduce(self, CON, request):
+        """
+        Splits the input, runs the prompt over each chunk and merges the partial results.  When the partial results
+        are themselves too large to merge in one call they are merged in groups, repeatedly, until one remains.
+        Each pass must leave fewer groups than it was given, otherwise the merge would never finish.
+
+        Args:
+            CON: Controller for the request.
+            request: Prepared request from engine.Prepare().
+
+        Returns:
+            dict: Response in the same form as a provider's Query(), with usage summed over every call and the
+                  number of chunks in 'chunks'.
+
+        Raises:
+            Exception: Any error raised while sending a chunk, or the partial results cannot be merged because they
+                       do not shrink from one pass to the next.
+        """
+        usage = {'input_tokens': 0, 'output_tokens': 0, 'cache_write_tokens': 0, 'cache_read_tokens': 0}
+        citations = []
+        budget = self.Budget(CON, request['system_input'])
+        if (budget <= 0):
+            raise Exception('The prompt alone does not fit in the context window of ' + CON.model)
+        maxchars = self.MaxChars(CON, request['user_input'], budget)
+
+        chunks = self.Split(request['user_input'], maxchars)
+        if (CON.debug == True):
+            print ('[DEBUG] Input split into ' + str(len(chunks)) + ' chunks of up to ' + str(maxchars) + ' characters')
+
+        partials = self.Map(CON, request, request['system_input'], chunks)
+
+        reduce_input = self.ReduceInstructions(CON, request['system_input'])
+        reducebudget = self.Budget(CON, reduce_input)
+        if (reducebudget <= 0):
+            raise Exception('The merge instructions alone do not fit in the context window of ' + CON.model)
+
+        while True:
+            for partial in partials:
+                for counter in usage:
+                    usage[counter] += partial['usage'].get(counter, 0)
+                for citation in partial['citations']:
+                    if (citation not in citations):
+                        citations.append(citation)
+
+            texts = []
+            for number, partial in enumerate(partials, 1):
+                texts.append('## Part ' + str(number) + ' of ' + str(len(partials)) + '\n\n' + partial['text'] + '\n\n')
+
+            merged = ''.join(texts)
+            groups = self.Split(merged, self.MaxChars(CON, merged, reducebudget))
+            # A pass that leaves as many groups as it started with would repeat forever, so stop before sending it
+            if ((len(groups) > 1) and (len(groups) >= len(partials))):
+                raise Exception('Unable to merge ' + str(len(partials)) + ' partial results: they still need ' + str(len(groups)) +
+                                ' calls to merge within the context window of ' + CON.model)
+            partials = self.Map(CON, request, reduce_input, groups)
+
+            if (len(groups) == 1):
+                break
+
+        for counter in usage:
+            usage[counter] += partials[0]['usage'].get(counter, 0)
+
+        return {'text': partials[0]['text'], 'citations': citations, 'usage': usage, 'chunks': len(chunks)}
@@ -21,13 +21,8 @@ claude.py - This file is responsible for connecting to the Anthropic API
 '''
 
 #python imports
-import os
-import datetime
-import anthropic
 from collections import defaultdict
 from array import *
-from rich.console import Console
-from rich.markdown import Markdown
 
 #programmer generated imports
 from controller import controller
@@ -39,17 +34,20 @@ Class: This class is is responsible for keeping global settings available throug
 class claude:
     """
     The claude class provides methods to interact with the Anthropic (Claude) AI API.
-    It can list available models and execute prompts using the API.
+    It can list available models and send prompts to the API.
     """
     '''
     Constructor
     '''
-    def __init__(self):
+    def __init__(self, clients):
         """
         Initializes the claude class.
-        Currently, no properties are set in the constructor.
+
+        Args:
+            clients: The process-wide client registry that owns the Anthropic connection pool.
         """
-        fn = ''
+        self.clients = clients
+        self.params = {'max_tokens': 4096, 'temperature': 1.0, 'top_p': 1}#sampling parameters sent with every request
 
     '''
     ListModels()
@@ -93,98 +91,187 @@ class claude:
         return 0
     
     '''
-    Execute()
-    Function: - Does the doing against a target
+    System()
+    Function: - Builds the system parameter, marked for Anthropic prompt caching
+    '''
+    def System(self, CON, system_input):
+        """
+        Returns the prompt as a single system block with an ephemeral cache_control breakpoint, so calls that reuse
+        the same prompt read it from Anthropic's prompt cache instead of processing it again.  Prompts shorter than
+        the model's minimum cacheable length are processed normally.  The plain string is returned when
+        promptcaching is "false" in mainstay.conf.
+        """
+        if (str(CON.config.get('promptcaching', 'true')).lower() == 'false'):
+            return system_input
+
+        return [{'type': 'text', 'text': system_input, 'cache_control': {'type': 'ephemeral'}}]
+
+    '''
+    Messages()
+    Function: - Builds the message list, marking the end of a session's history for Anthropic prompt caching
+    '''
+    def Messages(self, CON, user_input):
+        """
+        Returns the history of the session in CON.conversational_history, if there is one, followed by the user
+        message.  The last message of the history carries a second cache_control breakpoint, so the next turn reads
+        the prompt and every earlier turn from the prompt cache and only the new turn is processed.  No breakpoint
+        is added when promptcaching is "false" in mainstay.conf.
+        """
+        messages = [dict(message) for message in CON.conversational_history]
+        if ((len(messages) > 0) and (str(CON.config.get('promptcaching', 'true')).lower() != 'false')):
+            messages[-1]['content'] = [{'type': 'text', 'text': messages[-1]['content'], 'cache_control': {'type': 'ephemeral'}}]
+
+        return messages + [{"role": "user", "content": f"{user_input}"}]
+
+    '''
+    Usage()
+    Function: - Converts Anthropic usage into the usage dictionary returned to the engine
+    '''
+    def Usage(self, usage):
+        """
+        Returns input_tokens (including the tokens written to and read from the prompt cache, as OpenAI reports
+        them), output_tokens, cache_write_tokens and cache_read_tokens.
+        """
+        cache_write = getattr(usage, 'cache_creation_input_tokens', 0) or 0
+        cache_read = getattr(usage, 'cache_read_input_tokens', 0) or 0
+
+        return {'input_tokens': usage.input_tokens + cache_write + cache_read, 'output_tokens': usage.output_tokens,
+                'cache_write_tokens': cache_write, 'cache_read_tokens': cache_read}
+
     '''
-    def Execute(self, CON, LOG):
+    Query()
+    Function: - Sends a prompt and input to the Anthropic API
+              - Returns the response text and metadata to the caller
+    '''
+    def Query(self, CON, LOG, apikey, system_input, user_input):
         """
-        Sends a prompt to the Anthropic API and writes the response to a file.
+        Sends a single prompt to the Anthropic API and returns the response.
 
         Args:
-            CON: Controller object containing configuration, input, and state.
+            CON: Controller object containing the model and debug settings.
             LOG: Logger object for colored output.
+            apikey: The Anthropic API key.
+            system_input: Content of the prompt file, sent as the system prompt.
+            user_input: The text to analyze, sent as the user message after the session history in
+                        CON.conversational_history, if any.
 
         Returns:
-            int: 0 on success, -1 on error (e.g., missing API key or prompt file).
-        """
-        user_input = ''
-        system_input = ''
-        promptfile = ''
-        sendpackage = []
-        current_dateTime = datetime.date.today()
-        apikey = ''
-        output = ''
-
-        if (len(CON.output) != 0):
-            output = CON.output
-        else:
-            output = CON.logroot + '/' + str(current_dateTime) + '.md'
-
-        for apikeys in CON.apikeys: 
-            for key, value in apikeys.items():
-                if (CON.debug == True):
-                    print ('[DEBUG] API: ' + str(key) + ' | API Key: ' + str(value))
-                if (key == 'anthropic'):
-                    print ('\r\n[*] API key located!')
-                    apikey = value         
+            dict: Response text, citations and token usage.
 
-        if (apikey == ''):
-            print (LOG.colored('\r\n[x] Unable to execute Mainstay - Anthropic apikey value not input.  Please add one to /opt/mainstay/mainstay.conf', 'echoerror', bold=True))
-            return -1        
-        else:
-            os.environ["ANTHROPIC_API_KEY"] = apikey            
-            client = anthropic.Anthropic(api_key=apikey,)
-            
-        console = Console()
+        Raises:
+            Exception: Any error raised by the Anthropic client.
+        """
+        messages = self.Messages(CON, user_input)
 
-        print ('[*] Model is: ' + CON.model + '\r\n')
+        if (CON.debug == True):
+            print ('[DEBUG] sendpackage: ' + str([system_input] + messages))
 
-        if (len(CON.input) != 0):
-            user_input = {"role": "user", "content": f"{CON.input}"}
-        else:
-            user_input = {"role": "user", "content": f"{CON.pipe}"}
+        response = self.clients.Anthropic(apikey).messages.create(
+        model=CON.model,
+        system=self.System(CON, system_input),
+        messages=messages,
+        **self.params
+        )
 
-        promptfile = CON.promptdir + '/' + CON.prompt + '.md'
+        return {'text': response.content[0].text, 'citations': [], 'usage': self.Usage(response.usage)}
 
-        try:
-            with open(promptfile, "r+") as read_file:
-                system_input = read_file.read()            
-        except Exception as e:
-            print (LOG.colored('[x] Unable to find prompt file: ' + str(e), 'echoerror', bold=True))
-            return -1 
+    '''
+    Stream()
+    Function: - Sends a prompt and input to the Anthropic API using the streaming interface
+              - Yields the response a token at a time as it arrives
+    '''
+    def Stream(self, CON, LOG, apikey, system_input, user_input, opened=None):
+        """
+        Streaming counterpart of Query().  opened, when given, is called with the open stream before the first
+        token so another thread can end it with clients.Abort().
 
-        sendpackage = [system_input, user_input]
+        Yields:
+            dict: {'text': <delta>} for each piece of the response, then {'response': <dict as returned by Query()>}.
+
+        Raises:
+            Exception: Any error raised by the Anthropic client.
+        """
+        messages = self.Messages(CON, user_input)
+        text = []
 
         if (CON.debug == True):
-            print ('[DEBUG] sendpackage: ' + str(sendpackage))
-
-        try:            
-            response = client.messages.create(
-            model=CON.model,
-            max_tokens=4096,
-            system=system_input,            
-            messages=[user_input],            
-            temperature=1.0,
-            top_p=1,
-            )
-            print (LOG.colored('[*] Prompt response...\r\n', 'echoinfo', bold=True))                        
-            console.print(Markdown(response.content[0].text))        
-        except Exception as e:
-            print (LOG.colored('[x] Unable to complete task: ' + str(e), 'echoerror', bold=True))
-            return -1
-
-        try:
-            with open(output, "w") as write_file:
-                # Write header lines
-                write_file.write("\n")  # Blank line
-                write_file.write(f"URL: {CON.url}\n")  # URL line - populated with actual URL if available
-                write_file.write("TAGS: \n")  # Tags line
-                write_file.write("\n")  # Another blank line
-                # Write the actual content
-                write_file.write(response.content[0].text)
-            print (LOG.colored('\r\n[*] Prompt response has been written to file here: ', 'echoinfo', bold=True) + LOG.colored(output, 'echolink', bold=True))
-        except Exception as e:
-            print (LOG.colored('[x] Unable to complete task: ' + str(e), 'echoerror', bold=True))
-            return -1            
-
-        return 0                    
+            print ('[DEBUG] sendpackage: ' + str([system_input] + messages))
+
+        with self.clients.Anthropic(apikey).messages.stream(
+        model=CON.model,
+        system=self.System(CON, system_input),
+        messages=messages,
+        **self.params
+        ) as stream:
+            if (opened is not None):
+                opened(stream)
+            for delta in stream.text_stream:
+                text.append(delta)
+                yield {'text': delta}
+            message = stream.get_final_message()
+
+        yield {'response': {'text': ''.join(text), 'citations': [], 'usage': self.Usage(message.usage)}}
+
+    '''
+    SubmitBatch()
+    Function: - Starts an Anthropic Message Batches job
+    '''
+    def SubmitBatch(self, CON, LOG, apikey, requests):
+        """
+        Submits requests through the Anthropic Message Batches API.
+
+        Args:
+            CON: Controller object containing the model.
+            LOG: Logger object for colored output.
+            apikey: The Anthropic API key.
+            requests: List of (custom_id, system_input, user_input) tuples.
+
+        Returns:
+            str: The batch ID.
+
+        Raises:
+            Exception: Any error raised by the Anthropic client.
+        """
+        batchrequests = []
+
+        for custom_id, system_input, user_input in requests:
+            params = {'model': CON.model, 'system': self.System(CON, system_input), 'messages': [{"role": "user", "content": f"{user_input}"}]}
+            params.update(self.params)
+            batchrequests.append({'custom_id': custom_id, 'params': params})
+
+        job = self.clients.Anthropic(apikey).with_options(max_retries=2).messages.batches.create(requests=batchrequests)
+
+        return job.id
+
+    '''
+    BatchStatus()
+    Function: - Returns the state of an Anthropic Message Batches job
+    '''
+    def BatchStatus(self, apikey, batchid):
+        """
+        Returns:
+            dict: done (True once the job has ended) and the provider's processing status string.
+        """
+        job = self.clients.Anthropic(apikey).with_options(max_retries=2).messages.batches.retrieve(batchid)
+
+        return {'done': job.processing_status == 'ended', 'status': job.processing_status}
+
+    '''
+    BatchResults()
+    Function: - Downloads the results of a finished Anthropic Message Batches job
+    '''
+    def BatchResults(self, apikey, batchid):
+        """
+        Returns:
+            dict: custom_id -> {'response': <dict as returned by Query()>} or {'error': <message>}.
+        """
+        results = {}
+
+        for entry in self.clients.Anthropic(apikey).with_options(max_retries=2).messages.batches.results(batchid):
+            if (entry.result.type == 'succeeded'):
+                message = entry.result.message
+                results[entry.custom_id] = {'response': {'text': message.content[0].text, 'citations': [], 'usage': self.Usage(message.usage)}}
+            else:
+                results[entry.custom_id] = {'error': entry.result.type + ': ' + str(getattr(entry.result, 'error', ''))}
+
+        return results
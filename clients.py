@@ -0,0 +1,228 @@
+'''
+Mainstay v0.4 - Copyright 2025 James Slaughter,
+This file is part of Mainstay v0.4.
+
+Mainstay v0.4 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Mainstay v0.4 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Mainstay v0.4.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+"""
+clients.py - Shared HTTP client registry for Mainstay v0.4
+
+This module owns every HTTP connection pool Mainstay uses to reach the AI providers.  One pool is kept per
+provider for the life of the process, so repeated calls reuse open TLS connections instead of paying for a new
+TCP and TLS handshake each time.  Pool size and connect/read timeouts come from mainstay.conf.
+
+Classes:
+    clients: Builds and caches the OpenAI and Anthropic SDK clients and the requests session used for Perplexity.
+
+Copyright 2025 James Slaughter. Licensed under GPL v3 or later.
+"""
+
+#python imports
+import socket
+import threading
+# requests, httpx and the provider SDKs take most of a second to import, so each is imported by the method that
+# first needs it.  A run only pays for the SDK of the provider it uses.
+
+'''
+clients
+Class: This class is responsible for keeping pooled, long-lived HTTP clients for each AI provider
+'''
+class clients:
+    """
+    The clients class is the per-process registry of provider HTTP clients.
+    """
+    '''
+    Constructor
+    '''
+    def __init__(self, config):
+        """
+        Initializes the registry.  No connections are opened until a client is first requested or Warm() is called.
+
+        Args:
+            config: Dictionary loaded from mainstay.conf.  Optional keys are poolsize, connecttimeout,
+                    readtimeout and baseurls ({"openai": ..., "anthropic": ..., "perplexity": ...}).
+        """
+        self.poolsize = int(config.get('poolsize', 10))#connections kept per provider
+        self.connecttimeout = float(config.get('connecttimeout', 10))#seconds
+        self.readtimeout = float(config.get('readtimeout', 300))#seconds, long analyses can take minutes
+        self.baseurls = {
+            'openai': 'https://api.openai.com/v1',
+            'anthropic': 'https://api.anthropic.com',
+            'perplexity': 'https://api.perplexity.ai'
+        }
+        self.baseurls.update(config.get('baseurls', {}))
+        self.lock = threading.Lock()
+        self.httpclients = {}#vendor -> httpx client shared by every SDK client of that vendor
+        self.sdkclients = {}#(vendor, apikey) -> SDK client
+        self.session = None#requests session used for Perplexity and the OpenAI model list
+
+    '''
+    Timeout()
+    Function: - Returns the (connect, read) timeout pair used with requests
+    '''
+    def Timeout(self):
+        return (self.connecttimeout, self.readtimeout)
+
+    '''
+    BaseURL()
+    Function: - Returns the API base URL for a provider
+    '''
+    def BaseURL(self, vendor):
+        return self.baseurls[vendor].rstrip('/')
+
+    '''
+    Session()
+    Function: - Returns the shared requests session, creating it on first use
+    '''
+    def Session(self):
+        """
+        Returns the process-wide requests session.  Its adapter keeps up to poolsize connections per host open.
+        """
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        with self.lock:
+            if (self.session is None):
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.poolsize, pool_maxsize=self.poolsize)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self.session = session
+
+        return self.session
+
+    '''
+    HTTPClient()
+    Function: - Returns the pooled httpx client for a provider, creating it on first use
+    '''
+    def HTTPClient(self, vendor):
+        """
+        Returns the httpx client shared by the SDK clients of one provider.
+        """
+        import importlib
+        if (vendor == 'openai'):
+            from openai import DefaultHttpxClient
+        else:
+            from anthropic import DefaultHttpxClient
+        # Newer SDKs are built on a fork of httpx (httpx2), whose client rejects httpx's Limits and Timeout, so
+        # take them from whichever package the SDK's client class comes from
+        httpx = importlib.import_module(DefaultHttpxClient.__mro__[1].__module__.split('.')[0])
+
+        with self.lock:
+            if (vendor not in self.httpclients):
+                limits = httpx.Limits(max_connections=self.poolsize, max_keepalive_connections=self.poolsize)
+                timeout = httpx.Timeout(self.readtimeout, connect=self.connecttimeout)
+                self.httpclients[vendor] = DefaultHttpxClient(limits=limits, timeout=timeout)
+
+        return self.httpclients[vendor]
+
+    '''
+    OpenAI()
+    Function: - Returns the OpenAI client for an API key
+    '''
+    def OpenAI(self, apikey):
+        """
+        Returns a long-lived OpenAI client for apikey that uses the shared OpenAI connection pool.  The SDK's own
+        retries are off because the engine's rate limiter retries failed calls.
+        """
+        import openai
+
+        http_client = self.HTTPClient('openai')
+
+        with self.lock:
+            if (('openai', apikey) not in self.sdkclients):
+                self.sdkclients[('openai', apikey)] = openai.OpenAI(api_key=apikey, base_url=self.BaseURL('openai'), http_client=http_client, max_retries=0)
+
+        return self.sdkclients[('openai', apikey)]
+
+    '''
+    Anthropic()
+    Function: - Returns the Anthropic client for an API key
+    '''
+    def Anthropic(self, apikey):
+        """
+        Returns a long-lived Anthropic client for apikey that uses the shared Anthropic connection pool.  The SDK's
+        own retries are off because the engine's rate limiter retries failed calls.
+        """
+        import anthropic
+
+        http_client = self.HTTPClient('anthropic')
+
+        with self.lock:
+            if (('anthropic', apikey) not in self.sdkclients):
+                self.sdkclients[('anthropic', apikey)] = anthropic.Anthropic(api_key=apikey, base_url=self.BaseURL('anthropic'), http_client=http_client, max_retries=0)
+
+        return self.sdkclients[('anthropic', apikey)]
+
+    '''
+    Warm()
+    Function: - Opens a connection to each provider so later calls skip the TCP and TLS handshake
+    '''
+    def Warm(self, vendors):
+        """
+        Sends a cheap HEAD request to each provider so a pooled, kept-alive connection is ready for the first
+        real call.  The response status does not matter and failures are ignored.
+
+        Args:
+            vendors: List of provider names (openai, anthropic, perplexity) to warm.
+
+        Returns:
+            list: The providers that were reached.
+        """
+        warmed = []
+
+        for vendor in vendors:
+            try:
+                if (vendor == 'perplexity'):
+                    self.Session().head(self.BaseURL(vendor), timeout=self.Timeout())
+                else:
+                    self.HTTPClient(vendor).head(self.BaseURL(vendor))
+                warmed.append(vendor)
+            except Exception as e:
+                print ('[-] Unable to warm connection to ' + vendor + ': ' + str(e))
+
+        return warmed
+
+    '''
+    Abort()
+    Function: - Ends a streaming response that another thread is reading
+    '''
+    def Abort(self, handle):
+        """
+        Ends a streaming response from another thread.  Closing the response does not wake a thread blocked
+        reading it, so the socket under it is shut down and the reading thread's next read fails.  That thread
+        closes the response itself, and the connection is dropped from its pool.  A response that has already
+        ended is left alone.
+
+        Args:
+            handle: The OpenAI or Anthropic SDK stream, or the requests response, passed to a provider's opened
+                    callback.
+        """
+        response = getattr(handle, 'response', handle)#the SDK streams wrap an httpx response
+        try:
+            # A response that has ended has handed its connection back to the pool for another call to use
+            if (hasattr(response, 'extensions') == True):
+                if (response.is_closed == True):
+                    return
+                sock = response.extensions['network_stream'].get_extra_info('socket')
+            else:
+                sock = response.raw.connection.sock#the connection is None once released
+            sock.shutdown(socket.SHUT_RDWR)
+        except Exception:
+            # The response has already ended, or its socket cannot be reached, so fall back on closing it
+            try:
+                handle.close()
+            except Exception:
+                pass
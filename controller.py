@@ -36,13 +36,14 @@ class controller:
     '''
     def __init__(self):
 
+        self.config = {}#Parsed contents of mainstay.conf
         self.debug = False#Boolean value, if set to true, debug lines will print to the console.
         self.defaultmodels = []#value read from the conf file.
         self.model = ''#input from the --model cmd line flag.
         self.file = ''#data you want to query.
         self.apikeys = []#list of apikeys stored centrally.
-        self.history = ''#conversational history file
-        self.conversational_history = []
+        self.history = ''#Session ID from the --session cmd line flag; its history is kept in sessiondir/<ID>.json
+        self.conversational_history = []#Messages of the session sent between the prompt and the input, see sessionstore
         self.template = ''#The custom template to prompt the LLM
         self.template_text = ''
         self.questions = ''#File containing questions you want to ask the data
@@ -63,5 +64,19 @@ class controller:
         self.ai = ''
         self.input = ''
         self.pipe = ''
+        self.nocache = False#Boolean input from the --no-cache cmd line flag
+        self.refresh = False#Boolean input from the --refresh cmd line flag
+        self.coalesced = False#Boolean, set when a response was shared with an identical request already in flight
+        self.tried = []#AIs this request already failed on, set when it fails over to another AI
+        self.stream = False#Boolean input from the --stream cmd line flag
+        self.chunking = True#Boolean, False when the --no-chunk cmd line flag is set
+        self.hedge = False#Boolean input from the --hedge cmd line flag
+        self.estimate = False#Boolean input from the --estimate cmd line flag
+        self.batch = ''#Directory or JSONL file from the --batch cmd line flag
+        self.batchapi = False#Boolean input from the --batchapi cmd line flag
+        self.searching = False#Boolean, True when the --search cmd line flag is set
+        self.daemon = False#Boolean input from the --daemon cmd line flag
+        self.usedaemon = True#Boolean, False when the --no-daemon cmd line flag is set
+        self.search = ''#Query from the --search cmd line flag; empty to search for the piped input
         self.url = ''  # URL used for input when fetching content from web
         self.openaiconstruct = ''
\ No newline at end of file
@@ -0,0 +1,382 @@
+'''
+Mainstay v0.4 - Copyright 2025 James Slaughter,
+This file is part of Mainstay v0.4.
+
+Mainstay v0.4 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Mainstay v0.4 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Mainstay v0.4.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+"""
+daemon.py - Resident Mainstay process and its command line client for Mainstay v0.4
+
+This module lets a long-running `mainstay.py --daemon` answer the commands of short-lived `mainstay.py` runs.  The
+daemon holds one engine, so the provider SDKs, HTTP connections, prompts, token counts and caches stay loaded
+between commands.  It listens on a Unix domain socket that only its owner can use.  The command line still parses
+its arguments, reads the configuration and reads the piped input itself.  It then sends the controller to the
+daemon instead of importing the engine, and prints what the daemon sends back as it arrives.  When no daemon is
+listening, or it was started with a different configuration, the command runs in-process as before.
+
+The protocol is one JSON object per line.  The client sends {"conf", "mtime", "tty", "controller"}.  The daemon
+answers with {"out": <text>} for everything the command prints, then {"exit": <exit code>}, or with a single
+{"reject": <reason>} when the client should run the command itself.
+
+Classes:
+    output: Stand-in for sys.stdout that sends each thread's output to the client it is serving.
+    channel: Writes one client's output to its connection.
+    handler: Runs one forwarded command.
+    daemon: Binds the socket and serves commands on the engine.
+    daemonclient: Forwards a command from the command line to the daemon.
+
+Copyright 2025 James Slaughter. Licensed under GPL v3 or later.
+"""
+
+#python imports
+import os
+import sys
+import json
+import signal
+import socket
+import threading
+import socketserver
+
+#programmer generated imports
+from controller import controller
+
+'''
+output
+Class: This class is responsible for routing printed output to the client a thread is serving
+'''
+class output:
+    """
+    The output class replaces sys.stdout in the daemon.  A thread serving a client writes to that client's
+    channel.  Every other thread, including the engine's worker pool, writes to the daemon's own stdout.
+    """
+    '''
+    Constructor
+    '''
+    def __init__(self, default):
+        self.default = default#the daemon's own stdout
+        self.local = threading.local()
+
+    '''
+    Target()
+    Function: - Returns the stream the calling thread writes to
+    '''
+    def Target(self):
+        return getattr(self.local, 'target', None) or self.default
+
+    '''
+    write(), flush(), isatty()
+    Function: - The text stream methods print() and rich use, passed to the calling thread's stream
+    '''
+    def write(self, text):
+        return self.Target().write(text)
+
+    def flush(self):
+        self.Target().flush()
+
+    def isatty(self):
+        return self.Target().isatty()
+
+    '''
+    __getattr__()
+    Function: - Passes any other attribute, such as encoding, to the calling thread's stream
+    '''
+    def __getattr__(self, name):
+        return getattr(self.Target(), name)
+
+'''
+channel
+Class: This class is responsible for sending one client's output over its connection
+'''
+class channel:
+    """
+    The channel class is a minimal text stream.  Each write is sent to the client at once, so streamed tokens
+    reach the terminal as they arrive.
+    """
+    '''
+    Constructor
+    '''
+    def __init__(self, wfile, tty):
+        self.wfile = wfile
+        self.tty = tty#True when the client's stdout is a terminal
+        self.encoding = 'utf-8'
+
+    '''
+    Send()
+    Function: - Sends one message to the client
+    '''
+    def Send(self, message):
+        self.wfile.write((json.dumps(message) + '\n').encode('utf-8'))
+        self.wfile.flush()
+
+    '''
+    write(), flush(), isatty()
+    Function: - The text stream methods; each write is sent as one message
+    '''
+    def write(self, text):
+        if (len(text) > 0):
+            self.Send({'out': text})
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return self.tty
+
+'''
+handler
+Class: This class is responsible for running one command forwarded by a client
+'''
+class handler(socketserver.StreamRequestHandler):
+    """
+    The handler class reads the client's message, rebuilds its controller and runs the command on the daemon's
+    engine with the thread's output sent to the client.  The server is the daemon's socketserver.
+    """
+    '''
+    handle()
+    Function: - Serves one connection
+    '''
+    def handle(self):
+        DAE = self.server.DAE
+        try:
+            message = json.loads(self.rfile.readline().decode('utf-8'))
+        except Exception:
+            return
+
+        stream = channel(self.wfile, bool(message.get('tty', False)))
+        reason = DAE.Reject(message)
+        if (reason != ''):
+            stream.Send({'reject': reason})
+            return
+
+        CON = controller()
+        for name, value in message['controller'].items():
+            setattr(CON, name, value)
+        CON.config = DAE.ENG.config
+
+        DAE.OUTPUT.local.target = stream
+        try:
+            exitcode = DAE.ENG.Command(CON, DAE.LOG)
+        except SystemExit as e:
+            exitcode = e.code if (isinstance(e.code, int)) else -1
+        except OSError:
+            # The client went away; there is nobody left to report to
+            return
+        except Exception as e:
+            print (DAE.LOG.colored('[x] The daemon was unable to complete the command: ' + str(e), 'echoerror', bold=True))
+            exitcode = -1
+        finally:
+            DAE.OUTPUT.local.target = None
+
+        try:
+            stream.Send({'exit': exitcode})
+        except OSError:
+            pass
+
+'''
+daemon
+Class: This class is responsible for serving forwarded commands on a resident engine
+'''
+class daemon:
+    """
+    The daemon class owns the engine, the socket and the threads serving clients.
+    """
+    '''
+    Constructor
+    '''
+    def __init__(self, ENG, LOG, conf):
+        """
+        Initializes the daemon.
+
+        Args:
+            ENG: The engine commands run on.
+            LOG: Logger object for colored output.
+            conf: Path of the configuration file the engine was built from.  Clients using another file, or this
+                  one after it changed, are told to run their command themselves.
+        """
+        self.ENG = ENG
+        self.LOG = LOG
+        self.conf = os.path.abspath(conf)
+        self.mtime = os.path.getmtime(self.conf)
+        self.path = daemon.Path(ENG.config)
+        self.OUTPUT = None
+        self.server = None
+
+    '''
+    Path()
+    Function: - Returns the socket named by the configuration
+    '''
+    @staticmethod
+    def Path(config):
+        """
+        Returns daemonsocket from mainstay.conf, /opt/mainstay/mainstay.sock by default, or an empty string when
+        daemonsocket is "false".
+        """
+        path = str(config.get('daemonsocket', '/opt/mainstay/mainstay.sock'))
+
+        return '' if (path.lower() == 'false') else path
+
+    '''
+    Reject()
+    Function: - Returns why a client should run its command itself, or an empty string
+    '''
+    def Reject(self, message):
+        if (message.get('conf') != self.conf):
+            return 'the daemon was started with ' + self.conf
+        if (message.get('mtime') != self.mtime):
+            return self.conf + ' has changed since the daemon started; restart it with --daemon'
+        if (not isinstance(message.get('controller'), dict)):
+            return 'the command was not understood'
+
+        return ''
+
+    '''
+    Serve()
+    Function: - Binds the socket and serves commands until the daemon is stopped
+    '''
+    def Serve(self):
+        """
+        Serves commands until SIGTERM or Ctrl-C, one thread per connection.  A socket left behind by a daemon that
+        is no longer running is replaced.
+
+        Returns:
+            int: 0 when stopped, -1 when the socket could not be bound.
+        """
+        if (self.path == ''):
+            print (self.LOG.colored('[x] The daemon is turned off (daemonsocket is "false").', 'echoerror', bold=True))
+            return -1
+
+        if (os.path.exists(self.path)):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+                print (self.LOG.colored('[x] A daemon is already listening on ' + self.path, 'echoerror', bold=True))
+                return -1
+            except OSError:
+                os.remove(self.path)
+            finally:
+                probe.close()
+
+        try:
+            directory = os.path.dirname(self.path)
+            if (directory != ''):
+                os.makedirs(directory, exist_ok=True)
+            # Created owner-only, as the commands it accepts run with this user's API keys
+            umask = os.umask(0o177)
+            try:
+                self.server = socketserver.ThreadingUnixStreamServer(self.path, handler)
+            finally:
+                os.umask(umask)
+        except OSError as e:
+            print (self.LOG.colored('[x] Unable to listen on ' + self.path + ': ' + str(e), 'echoerror', bold=True))
+            return -1
+
+        self.server.daemon_threads = True
+        self.server.DAE = self
+        self.OUTPUT = output(sys.stdout)
+        sys.stdout = self.OUTPUT
+        signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=self.server.shutdown, daemon=True).start())
+
+        vendors = self.ENG.Warm()
+        print (self.LOG.colored('[*] Daemon listening on ' + self.path + ' (' + str(len(vendors)) + ' provider connection(s) warm)', 'echoinfo', bold=True))
+        try:
+            self.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.server.server_close()
+            sys.stdout = self.OUTPUT.default
+            if (os.path.exists(self.path)):
+                os.remove(self.path)
+            self.ENG.SaveState()
+
+        print (self.LOG.colored('[*] Daemon stopped', 'echoinfo', bold=True))
+
+        return 0
+
+'''
+daemonclient
+Class: This class is responsible for forwarding a command line run to the daemon
+'''
+class daemonclient:
+    """
+    The daemonclient class sends the parsed command to a running daemon and prints what comes back.
+    """
+    '''
+    Constructor
+    '''
+    def __init__(self, LOG, conf):
+        """
+        Initializes the client.
+
+        Args:
+            LOG: Logger object for colored output.
+            conf: Path of the configuration file the command line read.
+        """
+        self.LOG = LOG
+        self.conf = os.path.abspath(conf)
+
+    '''
+    Forward()
+    Function: - Runs a command on the daemon, printing its output as it arrives
+    '''
+    def Forward(self, CON):
+        """
+        Sends CON to the daemon listening on the socket named by CON.config.  Relative output and batch paths are
+        made absolute first, as the daemon runs in another directory.
+
+        Returns:
+            int: The command's exit code, or None when no daemon took the command and it should run in-process.
+        """
+        path = daemon.Path(CON.config)
+        if ((path == '') or (not os.path.exists(path))):
+            return None
+
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            connection.connect(path)
+        except OSError:
+            connection.close()
+            return None
+
+        fields = dict(vars(CON))
+        del fields['config']
+        for name in ['output', 'batch']:
+            if ((fields[name] != '') and (fields[name] != '<>')):
+                fields[name] = os.path.abspath(fields[name])
+
+        try:
+            message = {'conf': self.conf, 'mtime': os.path.getmtime(self.conf), 'tty': sys.stdout.isatty(), 'controller': fields}
+            connection.sendall((json.dumps(message) + '\n').encode('utf-8'))
+            with connection.makefile('rb') as reader:
+                for line in reader:
+                    reply = json.loads(line.decode('utf-8'))
+                    if ('out' in reply):
+                        sys.stdout.write(reply['out'])
+                        sys.stdout.flush()
+                    elif ('exit' in reply):
+                        return reply['exit']
+                    elif ('reject' in reply):
+                        print (self.LOG.colored('[-] Not using the daemon: ' + reply['reject'], 'echowarn', bold=True))
+                        return None
+        except (OSError, ValueError) as e:
+            print (self.LOG.colored('[x] Lost the connection to the daemon: ' + str(e), 'echoerror', bold=True))
+            return -1
+        finally:
+            connection.close()
+
+        print (self.LOG.colored('[x] The daemon closed the connection before the command finished.', 'echoerror', bold=True))
+
+        return -1
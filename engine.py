@@ -0,0 +1,1207 @@
+'''
+Mainstay v0.4 - Copyright 2025 James Slaughter,
+This file is part of Mainstay v0.4.
+
+Mainstay v0.4 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Mainstay v0.4 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Mainstay v0.4.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+"""
+engine.py - In-process execution engine for Mainstay v0.4
+
+This module runs a prompt against one of the AI providers without launching a new interpreter. It holds the
+parsed configuration and the provider objects (and therefore their API clients) for the life of the process,
+so the CLI and the Flask interface can both call it directly.
+
+Classes:
+    engine: Resolves keys, models and prompts, calls the provider and writes the output file.
+
+Copyright 2025 James Slaughter. Licensed under GPL v3 or later.
+"""
+
+#python imports
+import os
+import sys
+import math
+import time
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+#programmer generated imports
+from controller import controller
+from logger import logger
+from cache import responsecache
+from clients import clients
+from chunker import chunker
+from registry import registry
+from promptstore import promptstore
+from tokens import tokencounter
+from ratelimit import ratelimiter
+from singleflight import singleflight
+from metrics import metrics
+from runlog import runlog
+from searchindex import searchindex
+from hedge import hedger
+from router import router
+from sessions import sessionstore
+
+'''
+engine
+Class: This class is responsible for running prompts in-process against the configured AI providers
+'''
+class engine:
+    """
+    The engine class keeps configuration and provider clients warm and runs prompts on request.
+    """
+    '''
+    Constructor
+    '''
+    def __init__(self, config, prompts=None):
+        """
+        Initializes the engine from an already parsed mainstay.conf.
+
+        Args:
+            config: Dictionary loaded from mainstay.conf.
+            prompts: promptstore to read prompts from.  One is created for promptdir when not given.
+        """
+        self.config = config#parsed contents of mainstay.conf
+        self.LOG = logger()
+        self.clients = clients(config)#pooled HTTP clients shared by every provider call in this process
+        self.providers = registry(config, self.clients)#ai name -> provider, each imported on first use
+        self.vendors = self.providers.vendors#ai name -> conf file key
+        self.maxworkers = int(config.get('maxworkers', 8))#size of the pool used by RunMany()
+        self.pool = ThreadPoolExecutor(max_workers=self.maxworkers, thread_name_prefix='mainstay')
+        self.slots = {}#ai name -> semaphore capping concurrent calls to that provider
+        self.concurrency = {}#ai name -> size of that semaphore
+        providerconcurrency = config.get('providerconcurrency', {})
+        for ai in self.providers:
+            self.concurrency[ai] = int(providerconcurrency.get(ai, 4))
+            self.slots[ai] = threading.BoundedSemaphore(self.concurrency[ai])
+        self.cache = responsecache(config.get('cachedir', '/opt/mainstay/cache'),
+                                   maxbytes=int(config.get('cachemaxmb', 256)) * 1024 * 1024,
+                                   maxage=int(config.get('cachemaxdays', 30)) * 86400)
+        self.tokens = tokencounter(config)#local token counts, context limits and prices
+        self.limiter = ratelimiter(config)#per provider and model RPM/TPM buckets and retry policy
+        self.flights = singleflight()#identical requests in flight share one provider call
+        self.metrics = metrics()#request, provider call and URL fetch counters for neomainstay's /metrics
+        self.runlog = runlog(self.RunLogPath(config), flushseconds=float(config.get('runlogflushseconds', 2)),
+                             maxbytes=int(config.get('runlogmaxmb', 10)) * 1024 * 1024, backups=int(config.get('runlogbackups', 5)))
+        self.search = searchindex(searchindex.Path(config))#full-text index of the outputs written
+        self.chunker = chunker(self)#map-reduce over input larger than the model's context window
+        self.router = router(self)#circuit breakers per provider and model, and failover to the next provider
+        self.hedger = hedger(self)#races slow requests against a second provider when --hedge is set
+        self.sessions = sessionstore(self)#conversations continued with --session
+        if (prompts is None):
+            prompts = promptstore(config.get('promptdir', ''), counter=lambda text: self.tokens.Count('', '', text),
+                                  recheck=config.get('promptrecheck', 2))
+        self.prompts = prompts#prompt files held in memory
+
+    '''
+    RunLogPath()
+    Function: - Returns the run log file named by the configuration
+    '''
+    def RunLogPath(self, config):
+        """
+        Returns the runlog path from mainstay.conf, or runlog.jsonl in logroot when logger is "true".  An empty
+        string, which turns the run log off, is returned when runlog is "false" or neither is configured.
+        """
+        path = str(config.get('runlog', ''))
+        if (path.lower() == 'false'):
+            return ''
+        if ((path == '') and (str(config.get('logger', '')).lower() == 'true') and (config.get('logroot', '') != '')):
+            path = os.path.join(config['logroot'], 'runlog.jsonl')
+
+        return path
+
+    '''
+    SaveState()
+    Function: - Writes what the engine learned during this run to the state directory
+    '''
+    def SaveState(self):
+        """
+        Saves the token counts, the circuit breakers and the hedge statistics now.  Called when a CLI command finishes and when the daemon
+        stops; a long-running process also saves them as it goes.
+        """
+        self.tokens.Save()
+        self.router.Save()
+        self.hedger.Save()
+
+    '''
+    Warm()
+    Function: - Opens a pooled connection to every provider that has an API key configured
+    '''
+    def Warm(self):
+        """
+        Warms the connection pools of every provider with an API key, so the first request skips the TCP and
+        TLS handshake.  Intended to be called once when a long-running server starts.
+
+        Returns:
+            list: The providers that were reached.
+        """
+        CON = self.NewController()
+        vendors = []
+
+        for ai in self.providers:
+            CON.ai = ai
+            if (self.GetAPIKey(CON) != ''):
+                vendors.append(self.vendors[ai])
+
+        return self.clients.Warm(vendors)
+
+    '''
+    NewController()
+    Function: - Builds a controller object populated from the configuration
+    '''
+    def NewController(self, input_text='', prompt='', ai='', model='', output='', url='', debug=False, nocache=False, refresh=False, chunking=True, hedge=False, session=''):
+        """
+        Returns a new controller populated with the configuration values and the request arguments, one per
+        request.  The arguments are those of Run().
+
+        Returns:
+            controller: The populated controller object.
+        """
+        CON = controller()
+        CON.config = self.config
+        CON.logger = self.config.get('logger', '')
+        CON.logroot = self.config.get('logroot', '')
+        CON.defaultmodels = self.config.get('defaultmodels', [])
+        CON.defaultai = self.config.get('defaultai', '')
+        CON.apikeys = self.config.get('apikeys', [])
+        CON.promptdir = self.config.get('promptdir', '')
+        CON.input = input_text
+        CON.prompt = prompt
+        CON.ai = ai if ai else CON.defaultai
+        CON.model = model
+        CON.output = output
+        CON.url = url
+        CON.debug = debug
+        CON.nocache = nocache
+        CON.refresh = refresh
+        CON.chunking = chunking
+        CON.hedge = hedge
+        CON.history = session
+
+        return CON
+
+    '''
+    GetAPIKey()
+    Function: - Locates the API key for the selected AI in the configuration
+    '''
+    def GetAPIKey(self, CON):
+        """
+        Returns the API key configured for CON.ai, or an empty string if there is none.
+        """
+        apikey = ''
+
+        for apikeys in CON.apikeys:
+            for key, value in apikeys.items():
+                if (key == self.vendors.get(CON.ai)):
+                    apikey = value
+
+        return apikey
+
+    '''
+    GetDefaultModel()
+    Function: - Locates the default model for the selected AI in the configuration
+    '''
+    def GetDefaultModel(self, CON):
+        """
+        Returns the default model configured for CON.ai, or an empty string if there is none.
+        """
+        model = ''
+
+        for models in CON.defaultmodels:
+            for key, value in models.items():
+                if (key == self.vendors.get(CON.ai)):
+                    model = value
+
+        return model
+
+    '''
+    ReadPrompt()
+    Function: - Reads the prompt file selected in the controller
+    '''
+    def ReadPrompt(self, CON):
+        """
+        Returns the text of promptdir/<prompt>.md from the prompt store.
+
+        Returns:
+            str: The prompt text.
+
+        Raises:
+            Exception: If the prompt file cannot be read.
+        """
+        return self.prompts.Text(CON.prompt)
+
+    '''
+    WriteOutput()
+    Function: - Writes the response to the output file with the URL/TAGS header
+    '''
+    def WriteOutput(self, output, url, response):
+        """
+        Writes a response to the output file.
+
+        Args:
+            output: Path of the file to write.
+            url: URL the input was fetched from, if any.
+            response: Response dictionary returned by a provider's Query().
+        """
+        with open(output, "w", encoding='utf-8') as write_file:
+            # Write header lines
+            write_file.write("\n")  # Blank line
+            write_file.write(f"URL: {url}\n")  # URL line - populated with actual URL if available
+            write_file.write("TAGS: \n")  # Tags line
+            write_file.write("\n")  # Another blank line
+            # Write citations, if the provider returned any
+            if (len(response['citations']) > 0):
+                for citation in response['citations']:
+                    write_file.write(citation + '\n')
+                write_file.write("\n")  # Blank line
+            # Write the actual content
+            write_file.write(response['text'])
+
+    '''
+    NewResult()
+    Function: - Builds the result dictionary returned for a request
+    '''
+    def NewResult(self, CON):
+        """
+        Returns a result dictionary for CON with status 'error' until the request succeeds.
+        """
+        return {'status': 'error', 'error': '', 'ai': CON.ai, 'model': CON.model, 'prompt': CON.prompt,
+                'output': '', 'url': CON.url, 'text': '', 'citations': [], 'usage': {}, 'elapsed': 0.0,
+                'cached': False, 'coalesced': False, 'ttft': 0.0, 'warning': ''}
+
+    '''
+    Prepare()
+    Function: - Resolves the provider, model, API key, output file, prompt and input for a request
+    '''
+    def Prepare(self, CON, result):
+        """
+        Resolves everything needed to send the request described by CON.
+
+        Args:
+            CON: Controller with ai, model, prompt, input/pipe, output and url set.
+            result: Result dictionary; model and output are filled in, or error on failure.
+
+        Returns:
+            dict: provider, apikey, system_input, user_input and the cache key, or None on error.
+        """
+        try:
+            provider = self.providers.get(CON.ai)
+        except Exception as e:
+            result['error'] = 'Unable to load AI provider ' + str(CON.ai) + ': ' + str(e)
+            return None
+        if (provider is None):
+            result['error'] = 'Unknown AI provider: ' + str(CON.ai)
+            return None
+
+        if (CON.model == ''):
+            CON.model = self.GetDefaultModel(CON)
+            result['model'] = CON.model
+        if (CON.model == ''):
+            result['error'] = 'No model specified and no default model configured for ' + CON.ai
+            return None
+
+        apikey = self.GetAPIKey(CON)
+        if (apikey == ''):
+            result['error'] = self.vendors[CON.ai] + ' apikey value not input.  Please add one to /opt/mainstay/mainstay.conf'
+            return None
+
+        if (len(CON.output) != 0):
+            result['output'] = CON.output
+        else:
+            result['output'] = CON.logroot + '/' + str(datetime.date.today()) + '.md'
+
+        try:
+            prompt = self.prompts.Get(CON.prompt)
+        except Exception as e:
+            result['error'] = 'Unable to find prompt file: ' + str(e)
+            return None
+
+        if (len(CON.input) != 0):
+            user_input = CON.input
+        else:
+            user_input = CON.pipe
+
+        return self.Request(CON, provider, apikey, prompt['text'], user_input, prompt['hash'])
+
+    '''
+    Request()
+    Function: - Builds the request dictionary for one provider call
+    '''
+    def Request(self, CON, provider, apikey, system_input, user_input, prompthash=None):
+        return {'provider': provider, 'apikey': apikey, 'system_input': system_input, 'user_input': user_input,
+                'key': self.cache.Key(CON.ai, CON.model, provider.params, system_input, user_input, prompthash, CON.conversational_history)}
+
+    '''
+    OverflowModel()
+    Function: - Returns the model configured to take input too large for the selected model
+    '''
+    def OverflowModel(self, CON):
+        """
+        Returns the overflowmodels entry for CON.ai from mainstay.conf ({"openai": "gpt-4.1", ...}, keyed like
+        defaultmodels), or an empty string if there is none.
+        """
+        return self.config.get('overflowmodels', {}).get(self.vendors.get(CON.ai), '')
+
+    '''
+    Preflight()
+    Function: - Checks a prepared request against the model's context window before it is sent
+    '''
+    def Preflight(self, CON, request, result):
+        """
+        Counts the tokens of a prepared request locally.  When it does not fit, the request is moved to the
+        provider's overflow model if one is configured and large enough.  Otherwise the input is left for the
+        chunker, or, with chunking off, a warning is recorded and the request is sent as is.
+
+        Returns:
+            tuple: (request, oversize) - the request to send, rebuilt if the model changed, and True when it
+                   still does not fit the model's context window.
+        """
+        if (self.chunker.Oversize(CON, request) == False):
+            return request, False
+
+        original = CON.model
+        overflow = self.OverflowModel(CON)
+        if ((overflow != '') and (overflow != original)):
+            CON.model = overflow
+            if (self.chunker.Oversize(CON, request) == False):
+                result['model'] = CON.model
+                result['warning'] = 'Input exceeds the context window of ' + original + ', sent to ' + CON.model + ' instead'
+                return self.Request(CON, request['provider'], request['apikey'], request['system_input'], request['user_input']), False
+            CON.model = original
+
+        if (CON.chunking == False):
+            tokens = self.tokens.Count(CON.ai, CON.model, request['user_input'])
+            result['warning'] = ('Input is about ' + str(tokens) + ' tokens, more than the ' + str(self.chunker.Budget(CON, request['system_input'])) +
+                                 ' available with ' + CON.model + '; sending it anyway because chunking is off')
+
+        return request, True
+
+    '''
+    Lookup()
+    Function: - Returns the cached response for a prepared request, if caching allows it
+    '''
+    def Lookup(self, CON, request):
+        """
+        Returns the cached response for a prepared request, or None on a miss or when --no-cache/--refresh is set.
+        """
+        if ((CON.nocache == True) or (CON.refresh == True)):
+            return None
+
+        response = self.cache.Get(request['key'])
+        if ((response is not None) and (CON.debug == True)):
+            print ('[DEBUG] Response cache hit: ' + request['key'])
+
+        return response
+
+    '''
+    Reservation()
+    Function: - Returns the tokens to reserve against the rate limit for a prepared request
+    '''
+    def Reservation(self, CON, request):
+        """
+        Returns the local token count of the prompt, the session's history and the input plus the expected output.
+        The difference from the actual usage is settled once the response arrives.
+        """
+        return (self.tokens.Count(CON.ai, CON.model, request['system_input']) + self.sessions.Tokens(CON) +
+                self.tokens.Count(CON.ai, CON.model, request['user_input']) + self.tokens.expectedoutput)
+
+    '''
+    Complete()
+    Function: - Returns the response to a prepared request from the cache or the provider
+    '''
+    def Complete(self, CON, request):
+        """
+        Answers one prepared request, from the response cache when allowed and otherwise from the provider under
+        its concurrency and rate limits, retrying transient failures.  New responses are stored in the cache unless
+        --no-cache is set.  When an identical request is already in flight, the caller waits for it and shares its
+        response, or its error, instead of sending another call; CON.coalesced is then set.
+
+        Returns:
+            tuple: (response, cached) - the response dictionary and True when it came from the cache.
+
+        Raises:
+            Exception: Any error raised by the provider.
+        """
+        response = self.Lookup(CON, request)
+        if (response is not None):
+            return response, True
+
+        response, shared = self.flights.Do(request['key'], lambda: self.Call(CON, request))
+        if (shared == True):
+            CON.coalesced = True
+            if (CON.debug == True):
+                print ('[DEBUG] Attached to an identical request already in flight: ' + request['key'])
+
+        return response, False
+
+    '''
+    Route()
+    Function: - Returns the response to a prepared request, failing over to the next provider while the provider is unhealthy
+    '''
+    def Route(self, CON, request, result):
+        """
+        Answers a prepared request like Complete().  When the call fails because the provider is unhealthy, or its
+        circuit breaker is open, the request is sent to the next healthy provider in defaultmodels instead, and
+        result's ai, model and warning are updated.  See router.Failover().  The moved request is checked against
+        the new model's context window by Preflight(), and is split into chunks if it no longer fits.
+
+        Returns:
+            tuple: (controller, response, cached) - the controller of the provider that answered, its response and
+                   True when it came from the cache.
+
+        Raises:
+            Exception: The first provider's error when no provider answered.
+        """
+        error = None
+
+        while True:
+            try:
+                response, cached = self.Complete(CON, request)
+                return CON, response, cached
+            except Exception as e:
+                error = e if (error is None) else error
+                NEXT = self.router.Failover(CON, e)
+                if (NEXT is None):
+                    raise error
+                nextrequest = self.Prepare(NEXT, result)
+                if (nextrequest is None):
+                    raise error
+                # The next provider's model may have a smaller context window than the first
+                nextrequest, oversize = self.Preflight(NEXT, nextrequest, result)
+                self.Failed(CON, NEXT, e, result)
+                CON, request = NEXT, nextrequest
+                if ((CON.chunking == True) and (oversize == True)):
+                    response = self.chunker.MapReduce(CON, request)
+                    result['chunks'] = response['chunks']
+                    return CON, response, False
+
+    '''
+    Failed()
+    Function: - Records in the result that a request moved to another provider
+    '''
+    def Failed(self, CON, NEXT, error, result):
+        result['ai'] = NEXT.ai
+        result['model'] = NEXT.model
+        warning = CON.ai + ' ' + CON.model + ' failed (' + str(error) + '), sent to ' + NEXT.ai + ' ' + NEXT.model + ' instead'
+        result['warning'] = warning if (result['warning'] == '') else result['warning'] + '; ' + warning
+
+    '''
+    Call()
+    Function: - Sends a prepared request to the provider and caches the response
+    '''
+    def Call(self, CON, request):
+        """
+        Sends one prepared request under the provider's concurrency and rate limits, retrying transient failures,
+        and stores the response in the cache unless --no-cache is set.  Complete() calls it at most once at a time
+        for the same cache key.  The concurrency slot is taken for each attempt, so a request waiting out a
+        backoff or the rate limit does not keep other requests from the provider.
+
+        Returns:
+            dict: The provider's response.
+
+        Raises:
+            circuitopen: When the breaker of the provider and model refuses calls.  See router.
+        """
+        self.router.Check(CON)
+        start = time.monotonic()
+        try:
+            response = self.limiter.Call(CON.ai, CON.model, self.Reservation(CON, request), lambda: self.Send(CON, request), CON.debug)
+        except Exception as e:
+            self.metrics.Call(CON.ai, CON.model, time.monotonic() - start, False)
+            self.router.Record(CON.ai, CON.model, time.monotonic() - start, e)
+            raise
+        self.metrics.Call(CON.ai, CON.model, time.monotonic() - start, True)
+        self.router.Record(CON.ai, CON.model, time.monotonic() - start)
+
+        if (CON.nocache == False):
+            self.cache.Put(request['key'], response)
+
+        return response
+
+    '''
+    Send()
+    Function: - Makes one attempt at a provider call under the provider's concurrency slot
+    '''
+    def Send(self, CON, request):
+        with self.slots[CON.ai], self.metrics.Inflight(CON.ai, CON.model):
+            return request['provider'].Query(CON, self.LOG, request['apikey'], request['system_input'], request['user_input'])
+
+    '''
+    Process()
+    Function: - Runs the prompt described by a populated controller
+              - Returns the response text and metadata to the caller
+    '''
+    def Process(self, CON):
+        """
+        Runs the prompt described by CON and writes the output file.
+
+        Args:
+            CON: Controller with ai, model, prompt, input/pipe, output and url set.
+
+        Returns:
+            dict: status ('ok' or 'error'), error, ai, model, prompt, output, url, text, citations,
+                  usage, elapsed (seconds), cached (True when served from the response cache) and
+                  ttft (seconds to the first token, only measured when streaming), coalesced (True when the
+                  response was shared with an identical request already in flight).  When the input was too
+                  large for the model and was processed in chunks, chunks holds the number of chunks.  When
+                  CON.hedge is set and the provider was called, hedge holds winner, model, fired and delay (see
+                  hedger.Race()), and ai and model are those of the provider that answered.  When CON.history names
+                  a session, the request is a turn of that session and session holds id, turn and compacted; see
+                  sessionstore.End().
+        """
+        start = time.monotonic()
+        result = self.sessions.Turn(CON, lambda: self.Answer(CON))
+        self.Record(CON, result, time.monotonic() - start)
+
+        return result
+
+    '''
+    Record()
+    Function: - Records an answered request in the metrics, the run log and the search index
+    '''
+    def Record(self, CON, result, seconds, stream=False):
+        input_text = CON.input if (len(CON.input) != 0) else CON.pipe
+        self.metrics.Result(result, seconds)
+        self.runlog.Write(self.runlog.Record(result, seconds, stream), input_text)
+        if ((stream == True) and (result['ttft'] > 0.0) and (result['cached'] == False) and (result['coalesced'] == False) and
+            ('chunks' not in result) and ('hedge' not in result)):
+            # Hedged requests record their own samples; these keep the hedge delay current for streamed requests
+            self.hedger.Observe(result['ai'], result['model'], result['ttft'])
+        if (result['status'] == 'ok'):
+            self.search.Add(result['output'], '\n'.join([result['text']] + result['citations']), result['url'], result['prompt'],
+                            result['model'], result['ai'], input_text)
+
+    '''
+    Answer()
+    Function: - Answers the prompt described by a populated controller without recording metrics
+    '''
+    def Answer(self, CON):
+        """
+        Does the work of Process(), which records the result in the metrics and the run log.  Stream() calls it
+        directly for chunked input so that the request is recorded once.
+        """
+        result = self.NewResult(CON)
+        start = time.monotonic()
+
+        request = self.Prepare(CON, result)
+        if (request is None):
+            return result
+
+        request, oversize = self.Preflight(CON, request, result)
+
+        try:
+            if ((CON.chunking == True) and (oversize == True)):
+                response = self.chunker.MapReduce(CON, request)
+                result['chunks'] = response['chunks']
+            elif (CON.hedge == True):
+                response = self.Lookup(CON, request)
+                result['cached'] = (response is not None)
+                if (response is None):
+                    response, result['hedge'] = self.hedger.Race(CON, request)
+                    result['ai'] = result['hedge']['winner']
+                    result['model'] = result['hedge']['model']
+            else:
+                CON, response, result['cached'] = self.Route(CON, request, result)
+            result['coalesced'] = CON.coalesced
+        except Exception as e:
+            result['error'] = 'Unable to complete task: ' + str(e)
+            return result
+
+        result['text'] = response['text']
+        result['citations'] = response['citations']
+        result['usage'] = response['usage']
+
+        try:
+            self.WriteOutput(result['output'], CON.url, response)
+        except Exception as e:
+            result['error'] = 'Unable to complete task: ' + str(e)
+            return result
+
+        result['status'] = 'ok'
+        result['elapsed'] = time.monotonic() - start
+
+        return result
+
+    '''
+    Stream()
+    Function: - Runs the prompt described by a populated controller, yielding tokens as they arrive
+              - Appends each token to the output file as it is received
+    '''
+    def Stream(self, CON):
+        """
+        Streams the response to the prompt described by CON.  The output file header is written first and each
+        token is appended and flushed as it arrives.  Citations, which Perplexity only sends once the answer is
+        complete, are written after the content.
+
+        Args:
+            CON: Controller with ai, model, prompt, input/pipe, output and url set.
+
+        Yields:
+            dict: {'event': 'token', 'text': <delta>} for each piece of the response, then a single
+                  {'event': 'done', 'result': <result dictionary, see Process()>}.
+        """
+        start = time.monotonic()
+        for event in self.sessions.StreamTurn(CON, lambda: self.Streaming(CON)):
+            if (event['event'] == 'done'):
+                self.Record(CON, event['result'], time.monotonic() - start, stream=True)
+            yield event
+
+    '''
+    Streaming()
+    Function: - Streams the prompt described by a populated controller without recording metrics
+    '''
+    def Streaming(self, CON):
+        """
+        Does the work of Stream(), which records the result in the metrics and the run log once the done event is
+        yielded.
+        """
+        result = self.NewResult(CON)
+        start = time.monotonic()
+
+        request = self.Prepare(CON, result)
+        if (request is None):
+            yield {'event': 'done', 'result': result}
+            return
+
+        request, oversize = self.Preflight(CON, request, result)
+
+        if (((CON.chunking == True) and (oversize == True)) or (CON.hedge == True)):
+            # The merged answer only exists once every chunk is done, and a hedged answer is not known until one
+            # side finishes, so there is nothing to stream before then
+            result = self.Answer(CON)
+            if (result['status'] == 'ok'):
+                result['ttft'] = result['elapsed']
+                yield {'event': 'token', 'text': result['text']}
+            yield {'event': 'done', 'result': result}
+            return
+
+        response = self.Lookup(CON, request)
+        leading = None#flight this caller sends the provider call for
+        following = None#flight of an identical request already in progress
+        calling = None#time the provider call started, until it is recorded in the metrics
+        if (response is None):
+            current, leader = self.flights.Begin(request['key'])
+            if (leader == True):
+                leading = current
+            else:
+                following = current
+
+        try:
+            with open(result['output'], "w", encoding='utf-8') as write_file:
+                # Write header lines
+                write_file.write("\n")  # Blank line
+                write_file.write(f"URL: {CON.url}\n")  # URL line - populated with actual URL if available
+                write_file.write("TAGS: \n")  # Tags line
+                write_file.write("\n")  # Another blank line
+                write_file.flush()
+
+                if (following is not None):
+                    # An identical request is already in flight; its whole response arrives at once
+                    response = following.Wait()
+                    result['coalesced'] = True
+                    result['ttft'] = time.monotonic() - start
+                    write_file.write(response['text'])
+                    yield {'event': 'token', 'text': response['text']}
+                elif (response is not None):
+                    result['cached'] = True
+                    result['ttft'] = time.monotonic() - start
+                    write_file.write(response['text'])
+                    yield {'event': 'token', 'text': response['text']}
+                else:
+                    self.router.Check(CON)
+                    reserved = self.Reservation(CON, request)
+                    attempt = 0
+                    calling = time.monotonic()
+                    while True:
+                        self.limiter.Acquire(CON.ai, CON.model, reserved)
+                        try:
+                            # The slot is held while the response streams, but not across the backoff below
+                            with self.slots[CON.ai], self.metrics.Inflight(CON.ai, CON.model):
+                                for chunk in request['provider'].Stream(CON, self.LOG, request['apikey'], request['system_input'], request['user_input']):
+                                    if ('response' in chunk):
+                                        response = chunk['response']
+                                        continue
+                                    if (result['ttft'] == 0.0):
+                                        result['ttft'] = time.monotonic() - start
+                                    write_file.write(chunk['text'])
+                                    write_file.flush()
+                                    yield {'event': 'token', 'text': chunk['text']}
+                            break
+                        except Exception as e:
+                            # Once tokens have been passed on the call cannot be replayed, and the provider has
+                            # charged for it, so only an attempt that sent nothing gives its reservation back
+                            delay = None
+                            if (result['ttft'] == 0.0):
+                                self.limiter.Refund(CON.ai, CON.model, reserved)
+                                delay = self.limiter.Backoff(CON.ai, CON.model, e, attempt)
+                            if (delay is None):
+                                raise
+                            attempt += 1
+                            time.sleep(delay)
+                    self.limiter.Settle(CON.ai, CON.model, reserved, response['usage'])
+                    self.metrics.Call(CON.ai, CON.model, time.monotonic() - calling, True)
+                    self.router.Record(CON.ai, CON.model, time.monotonic() - calling)
+                    calling = None
+
+                    if (CON.nocache == False):
+                        self.cache.Put(request['key'], response)
+                    self.flights.End(request['key'], leading, value=response)
+                    leading = None
+
+                if (len(response['citations']) > 0):
+                    write_file.write("\n\n")
+                    for citation in response['citations']:
+                        write_file.write(citation + '\n')
+        except Exception as e:
+            if (calling is not None):
+                self.metrics.Call(CON.ai, CON.model, time.monotonic() - calling, False)
+                self.router.Record(CON.ai, CON.model, time.monotonic() - calling, e)
+                calling = None
+            if (leading is not None):
+                self.flights.End(request['key'], leading, error=e)
+                leading = None
+            # Nothing has been passed on before the first token, so the request can still move to another provider
+            NEXT = self.router.Failover(CON, e) if (result['ttft'] == 0.0) else None
+            if (NEXT is not None):
+                for event in self.Streaming(NEXT):
+                    if (event['event'] == 'done'):
+                        self.Failed(CON, NEXT, e, event['result'])
+                    yield event
+                return
+            result['error'] = 'Unable to complete task: ' + str(e)
+            yield {'event': 'done', 'result': result}
+            return
+        finally:
+            # Reached with leading set only when the caller stopped reading mid-stream
+            if (leading is not None):
+                self.flights.End(request['key'], leading, error=Exception('the identical request it was attached to was abandoned'))
+
+        result['text'] = response['text']
+        result['citations'] = response['citations']
+        result['usage'] = response['usage']
+        result['status'] = 'ok'
+        result['elapsed'] = time.monotonic() - start
+
+        yield {'event': 'done', 'result': result}
+
+    '''
+    Run()
+    Function: - Runs a prompt from explicit arguments
+              - Intended for callers that import Mainstay, such as neomainstay
+    '''
+    def Run(self, input_text, prompt, ai='', model='', output='', url='', debug=False, nocache=False, refresh=False, chunking=True, hedge=False, session=''):
+        """
+        Runs a prompt against an AI provider in-process.
+
+        Args:
+            input_text: The text to send to the AI.
+            prompt: Name of the prompt file (without .md).
+            ai: chatgpt, perplexity or claude.  The configured default is used when empty.
+            model: Model to use.  The configured default for the AI is used when empty.
+            output: Output file path.  logroot/<date>.md is used when empty.
+            url: URL the input was fetched from, if any.
+            debug: Enables debug printing in the provider.
+            nocache: Neither read nor write the response cache.
+            refresh: Skip the cached response but store the new one.
+            chunking: Split input too large for the model's context window and merge the results.  When False
+                      such input is sent as is and the provider rejects it.
+            hedge: Also send the request to the next provider in defaultmodels if the first is slow to answer,
+                   and keep whichever answer finishes first.  See hedger.Race().
+            session: ID of the session the request continues.  Its earlier turns are sent before input_text and
+                     the answer is added to it.  See sessionstore.
+
+        Returns:
+            dict: See Process().
+        """
+        CON = self.NewController(input_text, prompt, ai, model, output, url, debug, nocache, refresh, chunking, hedge, session)
+
+        return self.Process(CON)
+
+    '''
+    RunStream()
+    Function: - Streams a prompt from explicit arguments
+    '''
+    def RunStream(self, input_text, prompt, ai='', model='', output='', url='', debug=False, nocache=False, refresh=False, chunking=True, hedge=False, session=''):
+        """
+        Streaming counterpart of Run().  Takes the same arguments and yields the events described in Stream().
+        """
+        CON = self.NewController(input_text, prompt, ai, model, output, url, debug, nocache, refresh, chunking, hedge, session)
+
+        return self.Stream(CON)
+
+    '''
+    RunMany()
+    Function: - Runs several prompts concurrently on the engine's worker pool
+              - Returns the results in the order the jobs were given
+    '''
+    def RunMany(self, jobs):
+        """
+        Runs a list of jobs concurrently.  The pool bounds the total number of jobs in flight and each
+        provider's semaphore bounds the calls made to that provider.
+
+        Args:
+            jobs: List of dictionaries holding the keyword arguments for Run().
+
+        Returns:
+            list: One result dictionary per job, in the same order as jobs.
+        """
+        results = []
+        futures = [self.pool.submit(self.Run, **job) for job in jobs]
+
+        for job, future in zip(jobs, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append({'status': 'error', 'error': 'Unable to complete task: ' + str(e), 'ai': job.get('ai', ''),
+                                'model': job.get('model', ''), 'prompt': job.get('prompt', ''), 'output': job.get('output', ''),
+                                'url': job.get('url', ''), 'text': '', 'citations': [], 'usage': {}, 'elapsed': 0.0})
+
+        return results
+
+    '''
+    Command()
+    Function: - Runs a command line request that needs the engine and returns its exit code
+    '''
+    def Command(self, CON, LOG):
+        """
+        Runs --listmodels, --estimate, --batch or a prompt for a controller populated by mainstay.py, either in the
+        mainstay.py process or in the daemon it forwarded the command to.
+
+        Args:
+            CON: Controller object populated by mainstay.py.
+            LOG: Logger object for colored output.
+
+        Returns:
+            int: The exit code for mainstay.py.
+        """
+        if (CON.listmodels == True):
+            if (CON.ai == 'chatgpt'):
+                self.providers['chatgpt'].ListModels(CON, LOG)
+            elif (CON.ai == 'perplexity'):
+                self.providers['perplexity'].ListModels(CON, LOG)
+            else:
+                self.providers['claude'].ListModels(CON, LOG)
+            return 0
+
+        if (CON.estimate == True):
+            ret = self.ExecuteEstimate(CON, LOG)
+            print ('')
+            print (LOG.colored('[*] Program Complete', 'echoinfo', bold=True))
+            return ret
+
+        if (CON.batch != ''):
+            if (CON.batchapi == True):
+                from batchapi import batchapi
+                ret = batchapi(self).Execute(CON, LOG)
+            else:
+                from batch import batch
+                ret = batch(self).Execute(CON, LOG)
+            self.SaveState()
+            print ('')
+            print (LOG.colored('[*] Program Complete', 'echoinfo', bold=True))
+            return ret
+
+        print ('[*] Current working directory is: ' + CON.CWP)
+
+        #if (CON.logger.strip() == 'true'): 
+        #    CON.logging = True
+        #    print ('[*] Logger is active')
+        #else:
+        #    print ('[-] Logger not active')#    
+
+        if (CON.ai == 'chatgpt'):
+            print ('[*] Executing with ChatGPT...\r')
+        elif (CON.ai == 'perplexity'):
+            print ('[*] Executing with Perplexity...\r')
+        else:
+            print ('[*] Executing with Claude...\r')
+            CON.ai = 'claude'
+
+        self.Execute(CON, LOG)
+
+        print ('')
+        print (LOG.colored('[*] Program Complete', 'echoinfo', bold=True))
+
+        return 0
+
+    '''
+    Execute()
+    Function: - Runs the prompt for the CLI and renders the result to the console
+    '''
+    def Execute(self, CON, LOG):
+        """
+        Runs the prompt described by the CLI controller, renders the response and reports the output file.
+
+        Args:
+            CON: Controller object populated by mainstay.py.
+            LOG: Logger object for colored output.
+
+        Returns:
+            int: 0 on success, -1 on error.
+        """
+        print ('[*] Model is: ' + CON.model + '\r\n')
+
+        if (CON.stream == True):
+            return self.ExecuteStream(CON, LOG)
+
+        result = self.Process(CON)
+        self.SaveState()
+
+        if (result['warning'] != ''):
+            print (LOG.colored('[-] ' + result['warning'], 'echowarning', bold=True))
+        if (result['status'] != 'ok'):
+            print (LOG.colored('[x] ' + result['error'], 'echoerror', bold=True))
+            return -1
+
+        # rich is only needed once there is something to render
+        from rich.console import Console
+        from rich.markdown import Markdown
+
+        console = Console()
+        if (result['cached'] == True):
+            print (LOG.colored('[*] Response served from cache', 'echoinfo', bold=True))
+        elif (result['usage'].get('cache_read_tokens', 0) > 0):
+            print (LOG.colored('[*] ' + str(result['usage']['cache_read_tokens']) + ' prompt tokens read from the provider\'s prompt cache', 'echoinfo', bold=True))
+        if (CON.debug == True):
+            print ('[DEBUG] Response cache: ' + str(self.cache.Stats()))
+        if (('hedge' in result) and (result['hedge']['fired'] == True)):
+            print (LOG.colored('[*] No answer from ' + CON.ai + ' within ' + str(result['hedge']['delay']) + 's, request hedged; answered by ' +
+                               result['ai'] + ' ' + result['model'], 'echoinfo', bold=True))
+        if ('session' in result):
+            self.SessionInfo(result, LOG)
+        if ('chunks' in result):
+            print (LOG.colored('[*] Input exceeded the context window of ' + CON.model + ' and was processed in ' + str(result['chunks']) + ' chunks', 'echoinfo', bold=True))
+        print (LOG.colored('[*] Prompt response...\r\n', 'echoinfo', bold=True))
+        for citation in result['citations']:
+            console.print(Markdown(citation))
+        console.print(Markdown(result['text']))
+
+        print (LOG.colored('\r\n[*] Prompt response has been written to file here: ', 'echoinfo', bold=True) + LOG.colored(result['output'], 'echolink', bold=True))
+
+        return 0
+
+    '''
+    ExecuteStream()
+    Function: - Streams the prompt for the CLI, printing tokens as they arrive
+    '''
+    def ExecuteStream(self, CON, LOG):
+        """
+        Streaming counterpart of Execute().  Tokens are printed as plain text as they arrive rather than rendered
+        as markdown, since the markdown is not complete until the stream ends.
+
+        Returns:
+            int: 0 on success, -1 on error.
+        """
+        result = None
+        started = False
+
+        for event in self.Stream(CON):
+            if (event['event'] == 'done'):
+                result = event['result']
+                break
+            if (started == False):
+                print (LOG.colored('[*] Prompt response...\r\n', 'echoinfo', bold=True))
+                started = True
+            sys.stdout.write(event['text'])
+            sys.stdout.flush()
+
+        print ('')
+        self.SaveState()
+
+        if (result['warning'] != ''):
+            print (LOG.colored('[-] ' + result['warning'], 'echowarning', bold=True))
+        if (result['status'] != 'ok'):
+            print (LOG.colored('[x] ' + result['error'], 'echoerror', bold=True))
+            return -1
+
+        for citation in result['citations']:
+            print (citation)
+
+        if (result['cached'] == True):
+            print (LOG.colored('[*] Response served from cache', 'echoinfo', bold=True))
+        elif (result['usage'].get('cache_read_tokens', 0) > 0):
+            print (LOG.colored('[*] ' + str(result['usage']['cache_read_tokens']) + ' prompt tokens read from the provider\'s prompt cache', 'echoinfo', bold=True))
+        if ('session' in result):
+            self.SessionInfo(result, LOG)
+        if (CON.debug == True):
+            print ('[DEBUG] Time to first token: ' + str(round(result['ttft'], 3)) + 's, total: ' + str(round(result['elapsed'], 3)) + 's')
+
+        print (LOG.colored('\r\n[*] Prompt response has been written to file here: ', 'echoinfo', bold=True) + LOG.colored(result['output'], 'echolink', bold=True))
+
+        return 0
+
+    '''
+    SessionInfo()
+    Function: - Prints the session a CLI request was a turn of
+    '''
+    def SessionInfo(self, result, LOG):
+        session = result['session']
+        line = '[*] Turn ' + str(session['turn']) + ' of session ' + session['id']
+        if (session['compacted'] > 0):
+            line += ' (' + str(session['compacted']) + ' earlier turn(s) compacted into a summary)'
+        print (LOG.colored(line, 'echoinfo', bold=True))
+
+    '''
+    Estimate()
+    Function: - Estimates the tokens, cost and duration of a request without sending it
+    '''
+    def Estimate(self, CON):
+        """
+        Sizes the request described by CON from local token counts and the model tables.  No provider is loaded
+        and no network call is made.
+
+        Args:
+            CON: Controller with ai, model, prompt and input/pipe set.
+
+        Returns:
+            dict: status ('ok' or 'error'), error, ai, model, prompt, prompt_tokens, input_tokens, context_limit,
+                  history_tokens (the session's history, counted with the prompt in prompt_tokens), budget (input
+                  tokens that fit), fits, routed (the overflow model used, if any), chunks, calls,
+                  input_tokens_total, output_tokens_total, cost (USD, None when the price is unknown), latency
+                  (seconds), counter (the encoding used, or 'estimate') and warning.
+        """
+        estimate = {'status': 'error', 'error': '', 'ai': CON.ai, 'model': CON.model, 'prompt': CON.prompt, 'prompt_tokens': 0,
+                    'history_tokens': 0, 'input_tokens': 0, 'context_limit': 0, 'budget': 0, 'fits': False, 'routed': '', 'chunks': 0, 'calls': 0,
+                    'input_tokens_total': 0, 'output_tokens_total': 0, 'cost': None, 'latency': 0.0, 'counter': '', 'warning': ''}
+
+        if (CON.ai not in self.providers):
+            estimate['error'] = 'Unknown AI provider: ' + str(CON.ai)
+            return estimate
+
+        if (CON.model == ''):
+            CON.model = self.GetDefaultModel(CON)
+        if (CON.model == ''):
+            estimate['error'] = 'No model specified and no default model configured for ' + CON.ai
+            return estimate
+
+        try:
+            prompt = self.prompts.Get(CON.prompt)
+        except Exception as e:
+            estimate['error'] = 'Unable to find prompt file: ' + str(e)
+            return estimate
+
+        if (CON.history != ''):
+            try:
+                CON.conversational_history = self.sessions.Messages(self.sessions.Load(CON.history))
+            except Exception as e:
+                estimate['error'] = 'Unable to open session ' + CON.history + ': ' + str(e)
+                return estimate
+
+        if (len(CON.input) != 0):
+            user_input = CON.input
+        else:
+            user_input = CON.pipe
+
+        prompt_tokens = self.tokens.Count(CON.ai, CON.model, prompt['text'], prompt['hash']) + self.sessions.Tokens(CON)
+        input_tokens = self.tokens.Count(CON.ai, CON.model, user_input)
+        budget = self.tokens.Budget(CON.ai, CON.model, prompt_tokens)
+
+        overflow = self.OverflowModel(CON)
+        if ((input_tokens > budget) and (overflow != '') and (overflow != CON.model)):
+            routed_prompt = (self.tokens.Count(CON.ai, overflow, prompt['text'], prompt['hash']) +
+                             self.sessions.Tokens(self.NewController(ai=CON.ai, model=overflow), CON.conversational_history))
+            routed_input = self.tokens.Count(CON.ai, overflow, user_input)
+            if (routed_input <= self.tokens.Budget(CON.ai, overflow, routed_prompt)):
+                estimate['routed'] = overflow
+                CON.model = overflow
+                prompt_tokens = routed_prompt
+                input_tokens = routed_input
+                budget = self.tokens.Budget(CON.ai, CON.model, prompt_tokens)
+
+        output = self.tokens.expectedoutput
+        estimate.update({'model': CON.model, 'prompt_tokens': prompt_tokens, 'history_tokens': self.sessions.Tokens(CON), 'input_tokens': input_tokens,
+                         'context_limit': self.tokens.ContextLimit(CON.ai, CON.model), 'budget': budget,
+                         'fits': (input_tokens <= budget), 'counter': self.tokens.EncodingName(CON.ai, CON.model)})
+        if (self.tokens.Encoding(estimate['counter']) is None):
+            estimate['counter'] = 'estimate'
+
+        if ((estimate['fits'] == True) or (CON.chunking == False) or (budget <= 0)):
+            estimate['chunks'] = 1
+            estimate['calls'] = 1
+            estimate['input_tokens_total'] = prompt_tokens + input_tokens
+            estimate['output_tokens_total'] = output
+            estimate['latency'] = self.tokens.Latency(CON.ai, prompt_tokens + input_tokens, output)
+            if (estimate['fits'] == False):
+                estimate['warning'] = ('Input is about ' + str(input_tokens) + ' tokens, more than the ' + str(max(budget, 0)) +
+                                       ' available with ' + CON.model + ' and the provider is likely to reject it')
+        else:
+            # Map step: every chunk carries the prompt, and at most concurrency chunks run at once
+            chunks = int(math.ceil(input_tokens / float(budget)))
+            waves = int(math.ceil(chunks / float(self.concurrency.get(CON.ai, 4))))
+            estimate['chunks'] = chunks
+            estimate['calls'] = chunks
+            estimate['input_tokens_total'] = input_tokens + chunks * prompt_tokens
+            estimate['output_tokens_total'] = chunks * output
+            estimate['latency'] = waves * self.tokens.Latency(CON.ai, prompt_tokens + budget, output)
+            # Reduce step: partial answers are merged in groups until one remains
+            partials = chunks
+            while True:
+                merged = partials * output
+                groups = max(int(math.ceil(merged / float(budget))), 1)
+                estimate['calls'] += groups
+                estimate['input_tokens_total'] += merged + groups * prompt_tokens
+                estimate['output_tokens_total'] += groups * output
+                estimate['latency'] += self.tokens.Latency(CON.ai, prompt_tokens + min(merged, budget), output)
+                if (groups == 1):
+                    break
+                partials = groups
+
+        estimate['cost'] = self.tokens.Cost(CON.model, estimate['input_tokens_total'], estimate['output_tokens_total'])
+        estimate['status'] = 'ok'
+
+        return estimate
+
+    '''
+    ExecuteEstimate()
+    Function: - Prints the estimate for the CLI --estimate dry run
+    '''
+    def ExecuteEstimate(self, CON, LOG):
+        """
+        Prints the size, cost and expected duration of the request described by the CLI controller.  Nothing is
+        sent to the provider.
+
+        Returns:
+            int: 0 on success, -1 on error.
+        """
+        estimate = self.Estimate(CON)
+        self.SaveState()
+
+        if (estimate['status'] != 'ok'):
+            print (LOG.colored('[x] ' + estimate['error'], 'echoerror', bold=True))
+            return -1
+
+        print (LOG.colored('[*] Estimate for ' + CON.prompt + ' with ' + CON.ai + ' ' + CON.model + ' (no request sent)...\r\n', 'echoinfo', bold=True))
+        if (estimate['routed'] != ''):
+            print ('[-] Input too large for the selected model, would be sent to: ' + estimate['routed'])
+        print ('[-] Prompt tokens: ' + str(estimate['prompt_tokens']))
+        if (CON.history != ''):
+            print ('[-] Of which session history: ' + str(estimate['history_tokens']))
+        print ('[-] Input tokens: ' + str(estimate['input_tokens']))
+        print ('[-] Context window: ' + str(estimate['context_limit']) + ' (' + str(max(estimate['budget'], 0)) + ' available for input)')
+        if (estimate['chunks'] > 1):
+            print ('[-] Input would be split into ' + str(estimate['chunks']) + ' chunks, ' + str(estimate['calls']) + ' calls in total')
+        print ('[-] Expected tokens: ' + str(estimate['input_tokens_total']) + ' input, ' + str(estimate['output_tokens_total']) + ' output')
+        if (estimate['cost'] is None):
+            print ('[-] Expected cost: unknown, no price configured for ' + CON.model)
+        else:
+            print ('[-] Expected cost: $' + format(estimate['cost'], '.4f'))
+        print ('[-] Expected latency: ' + str(round(estimate['latency'], 1)) + 's')
+        print ('[-] Token counts from: ' + estimate['counter'])
+        if (estimate['warning'] != ''):
+            print (LOG.colored('[-] ' + estimate['warning'], 'echowarning', bold=True))
+
+        return 0
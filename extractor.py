@@ -0,0 +1,369 @@
+'''
+Mainstay v0.4 - Copyright 2025 James Slaughter,
+This file is part of Mainstay v0.4.
+
+Mainstay v0.4 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Mainstay v0.4 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Mainstay v0.4.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+"""
+extractor.py - Main-content extraction from HTML for Mainstay v0.4
+
+This module turns a fetched web page into the compact markdown of its main content before it is sent to the AI.
+Scripts, styles, navigation, headers, footers, sidebars and similar boilerplate are dropped.  The article is
+located from <article>/<main> when the page marks it, and otherwise from the element holding the most paragraph
+text.  Headings, paragraphs, lists, quotes, tables and preformatted blocks are kept as markdown.  Link targets and
+images are dropped.  Only the standard library HTML parser is used.
+
+Classes:
+    node: One element of the parsed page.
+    extractor: Parses a page, picks the main content and renders it as markdown.
+
+Copyright 2025 James Slaughter. Licensed under GPL v3 or later.
+"""
+
+#python imports
+import re
+from html.parser import HTMLParser
+
+'''
+node
+Class: This class is responsible for holding one element of a parsed page
+'''
+class node:
+    """
+    The node class holds an element's tag, attributes, parent and children.  Children are nodes or strings.
+    """
+    def __init__(self, tag, attrs, parent):
+        self.tag = tag
+        self.attrs = attrs
+        self.parent = parent
+        self.children = []
+        self.length = 0#characters of text inside the element, set by extractor.Measure()
+        self.depth = (parent.depth + 1) if (parent is not None) else 0
+
+'''
+extractor
+Class: This class is responsible for extracting the main content of a page as markdown
+'''
+class extractor(HTMLParser):
+    """
+    The extractor class builds a simple element tree with HTMLParser and renders the main content from it.  One
+    instance parses one page; use Extract() for a single call.
+    """
+    void = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param', 'source', 'track', 'wbr'}
+    # <form> is kept because some sites wrap the whole page in one; its controls are dropped instead
+    dropped = {'script', 'style', 'noscript', 'template', 'svg', 'canvas', 'iframe', 'object', 'button', 'select',
+               'textarea', 'nav', 'footer', 'aside', 'head', 'dialog'}
+    droppedroles = {'navigation', 'banner', 'contentinfo', 'complementary', 'search', 'dialog', 'menu', 'menubar'}
+    boilerplate = re.compile(r'(^|[\s_-])(nav|navbar|menu|sidebar|footer|comments?|share|sharing|social|cookies?|'
+                             r'banner|ads?|advert\w*|promo\w*|related|breadcrumbs?|subscribe|newsletter|popup|modal|'
+                             r'skip-link|sponsor\w*)([\s_-]|$)', re.IGNORECASE)
+    # An open element with one of these tags is closed by the start of the listed tags, as browsers do
+    implied = {'p': {'p', 'div', 'ul', 'ol', 'pre', 'blockquote', 'table', 'section', 'article', 'h1', 'h2', 'h3', 'h4',
+                     'h5', 'h6', 'hr', 'dl', 'figure', 'header', 'footer', 'nav', 'aside', 'form', 'main'},
+               'li': {'li'}, 'dt': {'dt', 'dd'}, 'dd': {'dt', 'dd'}, 'tr': {'tr'}, 'td': {'td', 'th', 'tr'},
+               'th': {'td', 'th', 'tr'}, 'option': {'option'}}
+    maxdepth = 200#deeper elements are flattened into their ancestor so rendering stays within the recursion limit
+    blocks = {'p', 'div', 'section', 'article', 'main', 'body', 'html', 'figure', 'figcaption', 'details', 'summary',
+              'dl', 'dt', 'dd', 'address', 'center'}
+
+    '''
+    Constructor
+    '''
+    def __init__(self):
+        HTMLParser.__init__(self, convert_charrefs=True)
+        self.root = node('document', {}, None)
+        self.current = self.root
+        self.title = ''
+        self.intitle = False
+
+    def handle_starttag(self, tag, attrs):
+        if (tag == 'title'):
+            self.intitle = True
+        while ((self.current.parent is not None) and (tag in self.implied.get(self.current.tag, ()))):
+            self.current = self.current.parent
+        element = node(tag, dict((name, value or '') for name, value in attrs), self.current)
+        self.current.children.append(element)
+        if ((tag not in self.void) and (element.depth < self.maxdepth)):
+            self.current = element
+
+    def handle_startendtag(self, tag, attrs):
+        self.current.children.append(node(tag, dict((name, value or '') for name, value in attrs), self.current))
+
+    def handle_endtag(self, tag):
+        if (tag == 'title'):
+            self.intitle = False
+        # Close the nearest open element with this tag, and any left open inside it; stray end tags are ignored
+        element = self.current
+        while ((element is not None) and (element.tag != tag)):
+            element = element.parent
+        if ((element is not None) and (element.parent is not None)):
+            self.current = element.parent
+
+    def handle_data(self, data):
+        if (self.intitle == True):
+            self.title += data
+        self.current.children.append(data)
+
+    '''
+    Boilerplate()
+    Function: - Returns True for elements that are never part of the main content
+    '''
+    def Boilerplate(self, element):
+        if (element.tag in self.dropped):
+            return True
+        # A page's <header> is its banner, but an article's <header> holds its title and byline
+        if ((element.tag == 'header') and (self.InArticle(element) == False)):
+            return True
+        if (element.attrs.get('role', '').lower() in self.droppedroles):
+            return True
+        if (('hidden' in element.attrs) or (element.attrs.get('aria-hidden', '') == 'true')):
+            return True
+        if (re.search(r'display\s*:\s*none', element.attrs.get('style', ''), re.IGNORECASE)):
+            return True
+        # Never drop the article itself because of its class or ID
+        if (element.tag in ('article', 'main', 'body', 'html')):
+            return False
+        return (self.boilerplate.search(element.attrs.get('class', '') + ' ' + element.attrs.get('id', '')) is not None)
+
+    '''
+    InArticle()
+    Function: - Returns True if an element is inside an <article>, <main> or role="main" element
+    '''
+    def InArticle(self, element):
+        parent = element.parent
+        while (parent is not None):
+            if ((parent.tag in ('article', 'main')) or (parent.attrs.get('role', '').lower() == 'main')):
+                return True
+            parent = parent.parent
+        return False
+
+    '''
+    Prune()
+    Function: - Removes boilerplate elements from the tree
+    '''
+    def Prune(self, element):
+        kept = []
+        for child in element.children:
+            if (isinstance(child, node)):
+                if (self.Boilerplate(child) == True):
+                    continue
+                self.Prune(child)
+            kept.append(child)
+        element.children = kept
+
+    '''
+    Text()
+    Function: - Returns the plain text inside an element
+    '''
+    def Text(self, element):
+        parts = []
+        for child in element.children:
+            if (isinstance(child, node)):
+                parts.append(self.Text(child))
+            else:
+                parts.append(child)
+        return ''.join(parts)
+
+    '''
+    Measure()
+    Function: - Records the length of the text inside every element
+    '''
+    def Measure(self, element):
+        """
+        Sets length on element and every element below it to the number of non-blank characters of text they
+        hold, and returns a list of all of those elements.
+        """
+        found = []
+        element.length = 0
+        for child in element.children:
+            if (isinstance(child, node)):
+                found.append(child)
+                found.extend(self.Measure(child))
+                element.length += child.length
+            else:
+                element.length += len(''.join(child.split()))
+        return found
+
+    '''
+    MainContent()
+    Function: - Picks the element holding the main content of the page
+    '''
+    def MainContent(self):
+        """
+        Returns the longest <article>, <main> or role="main" element when the page has one.  Otherwise each
+        paragraph's text length is credited to its parent and half of it to its grandparent, and the highest
+        scoring element wins, as long as it holds at least a third of the page's text.  The whole page is used
+        when no element does.
+        """
+        elements = self.Measure(self.root)
+        total = self.root.length
+
+        marked = [element for element in elements if ((element.tag in ('article', 'main')) or (element.attrs.get('role', '').lower() == 'main'))]
+        if (len(marked) > 0):
+            best = max(marked, key=lambda element: element.length)
+            if (best.length * 3 >= total):
+                return best
+
+        scores = {}
+        for element in elements:
+            if (element.tag not in ('p', 'pre', 'blockquote', 'li')):
+                continue
+            length = element.length
+            if (length < 25):
+                continue
+            parent = element.parent
+            if (parent is not None):
+                scores[id(parent)] = (scores.get(id(parent), (0, parent))[0] + length, parent)
+                if (parent.parent is not None):
+                    grandparent = parent.parent
+                    scores[id(grandparent)] = (scores.get(id(grandparent), (0, grandparent))[0] + length / 2.0, grandparent)
+
+        if (len(scores) > 0):
+            score, best = max(scores.values(), key=lambda entry: entry[0])
+            if (best.length * 3 >= total):
+                return best
+
+        return self.root
+
+    '''
+    Markdown()
+    Function: - Renders an element as markdown
+    '''
+    def Markdown(self, element, depth=0):
+        parts = []
+        number = 0
+
+        for child in element.children:
+            if (not isinstance(child, node)):
+                parts.append(re.sub(r'\s+', ' ', child))
+                continue
+
+            tag = child.tag
+            if (tag in ('h1', 'h2', 'h3', 'h4', 'h5', 'h6')):
+                heading = ' '.join(self.Text(child).split())
+                if (heading != ''):
+                    parts.append('\n\n' + '#' * int(tag[1]) + ' ' + heading + '\n\n')
+            elif (tag in ('ul', 'ol')):
+                parts.append('\n\n' + self.Markdown(child, depth + 1) + '\n\n')
+            elif (tag == 'li'):
+                number += 1
+                marker = (str(number) + '. ') if (element.tag == 'ol') else '- '
+                # Nested lists follow the item on their own lines, indented one level further
+                inline = node('span', {}, child)
+                inline.children = [part for part in child.children if (not (isinstance(part, node) and (part.tag in ('ul', 'ol'))))]
+                item = ' '.join(self.Markdown(inline, depth).split())
+                if (item != ''):
+                    parts.append('\n' + '  ' * max(depth - 1, 0) + marker + item)
+                for part in child.children:
+                    if (isinstance(part, node) and (part.tag in ('ul', 'ol'))):
+                        parts.append(self.Markdown(part, depth + 1))
+            elif (tag == 'pre'):
+                code = self.Text(child).strip('\n')
+                if (code.strip() != ''):
+                    parts.append('\n\n```\n' + code + '\n```\n\n')
+            elif (tag == 'blockquote'):
+                quote = self.Markdown(child, depth).strip()
+                if (quote != ''):
+                    parts.append('\n\n' + '\n'.join('> ' + line for line in quote.split('\n')) + '\n\n')
+            elif (tag in ('table', 'thead', 'tbody', 'tfoot', 'tr')):
+                parts.append('\n\n' + self.Table(child) + '\n\n')
+            elif (tag in ('br', 'hr')):
+                parts.append('\n')
+            elif (tag == 'img'):
+                continue
+            elif (tag in self.blocks):
+                parts.append('\n\n' + self.Markdown(child, depth) + '\n\n')
+            else:
+                parts.append(self.Markdown(child, depth))
+
+        return ''.join(parts)
+
+    '''
+    Rows()
+    Function: - Returns the rows of a table as lists of cell texts
+    '''
+    def Rows(self, element):
+        if (element.tag == 'tr'):
+            return [[' '.join(self.Text(cell).split()).replace('|', '\\|') for cell in element.children if (isinstance(cell, node) and (cell.tag in ('td', 'th')))]]
+        rows = []
+        for child in element.children:
+            if (isinstance(child, node) and (child.tag in ('thead', 'tbody', 'tfoot', 'tr'))):
+                rows.extend(self.Rows(child))
+        return rows
+
+    '''
+    Table()
+    Function: - Renders a table as a markdown table
+    '''
+    def Table(self, element):
+        """
+        Renders the rows with a | --- | separator after the first one, which markdown needs to read them as a
+        table.  The first row is the header whether or not it uses <th>, and short rows are padded to the widest.
+        """
+        rows = [row for row in self.Rows(element) if (any(cell != '' for cell in row))]
+        if (len(rows) == 0):
+            return ''
+        width = max(len(row) for row in rows)
+        lines = ['| ' + ' | '.join(row + [''] * (width - len(row))) + ' |' for row in rows]
+        lines.insert(1, '|' + ' --- |' * width)
+        return '\n'.join(lines)
+
+    '''
+    Tidy()
+    Function: - Trims the whitespace left by rendering
+    '''
+    def Tidy(self, text):
+        lines = []
+        fenced = False
+
+        for line in text.split('\n'):
+            if (line.strip() == '```'):
+                fenced = not fenced
+                lines.append('```')
+                continue
+            if (fenced == True):
+                lines.append(line.rstrip())
+                continue
+            indent = len(line) - len(line.lstrip(' ')) if (re.match(r'\s*(- |\d+\. )', line)) else 0
+            lines.append(' ' * indent + ' '.join(line.split()))
+
+        return re.sub(r'\n{3,}', '\n\n', '\n'.join(lines)).strip()
+
+    '''
+    Extract()
+    Function: - Returns the main content of a page as markdown
+    '''
+    @classmethod
+    def Extract(cls, html):
+        """
+        Extracts the main content of an HTML page.
+
+        Args:
+            html: The page source.
+
+        Returns:
+            str: The main content as markdown, headed by the page title when the content has no heading of its own.
+        """
+        parser = cls()
+        parser.feed(html)
+        parser.close()
+        parser.Prune(parser.root)
+
+        text = parser.Tidy(parser.Markdown(parser.MainContent()))
+        title = ' '.join(parser.title.split())
+        if ((title != '') and (not text.startswith('#'))):
+            text = '# ' + title + '\n\n' + text
+
+        return text
@@ -26,6 +26,13 @@ Class: This class is responsible for providing a mechanism to read and
        write files to and from the hard drive
        - Uncomment commented lines in the event troubleshooting is required
 '''
+
+#python imports
+import os
+import json
+import fcntl
+import threading
+
 class fileio:
     
     '''
@@ -116,3 +123,44 @@ class fileio:
         except:
             print ('[x] Unable to complete operation: %s %s' %(error,filename))
             return -1     
+
+    '''
+    UpdateJSONFile()
+    Function: - Merges entries into a JSON object file shared with other processes
+              - Returns to the caller
+    '''
+    def UpdateJSONFile(self, filename, entries):
+        """
+        Replaces the given keys of the JSON object in filename and keeps every other key, so processes that each
+        change their own keys do not undo each other's writes.  The read and write happen under an exclusive lock
+        on filename.lock, and the file is written to a temporary name and renamed into place so a reader never sees
+        a partial file.
+
+        Args:
+            filename: The JSON file, created with its directory if it does not exist.
+            entries: Dictionary of the keys to replace.
+
+        Returns:
+            int: 0 on success, -1 on error.
+        """
+        temp = filename + '.' + str(os.getpid()) + '.' + str(threading.get_ident()) + '.tmp'
+
+        try:
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            with open(filename + '.lock', 'a') as lockfile:
+                fcntl.flock(lockfile, fcntl.LOCK_EX)
+                try:
+                    with open(filename, 'r', encoding='utf-8') as read_file:
+                        data = json.load(read_file)
+                except (OSError, ValueError):
+                    data = {}
+                data.update(entries)
+                with open(temp, 'w', encoding='utf-8') as write_file:
+                    json.dump(data, write_file)
+                os.replace(temp, filename)
+            return 0
+
+        except Exception:
+            if (os.path.exists(temp)):
+                os.remove(temp)
+            return -1
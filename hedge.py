@@ -0,0 +1,407 @@
+'''
+Mainstay v0.4 - Copyright 2025 James Slaughter,
+This file is part of Mainstay v0.4.
+
+Mainstay v0.4 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Mainstay v0.4 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Mainstay v0.4.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+"""
+hedge.py - Hedged requests across two providers for Mainstay v0.4
+
+This module races a request against a second provider when the first is slow to answer.  The request is
+streamed from the selected provider.  If its first token has not arrived after the hedge delay, or it fails
+first, the same prompt and input go to the next provider in defaultmodels as well.  The first answer to finish
+wins, and the other call is cancelled by shutting down the connection under its stream.  The delay is a percentile of the time to first
+token seen from the selected provider and model.  Every race records its winner: a win by the second provider
+lowers the percentile and a win by the first raises it, so hedges fire sooner when they pay off and less often
+when they only add cost.  The samples and winners are kept in the state directory between runs.
+
+Classes:
+    hedger: Picks the second provider, sets the delay, runs the race and keeps the statistics.
+
+Copyright 2025 James Slaughter. Licensed under GPL v3 or later.
+"""
+
+#python imports
+import os
+import json
+import math
+import inspect
+import time
+import queue
+import threading
+
+#programmer generated imports
+from router import circuitopen
+from fileio import fileio
+
+'''
+hedger
+Class: This class is responsible for racing a slow request against a second provider
+'''
+class hedger:
+    """
+    The hedger class runs hedged requests through the engine's providers, concurrency slots and rate limits, and
+    keeps the time to first token samples and race results that set the hedge delay.
+    """
+    '''
+    Constructor
+    '''
+    def __init__(self, ENG):
+        """
+        Initializes the hedger.
+
+        Args:
+            ENG: The engine whose providers are raced.  Optional mainstay.conf keys: hedgesecondary (AI used as the
+                 second provider instead of the next one in defaultmodels), hedgepercentile (starting percentile of
+                 the time to first token, default 95), hedgedelay (seconds used until enough samples exist, default
+                 10), hedgemindelay (default 1) and hedgemaxdelay (default 60).
+        """
+        self.ENG = ENG
+        config = ENG.config
+        self.secondary = config.get('hedgesecondary', '')
+        self.percentile = float(config.get('hedgepercentile', 95))
+        self.initialdelay = float(config.get('hedgedelay', 10))
+        self.mindelay = float(config.get('hedgemindelay', 1))
+        self.maxdelay = float(config.get('hedgemaxdelay', 60))
+        self.minsamples = 20#time to first token samples needed before the percentile is used
+        self.maxsamples = 200#samples kept per provider and model
+        self.statsfile = os.path.join(config.get('statedir', '/opt/mainstay/state'), 'hedgestats.json')
+        self.lock = threading.Lock()
+        self.saving = threading.Lock()#held from taking the changes to writing them, so older ones are never written last
+        self.changed = set()#entries changed since they were last saved
+        self.saved = time.monotonic()#time the statistics were last saved
+        self.saveseconds = 30#longest a change waits to be saved
+        self.stats = None#'<ai>:<model>' -> {'samples', 'percentile', 'races', 'fired', 'primary', 'secondary'}, read on first use
+
+    '''
+    Load()
+    Function: - Reads the statistics saved by an earlier run once; the caller holds the lock
+    '''
+    def Load(self):
+        if (self.stats is not None):
+            return
+        self.stats = {}
+        try:
+            with open(self.statsfile, 'r', encoding='utf-8') as read_file:
+                self.stats = json.load(read_file)
+        except Exception:
+            pass
+
+    '''
+    Entry()
+    Function: - Returns the statistics kept for a provider and model; the caller holds the lock
+    '''
+    def Entry(self, ai, model):
+        self.Load()
+        name = ai + ':' + model
+        if (name not in self.stats):
+            self.stats[name] = {'samples': [], 'percentile': self.percentile, 'races': 0, 'fired': 0, 'primary': 0, 'secondary': 0}
+
+        return self.stats[name]
+
+    '''
+    Observe()
+    Function: - Records a time to first token from a provider and model
+    '''
+    def Observe(self, ai, model, ttft):
+        with self.lock:
+            samples = self.Entry(ai, model)['samples']
+            samples.append(round(ttft, 3))
+            del samples[:-self.maxsamples]
+            self.changed.add(ai + ':' + model)
+
+        self.Save(force=False)
+
+    '''
+    Delay()
+    Function: - Returns the seconds to wait for the first token before hedging
+    '''
+    def Delay(self, ai, model):
+        """
+        Returns the current percentile of the recorded times to first token, or hedgedelay while fewer than
+        minsamples are recorded, bounded by hedgemindelay and hedgemaxdelay.
+        """
+        with self.lock:
+            entry = self.Entry(ai, model)
+            samples = sorted(entry['samples'])
+            percentile = entry['percentile']
+
+        if (len(samples) < self.minsamples):
+            delay = self.initialdelay
+        else:
+            delay = samples[max(int(math.ceil(len(samples) * percentile / 100.0)) - 1, 0)]
+
+        return min(max(delay, self.mindelay), self.maxdelay)
+
+    '''
+    Settle()
+    Function: - Records the result of a race and moves the percentile toward the side that won
+    '''
+    def Settle(self, ai, model, fired, winner, adapt=True):
+        """
+        Records one race run for ai and model.
+
+        Args:
+            fired: True when the second provider was called.
+            winner: 'primary' or 'secondary' for the side whose answer was used, or 'none' when both failed.
+            adapt: False when the hedge fired because the first provider failed, which says nothing about the
+                   delay, so the percentile is left alone.
+        """
+        with self.lock:
+            entry = self.Entry(ai, model)
+            entry['races'] += 1
+            if (fired == True):
+                entry['fired'] += 1
+                if (winner in entry):
+                    entry[winner] += 1
+                if ((adapt == True) and (winner != 'none')):
+                    if (winner == 'primary'):
+                        # The second call was wasted, so wait longer next time
+                        entry['percentile'] = min(entry['percentile'] + 1, 99)
+                    else:
+                        # The second call paid off, so hedge sooner
+                        entry['percentile'] = max(entry['percentile'] - 1, 50)
+            self.changed.add(ai + ':' + model)
+
+        self.Save(force=False)
+
+    '''
+    Save()
+    Function: - Writes the statistics to the state directory
+    '''
+    def Save(self, force=True):
+        """
+        Writes the entries changed since the last save into statedir/hedgestats.json, keeping the entries other
+        processes saved there (see fileio.UpdateJSONFile()).  Unless force is set, nothing is written until
+        saveseconds have passed since the last save.
+        """
+        with self.saving:
+            with self.lock:
+                if ((self.stats is None) or (len(self.changed) == 0)):
+                    return
+                if ((force == False) and (time.monotonic() - self.saved < self.saveseconds)):
+                    return
+                entries = json.loads(json.dumps(dict((name, self.stats[name]) for name in self.changed)))
+                self.changed = set()
+                self.saved = time.monotonic()
+
+            fileio().UpdateJSONFile(self.statsfile, entries)
+
+    '''
+    Stats()
+    Function: - Returns the race counters for every provider and model
+    '''
+    def Stats(self):
+        """
+        Returns the races run, hedges fired, wins by each side, the current percentile and the current delay for
+        each '<ai>:<model>' that has been used as the first provider or answered a hedged request.
+        """
+        with self.lock:
+            self.Load()
+            stats = dict((name, dict((key, value) for key, value in entry.items() if (key != 'samples'))) for name, entry in self.stats.items())
+
+        for name in stats:
+            ai, model = name.split(':', 1)
+            stats[name]['delay'] = round(self.Delay(ai, model), 3)
+
+        return stats
+
+    '''
+    Secondary()
+    Function: - Returns the controller and request for the second provider
+    '''
+    def Secondary(self, CON, request):
+        """
+        Picks hedgesecondary, or else the first healthy provider in defaultmodels other than the selected one that
+        has a default model and an API key (see router.Next()), and prepares the same prompt and input for it.
+
+        Returns:
+            tuple: (controller, request) for the second provider, or (None, None) when there is none.
+        """
+        SCON = self.ENG.router.Next(CON, self.secondary)
+        if (SCON is None):
+            return None, None
+
+        try:
+            provider = self.ENG.providers.get(SCON.ai)
+            prompthash = self.ENG.prompts.Get(CON.prompt)['hash']
+        except Exception:
+            return None, None
+
+        return SCON, self.ENG.Request(SCON, provider, self.ENG.GetAPIKey(SCON), request['system_input'], request['user_input'], prompthash)
+
+    '''
+    Start()
+    Function: - Starts one side of the race on its own thread
+    '''
+    def Start(self, CON, request, signal, done):
+        leg = {'CON': CON, 'request': request, 'cancel': threading.Event(), 'start': time.monotonic(), 'ttft': 0.0,
+               'response': None, 'error': None, 'handle': None}
+        threading.Thread(target=self.Leg, args=(leg, signal, done), name='mainstay-hedge', daemon=True).start()
+
+        return leg
+
+    '''
+    Leg()
+    Function: - Streams one side of the race until it finishes or is cancelled
+    '''
+    def Leg(self, leg, signal, done):
+        """
+        Streams the leg's request under the provider's concurrency slot and rate limit.  Sets leg['ttft'] and
+        signal at the first token, then leg['response'] or leg['error'] when the call ends, sets signal again and
+        puts the leg on done.  The provider's open stream is kept in leg['handle'] so Cancel() can end it while
+        this thread is blocked reading it.  A cancelled leg is not reported, and a leg that is cancelled or fails
+        before its first token gives its rate limit reservation back.
+        """
+        CON = leg['CON']
+        request = leg['request']
+        provider = request['provider']
+        reserved = 0
+
+        try:
+            self.ENG.router.Check(CON)
+            reservation = self.ENG.Reservation(CON, request)
+            self.ENG.limiter.Acquire(CON.ai, CON.model, reservation)
+            reserved = reservation
+            with self.ENG.slots[CON.ai], self.ENG.metrics.Inflight(CON.ai, CON.model):
+                if ('opened' in inspect.signature(provider.Stream).parameters):
+                    stream = provider.Stream(CON, self.ENG.LOG, request['apikey'], request['system_input'], request['user_input'],
+                                             opened=lambda handle: self.Opened(leg, handle))
+                else:
+                    # A plugin whose Stream() takes no callback is only cancelled at its next chunk
+                    stream = provider.Stream(CON, self.ENG.LOG, request['apikey'], request['system_input'], request['user_input'])
+                try:
+                    for chunk in stream:
+                        if (leg['cancel'].is_set()):
+                            break
+                        if ('response' in chunk):
+                            response = chunk['response']
+                        elif (leg['ttft'] == 0.0):
+                            leg['ttft'] = time.monotonic() - leg['start']
+                            signal.set()
+                finally:
+                    stream.close()
+            if (leg['cancel'].is_set()):
+                self.Refund(leg, reserved)
+                return
+            self.ENG.limiter.Settle(CON.ai, CON.model, reserved, response['usage'])
+            self.ENG.metrics.Call(CON.ai, CON.model, time.monotonic() - leg['start'], True)
+            self.ENG.router.Record(CON.ai, CON.model, time.monotonic() - leg['start'])
+            leg['response'] = response
+        except Exception as e:
+            self.Refund(leg, reserved)
+            if (leg['cancel'].is_set()):
+                return
+            if (not isinstance(e, circuitopen)):
+                # A refused call never reached the provider
+                self.ENG.metrics.Call(CON.ai, CON.model, time.monotonic() - leg['start'], False)
+                self.ENG.router.Record(CON.ai, CON.model, time.monotonic() - leg['start'], e)
+            leg['error'] = e
+
+        signal.set()
+        done.put(leg)
+
+    '''
+    Opened()
+    Function: - Keeps the open stream of a leg so it can be cancelled
+    '''
+    def Opened(self, leg, handle):
+        leg['handle'] = handle
+        # The other leg may have won while this one was connecting
+        if (leg['cancel'].is_set()):
+            self.ENG.clients.Abort(handle)
+
+    '''
+    Cancel()
+    Function: - Stops a leg that lost the race
+    '''
+    def Cancel(self, leg):
+        """
+        Sets leg['cancel'] and shuts down the leg's open stream, so a leg stalled before its next chunk gives up
+        its connection and concurrency slot at once instead of when its next chunk or readtimeout arrives.  A leg
+        still waiting for its response headers has no stream yet and is ended by Opened() once it does.
+        """
+        leg['cancel'].set()
+        if (leg['handle'] is not None):
+            self.ENG.clients.Abort(leg['handle'])
+
+    '''
+    Refund()
+    Function: - Gives back the rate limit reservation of a leg that ended before its first token
+    '''
+    def Refund(self, leg, reserved):
+        if ((reserved > 0) and (leg['ttft'] == 0.0)):
+            self.ENG.limiter.Refund(leg['CON'].ai, leg['CON'].model, reserved)
+
+    '''
+    Race()
+    Function: - Answers a prepared request, hedging it with a second provider when the first is slow
+    '''
+    def Race(self, CON, request):
+        """
+        Streams the request from CON.ai.  When no token has arrived after Delay() seconds, or the call fails
+        before then, the request is also sent to the second provider.  The first answer to finish wins and the
+        other call is cancelled.  The winning response is stored in the cache under the winner's key unless
+        --no-cache is set.
+
+        Returns:
+            tuple: (response, hedge) - the winning response, and a dictionary with winner and model (the AI and
+                   model that answered), fired (True when the second provider was called) and delay.
+
+        Raises:
+            Exception: The first provider's error when neither side produced an answer.
+        """
+        delay = self.Delay(CON.ai, CON.model)
+        signal = threading.Event()#set by the first provider at its first token and when it finishes
+        done = queue.Queue()#legs that finished, in the order they finished
+        primary = self.Start(CON, request, signal, done)
+        legs = [primary]
+
+        if ((signal.wait(delay) == False) or (primary['error'] is not None)):
+            SCON, srequest = self.Secondary(CON, request)
+            if (SCON is not None):
+                if (CON.debug == True):
+                    reason = 'failed' if (primary['error'] is not None) else 'sent no token in ' + str(round(delay, 1)) + 's'
+                    print ('[DEBUG] ' + CON.ai + ' ' + reason + ', hedging with ' + SCON.ai + ' ' + SCON.model)
+                legs.append(self.Start(SCON, srequest, threading.Event(), done))
+
+        winner = None
+        failed = 0
+        while ((winner is None) and (failed < len(legs))):
+            leg = done.get()
+            if (leg['error'] is None):
+                winner = leg
+            else:
+                failed += 1
+
+        for leg in legs:
+            if (leg is not winner):
+                self.Cancel(leg)
+            # A leg cut off before its first token has no time to first token to record
+            if (leg['ttft'] > 0.0):
+                self.Observe(leg['CON'].ai, leg['CON'].model, leg['ttft'])
+
+        fired = (len(legs) > 1)
+        side = 'none' if (winner is None) else ('primary' if (winner is primary) else 'secondary')
+        self.Settle(CON.ai, CON.model, fired, side, adapt=(primary['error'] is None))
+        self.ENG.metrics.Hedge(CON.ai, CON.model, fired, side)
+
+        if (winner is None):
+            raise primary['error']
+
+        if (winner['CON'].nocache == False):
+            self.ENG.cache.Put(winner['request']['key'], winner['response'])
+
+        return winner['response'], {'winner': winner['CON'].ai, 'model': winner['CON'].model, 'fired': fired, 'delay': round(delay, 3)}
@@ -0,0 +1,300 @@
+'''
+Mainstay v0.4 - Copyright 2025 James Slaughter,
+This file is part of Mainstay v0.4.
+
+Mainstay v0.4 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Mainstay v0.4 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Mainstay v0.4.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+"""
+jobqueue.py - Persistent background job queue for Mainstay v0.4
+
+This module lets neomainstay accept a multi-prompt submission, hand back a job ID straight away and run the
+prompts in the background.  Jobs and their per-prompt tasks are kept in a SQLite database, so a job's progress
+survives a browser timeout and tasks left running by a server that stopped are picked up again when it restarts.
+A fixed number of worker threads claim queued tasks one at a time and record each result as soon as it is ready.
+
+Classes:
+    jobqueue: SQLite store of jobs and tasks, and the worker threads that run them.
+
+Copyright 2025 James Slaughter. Licensed under GPL v3 or later.
+"""
+
+#python imports
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+'''
+jobqueue
+Class: This class is responsible for storing jobs and running their tasks on background workers
+'''
+class jobqueue:
+    """
+    The jobqueue class keeps a jobs table (one row per submission) and a tasks table (one row per prompt).  A
+    task moves from queued to running to ok or error.  The runner is called with the task's keyword arguments
+    and must return a result dictionary with a status key, such as engine.Run().
+    """
+    '''
+    Constructor
+    '''
+    def __init__(self, path, runner, workers=4, maxage=7 * 86400):
+        """
+        Initializes the queue and creates the database if it does not exist.
+
+        Args:
+            path: SQLite database file.
+            runner: Function called with each task's keyword arguments, returning a result dictionary.
+            workers: Number of worker threads.
+            maxage: Seconds a job is kept after it was submitted.
+        """
+        self.path = path
+        self.runner = runner
+        self.workers = workers
+        self.maxage = maxage
+        self.lock = threading.Lock()
+        self.wake = threading.Condition(self.lock)
+        self.threads = []
+
+        directory = os.path.dirname(self.path)
+        if (directory != ''):
+            os.makedirs(directory, exist_ok=True)
+
+        with self.Connect() as db:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, created REAL, warnings TEXT)')
+            db.execute('CREATE TABLE IF NOT EXISTS tasks (job TEXT, seq INTEGER, prompt TEXT, args TEXT, status TEXT, '
+                       'result TEXT, owner INTEGER, started REAL, finished REAL, PRIMARY KEY (job, seq))')
+            db.execute('CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status)')
+
+    '''
+    Connect()
+    Function: - Opens a connection to the job database
+    '''
+    @contextmanager
+    def Connect(self):
+        """
+        Yields a new connection, commits if the block succeeds and closes it.  Connections are short lived and
+        never shared between threads.
+        """
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    '''
+    Start()
+    Function: - Requeues abandoned tasks, purges old jobs and starts the worker threads
+    '''
+    def Start(self):
+        """
+        Starts the worker threads.  Tasks marked running by a process that no longer exists are queued again,
+        and jobs older than maxage are deleted.  Calling Start() again does nothing.
+        """
+        if (len(self.threads) > 0):
+            return
+
+        self.Recover()
+        self.Purge()
+
+        for number in range(self.workers):
+            thread = threading.Thread(target=self.Work, name='mainstay-job-' + str(number), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    '''
+    Recover()
+    Function: - Puts tasks left running by a stopped process back in the queue
+    '''
+    def Recover(self):
+        """
+        Returns:
+            int: Number of tasks queued again.
+        """
+        requeued = 0
+
+        with self.Connect() as db:
+            for job, seq, owner in db.execute("SELECT job, seq, owner FROM tasks WHERE status = 'running'").fetchall():
+                if ((owner != os.getpid()) and (self.Alive(owner) == True)):
+                    continue
+                db.execute("UPDATE tasks SET status = 'queued', owner = NULL, started = NULL WHERE job = ? AND seq = ?", (job, seq))
+                requeued += 1
+
+        return requeued
+
+    '''
+    Alive()
+    Function: - Returns True when a process with the given ID is running
+    '''
+    def Alive(self, pid):
+        if (pid is None):
+            return False
+
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except Exception:
+            pass
+
+        return True
+
+    '''
+    Purge()
+    Function: - Deletes jobs older than maxage
+    '''
+    def Purge(self):
+        """
+        Returns:
+            int: Number of jobs deleted.
+        """
+        cutoff = time.time() - self.maxage
+
+        with self.Connect() as db:
+            old = [row[0] for row in db.execute('SELECT id FROM jobs WHERE created < ?', (cutoff,)).fetchall()]
+            for jobid in old:
+                db.execute('DELETE FROM tasks WHERE job = ?', (jobid,))
+                db.execute('DELETE FROM jobs WHERE id = ?', (jobid,))
+
+        return len(old)
+
+    '''
+    Submit()
+    Function: - Stores a new job and wakes the workers
+    '''
+    def Submit(self, tasks, warnings=None):
+        """
+        Queues one task per entry of tasks.
+
+        Args:
+            tasks: List of dictionaries holding the keyword arguments for the runner.  Each needs a prompt key.
+            warnings: Messages to report with the job, such as files that will be overwritten.
+
+        Returns:
+            str: The job ID.
+        """
+        jobid = uuid.uuid4().hex
+
+        with self.Connect() as db:
+            db.execute('INSERT INTO jobs (id, created, warnings) VALUES (?, ?, ?)', (jobid, time.time(), json.dumps(warnings or [])))
+            for seq, task in enumerate(tasks):
+                db.execute("INSERT INTO tasks (job, seq, prompt, args, status) VALUES (?, ?, ?, ?, 'queued')",
+                           (jobid, seq, task.get('prompt', ''), json.dumps(task)))
+
+        with self.wake:
+            self.wake.notify_all()
+
+        return jobid
+
+    '''
+    Claim()
+    Function: - Marks the oldest queued task as running and returns it
+    '''
+    def Claim(self):
+        """
+        Claims the next queued task in submission order.  The write lock is taken before the task is read, so two
+        workers, even in different processes, never claim the same task.
+
+        Returns:
+            tuple: (job, seq, args), or None when the queue is empty.
+        """
+        with self.Connect() as db:
+            db.execute('BEGIN IMMEDIATE')
+            row = db.execute("SELECT tasks.job, tasks.seq, tasks.args FROM tasks JOIN jobs ON jobs.id = tasks.job "
+                             "WHERE tasks.status = 'queued' ORDER BY jobs.created, tasks.seq LIMIT 1").fetchone()
+            if (row is None):
+                return None
+            db.execute("UPDATE tasks SET status = 'running', owner = ?, started = ? WHERE job = ? AND seq = ?",
+                       (os.getpid(), time.time(), row[0], row[1]))
+
+        return row[0], row[1], json.loads(row[2])
+
+    '''
+    Finish()
+    Function: - Records the result of a task
+    '''
+    def Finish(self, jobid, seq, result):
+        status = 'ok' if (result.get('status') == 'ok') else 'error'
+
+        with self.Connect() as db:
+            db.execute('UPDATE tasks SET status = ?, result = ?, finished = ? WHERE job = ? AND seq = ?',
+                       (status, json.dumps(result), time.time(), jobid, seq))
+
+    '''
+    Work()
+    Function: - Worker thread loop, runs queued tasks until the process exits
+    '''
+    def Work(self):
+        while True:
+            try:
+                task = self.Claim()
+            except Exception as e:
+                print ('[x] Unable to read the job queue: ' + str(e))
+                task = None
+
+            if (task is None):
+                # Submit() wakes the workers; the timeout picks up work queued by other processes
+                with self.wake:
+                    self.wake.wait(5)
+                continue
+
+            jobid, seq, args = task
+            try:
+                result = self.runner(**args)
+            except Exception as e:
+                result = {'status': 'error', 'error': 'Unable to complete task: ' + str(e)}
+
+            try:
+                self.Finish(jobid, seq, result)
+            except Exception as e:
+                print ('[x] Unable to record the result of job ' + jobid + ': ' + str(e))
+
+    '''
+    Get()
+    Function: - Returns a job with the state and result of each of its tasks
+    '''
+    def Get(self, jobid):
+        """
+        Returns:
+            dict: id, created, status ('queued', 'running' or 'done'), warnings, has_errors, completed, total and
+                  tasks, a list of {prompt, status, output, result} in submission order where result is the
+                  runner's result once the task has finished and None before.  None when there is no such job.
+        """
+        with self.Connect() as db:
+            job = db.execute('SELECT created, warnings FROM jobs WHERE id = ?', (jobid,)).fetchone()
+            if (job is None):
+                return None
+            rows = db.execute('SELECT prompt, args, status, result FROM tasks WHERE job = ? ORDER BY seq', (jobid,)).fetchall()
+
+        tasks = []
+        for prompt, args, status, result in rows:
+            tasks.append({'prompt': prompt, 'status': status, 'output': json.loads(args).get('output', ''),
+                          'result': json.loads(result) if (result is not None) else None})
+
+        completed = len([task for task in tasks if (task['status'] in ('ok', 'error'))])
+        if (completed == len(tasks)):
+            status = 'done'
+        elif ((completed > 0) or any(task['status'] == 'running' for task in tasks)):
+            status = 'running'
+        else:
+            status = 'queued'
+
+        return {'id': jobid, 'created': job[0], 'status': status, 'warnings': json.loads(job[1]),
+                'has_errors': any(task['status'] == 'error' for task in tasks), 'completed': completed,
+                'total': len(tasks), 'tasks': tasks}
@@ -32,23 +32,19 @@ Functions:
 #python import
 import sys
 import os
-import glob
 import json
 #import datetime
 import argparse
-import requests
-from openai import OpenAI
 from collections import defaultdict
 from array import *
-from rich.console import Console
-from rich.markdown import Markdown
 
 #programmer generated imports
 from controller import controller
-from chatgpt import chatgpt
-from claude import claude
-from perplexity import perplexity
 from logger import logger 
+from promptstore import promptstore
+
+#Conf file hardcoded here, MAINSTAY_CONF points elsewhere for testing and benchmarks
+CONFFILE = os.environ.get('MAINSTAY_CONF', '/opt/mainstay/mainstay.conf')
 
 '''
 Usage()
@@ -67,9 +63,26 @@ def Usage():
     print ('Optional Arguments:')
     print ('--output - Choose where you wish the output to be directed')
     print ('--url - The URL used for input when fetching content from web')
+    print ('--no-cache - Do not read or write the response cache.')
+    print ('--refresh - Ignore any cached response and store the new one.')
+    print ('--stream - Print the response as it is generated instead of waiting for the whole answer.')
+    print ('--estimate - Report the tokens, expected cost and expected latency of the request without sending it.')
+    print ('--no-chunk - Send input larger than the model\'s context window as is instead of splitting it into chunks.')
+    print ('--hedge - If the AI is slow to start answering, also send the request to the next AI in defaultmodels and keep')
+    print ('          whichever answer finishes first.')
+    print ('--session - Continue the conversation with this ID, or start it.  Earlier questions and answers are sent with')
+    print ('            the input, so a follow-up can refer to them without repeating the sample.')
+    print ('--batch - Directory or JSONL file of inputs.  Runs the prompt (or comma separated prompts) over every item')
+    print ('          and writes one output per item plus manifest.jsonl into the --output directory.')
+    print ('--batchapi - Submit the --batch through the OpenAI or Anthropic asynchronous Batch API and wait for the results.')
     print ('--listprompts - Prints a list of available prompts.')
     print ('--listmodels - Prints the available LLM models to use.')
     print ('--viewprompt - View the content of a specified prompt.')
+    print ('--search - Search earlier outputs for words, FTS5 query syntax or an input hash and exit.  Without a query the')
+    print ('           piped input is looked up by its hash, to find earlier analyses of the same input.')
+    print ('--daemon - Stay resident with the configuration, prompts, connections and caches loaded, and run the commands')
+    print ('           of later mainstay.py runs.  Those runs send their command to the daemon when one is listening.')
+    print ('--no-daemon - Run the command in this process even when a daemon is listening.')
     print ('--debug - Prints verbose logging to the screen to troubleshoot issues with a recon installation.')
     print ('--help - You\'re looking at it!')
     sys.exit(-1)
@@ -89,13 +102,13 @@ def ConfRead():
     temp = ''  
 
     try:
-        #Conf file hardcoded here
-        with open('/opt/mainstay/mainstay.conf', 'r') as read_file:
+        with open(CONFFILE, 'r') as read_file:
             data = json.load(read_file)
     except Exception as e:
         print (LOG.colored('[x] Unable to read configuration file: ' + str(e), 'echoerror', bold=True))
         return -1
 
+    CON.config = data
     CON.logger = data['logger']
     CON.logroot = data['logroot']
     CON.defaultmodels = data['defaultmodels']
@@ -118,10 +131,9 @@ def ConfRead():
                 print ('[DEBUG] CON.default models: ' + key + ' value: ' + value)                       
 
     #Load prompt collection
-    for file in glob.glob(CON.promptdir + '/*'):
-        temp = file.rsplit("/", 3)
-        CON.prompts.append(temp[3])
-        temp = ''            
+    global PROMPTS
+    PROMPTS = promptstore(CON.promptdir, recheck=data.get('promptrecheck', 2))
+    CON.prompts = PROMPTS.List()
             
     if (CON.debug == True):
        print ('[*] Finished configuration.')
@@ -146,10 +158,22 @@ def parse_args():
     parser.add_argument('--model', help='Specify an LLM model to use, or use the default.')
     parser.add_argument('--output', help='The output location')
     parser.add_argument('--url', help='The URL used for input when fetching content from web')
+    parser.add_argument('--no-cache', dest='nocache', action='store_true', help='Do not read or write the response cache')
+    parser.add_argument('--refresh', action='store_true', help='Ignore any cached response and store the new one')
+    parser.add_argument('--stream', action='store_true', help='Print the response as it is generated')
+    parser.add_argument('--estimate', action='store_true', help='Report tokens, cost and latency without sending the request')
+    parser.add_argument('--no-chunk', dest='nochunk', action='store_true', help='Do not split input larger than the context window')
+    parser.add_argument('--hedge', action='store_true', help='Race a slow request against the next AI in defaultmodels')
+    parser.add_argument('--session', help='ID of the conversation to continue or start')
+    parser.add_argument('--batch', help='Directory or JSONL file of inputs to run the prompt(s) over')
+    parser.add_argument('--batchapi', action='store_true', help='Submit --batch through the provider Batch API')
     parser.add_argument('--debug', action='store_true', help='Enable debug mode')
     parser.add_argument('--listprompts', action='store_true', help='List prompts and exit')
     parser.add_argument('--listmodels', action='store_true', help='List available LLM models to use')
     parser.add_argument('--viewprompt', action='store_true', help='View a specified prompt and exit')
+    parser.add_argument('--search', nargs='?', const='', help='Search earlier outputs and exit; without a query, search for the piped input')
+    parser.add_argument('--daemon', action='store_true', help='Stay resident and run the commands of later runs')
+    parser.add_argument('--no-daemon', dest='nodaemon', action='store_true', help='Run in this process even when a daemon is listening')
     parser.add_argument('--usage', action='store_true', help='Display program usage.')
 
     args = parser.parse_args()
@@ -160,6 +184,32 @@ def parse_args():
     if args.usage:
         return -1                                   
 
+    if args.daemon:
+        # The daemon takes its commands from later runs
+        CON.daemon = True
+        print ('[-] daemon: ', CON.daemon)
+        return args
+
+    if args.nodaemon:
+        CON.usedaemon = False
+        print ('[-] no-daemon: ', True)
+
+    if (args.search is not None):
+        # Searching needs neither a prompt nor an AI
+        CON.searching = True
+        CON.search = args.search
+        print ('[-] search: ', CON.search)
+        if (CON.search.strip() == ''):
+            while True:
+                try:
+                    CON.pipe += input()
+                except EOFError:
+                    break
+            if (len(CON.pipe) == 0):
+                print (LOG.colored('[x] --search needs a query or piped input.', 'echoerror', bold=True))
+                return -1
+        return args
+
     if args.input:        
         CON.input = args.input
         if (CON.debug == True):
@@ -193,6 +243,54 @@ def parse_args():
         CON.url = args.url
         print ('[-] url: ', CON.url)
 
+    if args.nocache:
+        CON.nocache = True
+        print ('[-] no-cache: ', CON.nocache)
+
+    if args.refresh:
+        CON.refresh = True
+        print ('[-] refresh: ', CON.refresh)
+
+    if args.estimate:
+        CON.estimate = True
+        print ('[-] estimate: ', CON.estimate)
+        if args.batch:
+            print (LOG.colored('[x] --estimate cannot be combined with --batch.', 'echoerror', bold=True))
+            return -1
+
+    if args.nochunk:
+        CON.chunking = False
+        print ('[-] no-chunk: ', True)
+
+    if args.hedge:
+        CON.hedge = True
+        print ('[-] hedge: ', CON.hedge)
+
+    if args.session:
+        CON.history = args.session
+        print ('[-] session: ', CON.history)
+        if args.batch:
+            print (LOG.colored('[x] --session cannot be combined with --batch.', 'echoerror', bold=True))
+            return -1
+
+    if args.batch:
+        CON.batch = args.batch
+        print ('[-] batch: ', CON.batch)
+        if (not CON.output):
+            print (LOG.colored('[x] --batch requires --output to be set to a directory.', 'echoerror', bold=True))
+            return -1
+
+    if args.batchapi:
+        CON.batchapi = True
+        print ('[-] batchapi: ', CON.batchapi)
+        if (not CON.batch):
+            print (LOG.colored('[x] --batchapi requires --batch.', 'echoerror', bold=True))
+            return -1
+
+    if args.stream:
+        CON.stream = True
+        print ('[-] stream: ', CON.stream)
+
     if args.debug:
         CON.debug = True
         print('[-] debug: ', CON.debug)
@@ -226,7 +324,10 @@ def parse_args():
             print (LOG.colored('[x] ai must be either \'chatgpt\' OR \'claude\'.', 'echoerror', bold=True))
             return -1         
 
-    if ((not CON.input) and (CON.listprompts == False) and (CON.listmodels == False) and (CON.viewprompt == False)):
+    if (CON.batch != ''):
+        #Batch items supply their own input
+        pass
+    elif ((not CON.input) and (CON.listprompts == False) and (CON.listmodels == False) and (CON.viewprompt == False)):
         while True:
             try:
                 CON.pipe += input()
@@ -236,7 +337,8 @@ def parse_args():
         if (CON.debug == True):
             print ('[DEBUG]: ' + CON.pipe)
 
-        if (len(CON.pipe) < 20):
+        # A follow-up question in a session can be short; the sample it is about is already in the session
+        if ((len(CON.pipe) < 20) and ((CON.history == '') or (len(CON.pipe.strip()) == 0))):
             print (LOG.colored('[x] Insufficient input has been entered! Use --input OR pipe input in from the CLI.', 'echoerror', bold=True))
             return -1
     elif ((len(CON.input) < 10) and (CON.listprompts == False) and (CON.listmodels == False) and (CON.viewprompt == False)):
@@ -260,7 +362,7 @@ def ListPrompts():
     """
     print (LOG.colored('[*] Prompt List:', 'echoinfo', bold=True))
     for prompt in CON.prompts:     
-        print ('[-] ' + prompt.strip('.md'))             
+        print ('[-] ' + prompt)             
 
     return 0
 
@@ -272,18 +374,16 @@ def ViewPrompt():
     """
     Displays the content of a specific prompt file in markdown format.
     """
-    promptfile = ''
     markdown_string = ''
     print (LOG.colored('[*] Prompt Content: \r\n', 'echoinfo', bold=True))
 
-    promptfile = CON.promptdir + '/' + CON.prompt + '.md'
+    # rich is imported here rather than at load time so that commands which render nothing start quickly
+    from rich.console import Console
+    from rich.markdown import Markdown
     console = Console()
 
     try:
-        with open(promptfile, 'r+') as read_file:            
-            #data = markdown.markdown(read_file.read())
-            #markdown_string = markdownify.markdownify(data)
-            console.print(Markdown(read_file.read()))
+        console.print(Markdown(PROMPTS.Text(CON.prompt)))
 
     except Exception as e:
         print (LOG.colored('[x] Unable to find prompt file: ' + str(e), 'echoerror', bold=True))
@@ -293,6 +393,45 @@ def ViewPrompt():
 
     return 0
 
+'''
+Search()
+Function: - Searches the index of earlier outputs and prints the matches
+'''
+def Search():
+    """
+    Brings the index up to date with logroot, then prints the outputs matching CON.search, or the outputs of
+    earlier runs over the piped input when no query was given.  Returns 0 when something was found, 1 when
+    nothing was and -1 on error.
+    """
+    from searchindex import searchindex
+
+    INDEX = searchindex(searchindex.Path(CON.config))
+    if (INDEX.path == ''):
+        print (LOG.colored('[x] The search index is turned off (searchdb is "false").', 'echoerror', bold=True))
+        return -1
+
+    try:
+        INDEX.Scan(CON.logroot)
+        query = CON.search if (CON.search.strip() != '') else searchindex.Hash(CON.pipe)
+        results = INDEX.Search(query)
+    except Exception as e:
+        print (LOG.colored('[x] Unable to search ' + INDEX.path + ': ' + str(e), 'echoerror', bold=True))
+        return -1
+
+    if (len(results) == 0):
+        print (LOG.colored('[-] No earlier outputs match.', 'echowarn', bold=True))
+        return 1
+
+    print (LOG.colored('[*] ' + str(len(results)) + ' earlier output(s):', 'echoinfo', bold=True))
+    for result in results:
+        print ('')
+        print (LOG.colored(result['path'], 'echolink', bold=True))
+        details = [value for value in [result['written'], result['prompt'], result['ai'], result['model'], result['url']] if (value != '')]
+        print ('    ' + ' | '.join(details))
+        print ('    ' + result['snippet'])
+
+    return 0
+
 '''
 Terminate()
 Function: - Attempts to exit the program cleanly when called  
@@ -318,12 +457,6 @@ if __name__ == '__main__':
     CON = controller()
 
     LOG = logger()
-
-    CGPT = chatgpt()
-
-    CLD = claude()
-
-    PPLX = perplexity()
                    
     ret = parse_args()
 
@@ -337,6 +470,15 @@ if __name__ == '__main__':
         print (LOG.colored('[x] Terminated reading the configuration file...', 'echoerror', bold=True))
         Terminate(ret)
 
+    if (CON.daemon == True):
+        from engine import engine
+        from daemon import daemon
+        Terminate(daemon(engine(CON.config, PROMPTS), LOG, CONFFILE).Serve())
+
+    if (CON.searching == True):
+        # Exits 1 when nothing matched, like grep, so scripts can check whether an input was analyzed before
+        Terminate(Search())
+
     if (not CON.model):        
         if (CON.ai == 'chatgpt'):
             for models in CON.defaultmodels: 
@@ -366,44 +508,24 @@ if __name__ == '__main__':
         ListPrompts()
         Terminate(0)
 
-    if (CON.listmodels == True):
-        if (CON.ai == 'chatgpt'):
-            CGPT.ListModels(CON, LOG)
-            Terminate(0)
-        elif (CON.ai == 'perplexity'):
-            PPLX.ListModels(CON, LOG)
-            Terminate(0)
-        else:
-            CLD.ListModels(CON, LOG)
-            Terminate(0)
-
     if (CON.viewprompt == True):        
         ViewPrompt()
         Terminate(0)            
 
     CON.CWP = os.getcwd()
-    print ('[*] Current working directory is: ' + CON.CWP)
-
-    #if (CON.logger.strip() == 'true'): 
-    #    CON.logging = True
-    #    print ('[*] Logger is active')
-    #else:
-    #    print ('[-] Logger not active')#    
-
-    if (CON.ai == 'chatgpt'):
-        print ('[*] Executing with ChatGPT...\r')
-        CGPT.Execute(CON, LOG)
-    elif (CON.ai == 'perplexity'):
-        print ('[*] Executing with Perplexity...\r')
-        PPLX.Execute(CON, LOG)
-    else:
-        print ('[*] Executing with Claude...\r')
-        CLD.Execute(CON, LOG)                         
 
-    print ('')
-    print (LOG.colored('[*] Program Complete', 'echoinfo', bold=True))
+    # A running daemon already has the engine loaded; without one the command runs in this process
+    if (CON.usedaemon == True):
+        from daemon import daemonclient
+        ret = daemonclient(LOG, CONFFILE).Forward(CON)
+        if (ret is not None):
+            Terminate(ret)
+
+    # The engine and everything behind it are only loaded once a command needs a provider
+    from engine import engine
+    ENG = engine(CON.config, PROMPTS)
 
-    Terminate(0)
+    Terminate(ENG.Command(CON, LOG))
 '''
 END OF LINE
 '''
@@ -0,0 +1,242 @@
+'''
+Mainstay v0.4 - Copyright 2025 James Slaughter,
+This file is part of Mainstay v0.4.
+
+Mainstay v0.4 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Mainstay v0.4 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Mainstay v0.4.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+"""
+metrics.py - In-process request metrics for Mainstay v0.4
+
+This module counts requests, provider calls and URL fetches by provider and model, and renders them in the
+Prometheus text exposition format for neomainstay's /metrics endpoint.  Recording a request takes one lock and a
+handful of dictionary updates; nothing is formatted until the endpoint is scraped.  Latencies are kept as
+histograms, so percentiles are computed by Prometheus with histogram_quantile().
+
+Classes:
+    metrics: Thread-safe counters, gauges and histograms with a Prometheus text renderer.
+
+Copyright 2025 James Slaughter. Licensed under GPL v3 or later.
+"""
+
+#python imports
+import bisect
+import threading
+import contextlib
+
+'''
+metrics
+Class: This class is responsible for collecting request metrics and rendering them for Prometheus
+'''
+class metrics:
+    """
+    The metrics class holds one value per metric name and label set.  Counters and gauges hold a number and
+    histograms hold per-bucket counts, a sum and a count.
+    """
+    # Seconds; provider calls range from a cached hit to a multi-minute analysis
+    buckets = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+    definitions = {
+        'mainstay_requests_total': ('counter', 'Requests answered, by provider, model, status (ok or error) and source (provider, cache or coalesced).'),
+        'mainstay_request_duration_seconds': ('histogram', 'Time to answer a request, including cache lookups and writing the output file.'),
+        'mainstay_ttft_seconds': ('histogram', 'Time to the first token of streamed requests answered by the provider.'),
+        'mainstay_tokens_total': ('counter', 'Tokens billed by the provider, by direction (input, output, cache_read or cache_write).'),
+        'mainstay_provider_calls_total': ('counter', 'Calls sent to the provider, by outcome (ok or error), after retries.'),
+        'mainstay_provider_call_duration_seconds': ('histogram', 'Time spent in a provider call, including rate limit waits and retries.'),
+        'mainstay_url_fetches_total': ('counter', 'URL fetches, by outcome (fresh, revalidated, fetched or error).'),
+        'mainstay_url_fetch_duration_seconds': ('histogram', 'Time to fetch and extract a URL.'),
+        'mainstay_response_cache_lookups_total': ('counter', 'Response cache lookups by result (hits or misses).'),
+        'mainstay_response_cache_bytes': ('gauge', 'Bytes held by the response cache on disk.'),
+        'mainstay_provider_calls_inflight': ('gauge', 'Calls waiting on the provider now, by provider and model.'),
+        'mainstay_failovers_total': ('counter', 'Requests moved from a failing provider and model to another provider (to).'),
+        'mainstay_breaker_state': ('gauge', 'Circuit breaker state by provider and model: 0 closed, 1 open, 2 half-open.'),
+        'mainstay_hedges_total': ('counter', 'Hedged requests, by first provider and model, whether the second provider was called (fired) and which side won (primary, secondary or none).'),
+    }
+
+    '''
+    Constructor
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}#(name, labels) -> number for counters and gauges, [bucket counts, sum, count] for histograms
+
+    '''
+    Inc()
+    Function: - Adds to a counter; the caller holds the lock
+    '''
+    def Inc(self, name, labels, value=1):
+        key = (name, labels)
+        self.values[key] = self.values.get(key, 0) + value
+
+    '''
+    Observe()
+    Function: - Records a value in a histogram; the caller holds the lock
+    '''
+    def Observe(self, name, labels, value):
+        key = (name, labels)
+        histogram = self.values.get(key)
+        if (histogram is None):
+            histogram = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            self.values[key] = histogram
+        histogram[0][bisect.bisect_left(self.buckets, value)] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+    '''
+    Set()
+    Function: - Sets a gauge, or a counter whose value is kept elsewhere
+    '''
+    def Set(self, name, value, **labels):
+        with self.lock:
+            self.values[(name, tuple(sorted(labels.items())))] = value
+
+    '''
+    Result()
+    Function: - Records a request from its result dictionary
+    '''
+    def Result(self, result, seconds):
+        """
+        Records one answered request.
+
+        Args:
+            result: The result dictionary returned by engine.Process() or sent with the stream's done event.
+            seconds: Time taken to answer the request.
+        """
+        labels = (('model', result.get('model', '')), ('provider', result.get('ai', '')))
+        if (result.get('cached') == True):
+            source = 'cache'
+        elif (result.get('coalesced') == True):
+            source = 'coalesced'
+        else:
+            source = 'provider'
+        usage = result.get('usage') or {}
+
+        with self.lock:
+            self.Inc('mainstay_requests_total', labels + (('source', source), ('status', result.get('status', 'error'))))
+            self.Observe('mainstay_request_duration_seconds', labels, seconds)
+            if (source == 'provider'):
+                if (result.get('ttft', 0.0) > 0.0):
+                    self.Observe('mainstay_ttft_seconds', labels, result['ttft'])
+                for direction in ['input', 'output', 'cache_read', 'cache_write']:
+                    tokens = usage.get(direction + '_tokens', 0) or 0
+                    if (tokens > 0):
+                        self.Inc('mainstay_tokens_total', (('direction', direction),) + labels, tokens)
+
+    '''
+    Call()
+    Function: - Records one call sent to a provider
+    '''
+    def Call(self, ai, model, seconds, ok):
+        labels = (('model', model), ('provider', ai))
+        with self.lock:
+            self.Inc('mainstay_provider_calls_total', labels + (('outcome', 'ok' if (ok == True) else 'error'),))
+            self.Observe('mainstay_provider_call_duration_seconds', labels, seconds)
+
+    '''
+    Inflight()
+    Function: - Counts a call as waiting on the provider while the with block runs
+    '''
+    @contextlib.contextmanager
+    def Inflight(self, ai, model):
+        labels = (('model', model), ('provider', ai))
+        with self.lock:
+            self.Inc('mainstay_provider_calls_inflight', labels)
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.Inc('mainstay_provider_calls_inflight', labels, -1)
+
+    '''
+    Failover()
+    Function: - Records one request moved to another provider
+    '''
+    def Failover(self, ai, model, to):
+        with self.lock:
+            self.Inc('mainstay_failovers_total', (('model', model), ('provider', ai), ('to', to)))
+
+    '''
+    Hedge()
+    Function: - Records one hedged request
+    '''
+    def Hedge(self, ai, model, fired, winner):
+        with self.lock:
+            self.Inc('mainstay_hedges_total', (('fired', 'true' if (fired == True) else 'false'), ('model', model), ('provider', ai), ('winner', winner)))
+
+    '''
+    Fetch()
+    Function: - Records one URL fetch
+    '''
+    def Fetch(self, outcome, seconds):
+        with self.lock:
+            self.Inc('mainstay_url_fetches_total', (('outcome', outcome),))
+            self.Observe('mainstay_url_fetch_duration_seconds', (), seconds)
+
+    '''
+    Labels()
+    Function: - Formats a label set for the exposition format
+    '''
+    def Labels(self, labels):
+        if (len(labels) == 0):
+            return ''
+        pairs = []
+        for name, value in labels:
+            value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            pairs.append(name + '="' + value + '"')
+        return '{' + ','.join(pairs) + '}'
+
+    '''
+    Number()
+    Function: - Formats a value for the exposition format
+    '''
+    def Number(self, value):
+        if (isinstance(value, float) and (value == int(value)) and (abs(value) < 1e15)):
+            return str(int(value))
+        return repr(value) if (isinstance(value, float)) else str(value)
+
+    '''
+    Render()
+    Function: - Returns every metric in the Prometheus text exposition format
+    '''
+    def Render(self):
+        """
+        Returns:
+            str: The metrics as text/plain; version=0.0.4, with HELP and TYPE lines for each metric that has a
+                 value.
+        """
+        with self.lock:
+            snapshot = [(key, (list(value[0]), value[1], value[2]) if (isinstance(value, list)) else value) for key, value in self.values.items()]
+
+        series = {}
+        for (name, labels), value in snapshot:
+            series.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for name, (kind, text) in self.definitions.items():
+            if (name not in series):
+                continue
+            lines.append('# HELP ' + name + ' ' + text)
+            lines.append('# TYPE ' + name + ' ' + kind)
+            for labels, value in sorted(series[name]):
+                if (kind != 'histogram'):
+                    lines.append(name + self.Labels(labels) + ' ' + self.Number(value))
+                    continue
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucketcount in zip(self.buckets + ('+Inf',), counts):
+                    cumulative += bucketcount
+                    lines.append(name + '_bucket' + self.Labels(labels + (('le', str(bound)),)) + ' ' + str(cumulative))
+                lines.append(name + '_sum' + self.Labels(labels) + ' ' + self.Number(total))
+                lines.append(name + '_count' + self.Labels(labels) + ' ' + str(count))
+
+        return '\n'.join(lines) + '\n'
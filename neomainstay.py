@@ -26,21 +26,27 @@ Key Features:
     - Web form for submitting input and selecting prompts/models
     - Validates output paths and filenames
     - Runs the mainstay engine and saves results
+    - Queues submissions as background jobs that the page polls for per-prompt results
     - Lists available prompts and models
     - Views prompt content
 
 Copyright 2025 James Slaughter. Licensed under GPL v3 or later.
 """
 
-from flask import Flask, render_template, request, jsonify
-import subprocess
+from flask import Flask, render_template, request, jsonify, Response
 import os
 import json
-import shlex
+import time
+import queue
 import requests
 from urllib.parse import urlparse
 from termcolor import colored
 
+from engine import engine
+from jobqueue import jobqueue
+from urlcache import urlcache
+from extractor import extractor
+
 app = Flask(__name__)
 
 # Load configuration
@@ -51,7 +57,7 @@ def load_config():
         dict: Configuration data if successful, None otherwise.
     """
     try:
-        with open('/opt/mainstay/mainstay.conf', 'r') as read_file:
+        with open(os.environ.get('MAINSTAY_CONF', '/opt/mainstay/mainstay.conf'), 'r') as read_file:
             return json.load(read_file)
     except Exception as e:
         print(colored(f'[x] Unable to read configuration file: {str(e)}', 'red', attrs=['bold']))
@@ -59,47 +65,233 @@ def load_config():
 
 config = load_config()
 
-def fetch_url_content(url):
+# The engine keeps configuration and provider clients alive for the life of the server
+ENGINE = engine(config or {})
+
+# Open provider connections in the background so the first submission skips the TLS handshake
+ENGINE.pool.submit(ENGINE.Warm)
+
+# Pages fetched for URL input are kept with their validators and revalidated with conditional requests
+URLCACHE = urlcache((config or {}).get('urlcachedir', '/opt/mainstay/urlcache'), ENGINE.clients.Session,
+                    ttl=int((config or {}).get('urlcachettl', 300)),
+                    maxbytes=int((config or {}).get('urlcachemaxmb', 64)) * 1024 * 1024,
+                    maxage=int((config or {}).get('urlcachemaxdays', 7)) * 86400,
+                    maxdownload=int((config or {}).get('urlmaxkb', 5120)) * 1024)
+
+# HTML pages are reduced to the markdown of their main content unless urlextract is false
+URLEXTRACT = str((config or {}).get('urlextract', 'true')).lower() != 'false'
+
+# Submissions queued with POST /jobs run on these workers and survive a browser timeout or a server restart
+JOBS = jobqueue((config or {}).get('jobdb', '/opt/mainstay/jobs.db'), ENGINE.Run,
+                workers=int((config or {}).get('jobworkers', ENGINE.maxworkers)),
+                maxage=int((config or {}).get('jobmaxdays', 7)) * 86400)
+JOBS.Start()
+
+# Outputs already in logroot are added to the search index in the background; new ones are added as they are written
+ENGINE.pool.submit(ENGINE.search.Scan, (config or {}).get('logroot', ''))
+
+def fetch_url_content(url, ai='', model=''):
     """
-    Fetches content from a URL using requests library.
+    Fetches content from a URL and records the fetch in the metrics served on /metrics.
+    Args and return value are those of fetch_url().
+    """
+    start = time.monotonic()
+    content, error, details = fetch_url(url, ai, model)
+    ENGINE.metrics.Fetch('error' if error else details['cache'], time.monotonic() - start)
+    return content, error, details
+
+def fetch_url(url, ai='', model=''):
+    """
+    Fetches content from a URL through the URL cache and reduces HTML pages to their main content.
     Args:
         url (str): The URL to fetch content from.
+        ai (str): The selected AI, used to count tokens.
+        model (str): The selected model, used to count tokens.
     Returns:
-        tuple: (content, error_message) - content is the fetched text or None if error
+        tuple: (content, error_message, details) - content is the fetched text or None if error, details holds
+               cache ('fresh' or 'revalidated' when the page came from the URL cache, 'fetched' otherwise),
+               truncated, extracted, and raw_tokens and tokens before and after extraction
     """
+    details = {'cache': '', 'truncated': False, 'extracted': False, 'raw_tokens': 0, 'tokens': 0}
     try:
         # Validate URL format
         parsed_url = urlparse(url)
         if not parsed_url.scheme or not parsed_url.netloc:
-            return None, "Invalid URL format. Please include http:// or https://"
+            return None, "Invalid URL format. Please include http:// or https://", details
         
         # Set headers to mimic a real browser
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
         
-        # Fetch the URL with timeout
-        response = requests.get(url, headers=headers, timeout=30)
-        response.raise_for_status()  # Raise an exception for bad status codes
+        # Stream the URL with timeout and a size cap, revalidating any cached copy
+        page = URLCACHE.Fetch(url, headers=headers, timeout=30)
+        details['cache'] = page['cache']
+        details['truncated'] = page['truncated']
         
         # Check if content is text-based
-        content_type = response.headers.get('content-type', '').lower()
+        content_type = page['content_type']
         if 'text' not in content_type and 'html' not in content_type:
-            return None, f"URL content is not text-based (content-type: {content_type})"
+            return None, f"URL content is not text-based (content-type: {content_type})", details
+        
+        content = page['text']
+        details['raw_tokens'] = ENGINE.tokens.Count(ai, model, content)
+        details['tokens'] = details['raw_tokens']
+        
+        # Strip scripts, styles and page furniture, keeping the article as markdown
+        if URLEXTRACT and 'html' in content_type:
+            try:
+                extracted = extractor.Extract(content)
+            except Exception as e:
+                print(f"Unable to extract the main content, sending the page as is: {str(e)}")
+                extracted = ''
+            if extracted:
+                content = extracted
+                details['extracted'] = True
+                details['tokens'] = ENGINE.tokens.Count(ai, model, content)
         
         # Return the text content
-        return response.text, None
+        return content, None, details
         
     except requests.exceptions.Timeout:
-        return None, "Request timed out. The URL took too long to respond."
+        return None, "Request timed out. The URL took too long to respond.", details
     except requests.exceptions.ConnectionError:
-        return None, "Connection error. Could not reach the URL."
+        return None, "Connection error. Could not reach the URL.", details
     except requests.exceptions.HTTPError as e:
-        return None, f"HTTP error: {e.response.status_code} - {e.response.reason}"
+        return None, f"HTTP error: {e.response.status_code} - {e.response.reason}", details
     except requests.exceptions.RequestException as e:
-        return None, f"Request error: {str(e)}"
+        return None, f"Request error: {str(e)}", details
     except Exception as e:
-        return None, f"Unexpected error: {str(e)}"
+        return None, f"Unexpected error: {str(e)}", details
+
+def build_jobs(form):
+    """
+    Validates a submitted form and builds one engine job per selected prompt.
+    Args:
+        form: The submitted form data (request.form).
+    Returns:
+        tuple: (jobs, warnings, error_message) - jobs is a list of engine.Run() keyword
+               dictionaries, error_message is None if validation passed
+    """
+    # Debug: Print all form data
+    print("Form data received:", form)
+
+    # Get all form data with default values
+    pasted_input = form.get('pastedInput', '')
+    url_input = form.get('urlInput', '')
+    use_url = form.get('use_url') == 'true'
+    prompts = form.getlist('prompt')
+    ai = form.get('ai', '')
+    model = form.get('model', '')
+    output_path = form.get('output', '')  # This contains full path with filename
+    base_filename = form.get('filename', '')
+    hedge = form.get('hedgeToggle') == 'on'
+    session = form.get('session', '').strip()
+
+    # Handle URL input if checkbox is checked
+    url_details = {'cache': '', 'truncated': False, 'extracted': False}
+    if use_url and url_input:
+        print(f"Fetching content from URL: {url_input}")
+        url_content, url_error, url_details = fetch_url_content(url_input, ai, model)
+        if url_error:
+            print(f"URL fetch error: {url_error}")
+            return None, None, f"Failed to fetch URL content: {url_error}"
+        pasted_input = url_content
+        print(f"Successfully fetched {len(pasted_input)} characters from URL ({url_details['cache']})")
+    elif use_url and not url_input:
+        return None, None, "URL input is required when URL mode is selected"
+
+    # Extract directory path from the full path
+    output_dir = os.path.dirname(output_path)
+    print(f"Extracted directory path: {output_dir}")
+
+    # Validation checks with detailed logging
+    if not output_dir:
+        print("Validation failed: Output directory is empty")
+        return None, None, "Output directory is empty"
+
+    print(f"Checking if directory exists: {output_dir}")
+    if not os.path.exists(output_dir):
+        print(f"Validation failed: Directory does not exist: {output_dir}")
+        return None, None, f"Output directory does not exist: {output_dir}"
+
+    if not os.path.isdir(output_dir):
+        print(f"Validation failed: Not a directory: {output_dir}")
+        return None, None, f"Path exists but is not a directory: {output_dir}"
+
+    if not os.access(output_dir, os.W_OK):
+        print(f"Validation failed: Directory not writable: {output_dir}")
+        return None, None, f"Output directory is not writable: {output_dir}"
+
+    if not base_filename:
+        print("Validation failed: Filename is empty")
+        return None, None, "Filename cannot be empty"
+
+    if not prompts:
+        print("Validation failed: No prompts selected")
+        return None, None, "Please select at least one prompt"
+
+    if not pasted_input and not use_url:
+        print("Validation failed: No input text provided")
+        return None, None, "Please provide input text or select URL mode"
+
+    if session and not ENGINE.sessions.Valid(session):
+        print(f"Validation failed: Invalid session ID: {session}")
+        return None, None, "Session ID may only hold up to 64 letters, digits, dots, dashes and underscores"
+
+    print("All validation checks passed!")
+
+    # Split filename and extension
+    filename_parts = base_filename.rsplit('.', 1)
+    base_name = filename_parts[0]
+    extension = filename_parts[1] if len(filename_parts) > 1 else ''
+
+    # Build one job per prompt, warning about files that will be overwritten
+    jobs = []
+    warnings = []
+    if url_details['cache'] == 'fresh':
+        warnings.append(f"URL content for {url_input} served from cache (fetched within the last {URLCACHE.ttl}s).")
+    elif url_details['cache'] == 'revalidated':
+        warnings.append(f"URL content for {url_input} served from cache (304 Not Modified).")
+    if url_details['truncated']:
+        warnings.append(f"Warning: {url_input} is larger than {URLCACHE.maxdownload // 1024} KB; only the first {URLCACHE.maxdownload // 1024} KB were used.")
+    if url_details['extracted']:
+        saved = url_details['raw_tokens'] - url_details['tokens']
+        percent = (100.0 * saved / url_details['raw_tokens']) if url_details['raw_tokens'] else 0.0
+        warnings.append(f"Extracted the main content of {url_input}: {url_details['raw_tokens']} tokens of HTML reduced to {url_details['tokens']} tokens of markdown ({percent:.0f}% smaller).")
+    for prompt in prompts:
+        prompt_filename = f"{base_name}_{prompt}.{extension}"
+        prompt_output = os.path.join(output_dir, prompt_filename)
+
+        if os.path.exists(prompt_output):
+            warnings.append(f"Warning: File {prompt_filename} already exists and will be overwritten.")
+
+        jobs.append({
+            'input_text': pasted_input,
+            'prompt': prompt,
+            'ai': ai,
+            'model': model,
+            'output': prompt_output,
+            'url': url_input if use_url else '',
+            'hedge': hedge,
+            'session': session
+        })
+
+    return jobs, warnings, None
+
+def file_status(output):
+    """
+    Reports whether an output file was written and how large it is.
+    Args:
+        output (str): The output file path.
+    Returns:
+        str: A one line status message.
+    """
+    filename = os.path.basename(output)
+    if os.path.exists(output):
+        file_size = os.path.getsize(output)
+        return f"✓ Successfully saved to {filename} (Size: {file_size/1024:.1f} KB)"
+    return f"⚠ Warning: File {filename} was not created"
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
@@ -110,114 +302,23 @@ def index():
     """
     if request.method == 'POST':
         try:
-            # Debug: Print all form data
-            print("Form data received:", request.form)
-            print("Form files:", request.files)
-            
-            # Get all form data with default values
-            pasted_input = request.form.get('pastedInput', '')
-            url_input = request.form.get('urlInput', '')
-            use_url = request.form.get('use_url') == 'true'
-            prompts = request.form.getlist('prompt')
-            ai = request.form.get('ai', '')
-            model = request.form.get('model', '')
-            output_path = request.form.get('output', '')  # This contains full path with filename
-            base_filename = request.form.get('filename', '')
-            
-            # Handle URL input if checkbox is checked
-            if use_url and url_input:
-                print(f"Fetching content from URL: {url_input}")
-                url_content, url_error = fetch_url_content(url_input)
-                if url_error:
-                    print(f"URL fetch error: {url_error}")
-                    return jsonify(error=f"Failed to fetch URL content: {url_error}"), 400
-                pasted_input = url_content
-                print(f"Successfully fetched {len(pasted_input)} characters from URL")
-            elif use_url and not url_input:
-                return jsonify(error="URL input is required when URL mode is selected"), 400
-
-            # Extract directory path from the full path
-            output_dir = os.path.dirname(output_path)
-            print(f"Extracted directory path: {output_dir}")
-
-            # Validation checks with detailed logging
-            if not output_dir:
-                print("Validation failed: Output directory is empty")
-                return jsonify(error="Output directory is empty"), 400
-                
-            print(f"Checking if directory exists: {output_dir}")
-            if not os.path.exists(output_dir):
-                print(f"Validation failed: Directory does not exist: {output_dir}")
-                return jsonify(error=f"Output directory does not exist: {output_dir}"), 400
-                
-            if not os.path.isdir(output_dir):
-                print(f"Validation failed: Not a directory: {output_dir}")
-                return jsonify(error=f"Path exists but is not a directory: {output_dir}"), 400
-                
-            if not os.access(output_dir, os.W_OK):
-                print(f"Validation failed: Directory not writable: {output_dir}")
-                return jsonify(error=f"Output directory is not writable: {output_dir}"), 400
-
-            if not base_filename:
-                print("Validation failed: Filename is empty")
-                return jsonify(error="Filename cannot be empty"), 400
-                
-            if not prompts:
-                print("Validation failed: No prompts selected")
-                return jsonify(error="Please select at least one prompt"), 400
-                
-            if not pasted_input and not use_url:
-                print("Validation failed: No input text provided")
-                return jsonify(error="Please provide input text or select URL mode"), 400
-
-            print("All validation checks passed!")
-            
-            # Split filename and extension
-            filename_parts = base_filename.rsplit('.', 1)
-            base_name = filename_parts[0]
-            extension = filename_parts[1] if len(filename_parts) > 1 else ''
-            
-            results = []
+            jobs, warnings, error = build_jobs(request.form)
+            if error:
+                return jsonify(error=error), 400
+
+            results = list(warnings)
             errors = []
-            
-            for prompt in prompts:
-                try:
-                    # Create unique filename for each prompt
-                    prompt_filename = f"{base_name}_{prompt}.{extension}"
-                    prompt_output = os.path.join(output_dir, prompt_filename)
-                    
-                    # Check if file already exists
-                    if os.path.exists(prompt_output):
-                        warning = f"Warning: File {prompt_filename} already exists and will be overwritten."
-                        results.append(warning)
-                    
-                    # Run mainstay and capture result
-                    result = run_mainstay(
-                        input_text=pasted_input,
-                        prompt=prompt,
-                        ai=ai,
-                        model=model,
-                        output=prompt_output,
-                        url=url_input if use_url else ''
-                    )
-                    
-                    # Verify file was created
-                    if os.path.exists(prompt_output):
-                        file_size = os.path.getsize(prompt_output)
-                        status = (
-                            f"✓ Successfully saved to {prompt_filename} "
-                            f"(Size: {file_size/1024:.1f} KB)"
-                        )
-                    else:
-                        status = f"⚠ Warning: File {prompt_filename} was not created"
-                    
-                    results.append(f"Results for '{prompt}':\n{status}\n{result}")
-                    
-                except Exception as e:
-                    error_msg = f"❌ Error processing prompt '{prompt}': {str(e)}"
-                    errors.append(error_msg)
+
+            # Run every prompt concurrently; results come back in the order submitted
+            for job, result in zip(jobs, ENGINE.RunMany(jobs)):
+                prompt = job['prompt']
+
+                if result['status'] != 'ok':
+                    errors.append(f"❌ Error processing prompt '{prompt}': {result['error']}")
                     continue
-            
+
+                results.append(f"Results for '{prompt}':\n{file_status(job['output'])}\n{format_result(result)}")
+
             # Combine results and errors
             all_messages = results + errors
             combined_result = "\n\n=== Next Prompt Results ===\n\n".join(all_messages)
@@ -232,45 +333,150 @@ def index():
     prompts = get_prompts()
     return render_template('index.html', prompts=prompts)
 
-def run_mainstay(input_text, prompt, ai, model, output, url=''):
+@app.route('/jobs', methods=['POST'])
+def submit_job():
     """
-    Runs the mainstay engine with the given parameters and input text.
+    Queues the submitted prompts as a background job and returns at once.
+    Returns:
+        JSON: The job ID and any overwrite warnings, with status 202.
+    """
+    jobs, warnings, error = build_jobs(request.form)
+    if error:
+        return jsonify(error=error), 400
+
+    try:
+        job_id = JOBS.Submit(jobs, warnings)
+    except Exception as e:
+        return jsonify(error=f"Unable to queue job: {str(e)}"), 500
+
+    return jsonify(job_id=job_id, warnings=warnings), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """
+    API endpoint reporting the progress of a queued job.
     Args:
-        input_text (str): The text to send as input.
-        prompt (str): The prompt to use.
-        ai (str): The AI provider.
-        model (str): The model to use.
-        output (str): The output file path.
-        url (str): The URL used for input (optional).
+        job_id (str): The ID returned by POST /jobs.
+    Returns:
+        JSON: The job status ('queued', 'running' or 'done'), has_errors, completed and total counts, warnings
+              and one entry per prompt with its status and, once finished, its formatted result.
+    """
+    job = JOBS.Get(job_id)
+    if job is None:
+        return jsonify(error=f"Unknown job: {job_id}"), 404
+
+    prompts = []
+    for task in job['tasks']:
+        entry = {'prompt': task['prompt'], 'status': task['status'], 'message': ''}
+        result = task['result']
+        if task['status'] == 'ok':
+            entry['message'] = f"Results for '{task['prompt']}':\n{file_status(task['output'])}\n{format_result(result)}"
+        elif task['status'] == 'error':
+            entry['message'] = f"❌ Error processing prompt '{task['prompt']}': {result.get('error', '')}"
+        prompts.append(entry)
+
+    return jsonify(job_id=job_id, status=job['status'], has_errors=job['has_errors'], completed=job['completed'],
+                   total=job['total'], warnings=job['warnings'], prompts=prompts)
+
+def sse(event, data):
+    """
+    Formats one Server-Sent Events message.
+    Args:
+        event (str): The event name.
+        data (dict): The payload, sent as JSON.
     Returns:
-        str: The output or error message from mainstay.
-    """
-    command = [
-        'python3', '/opt/mainstay/mainstay.py',
-        '--prompt', prompt,
-        '--ai', ai,
-        '--model', model,
-        '--output', output
-    ]
-    
-    # Add URL parameter if provided
-    if url:
-        command.extend(['--url', url])
-    
-    # Use shlex.join to properly escape the command arguments
-    cmd_str = shlex.join(command)
-    
-    # Use shell=True to allow piping, and pass the command as a string
-    process = subprocess.Popen(cmd_str, shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    
-    # Send the input_text to stdin and get the output
-    stdout, stderr = process.communicate(input=input_text)
-    
-    if process.returncode != 0:
-        # If there was an error, include stderr in the result
-        return f"Error: {stderr}"
-    
-    return stdout
+        str: The encoded message.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/stream', methods=['POST'])
+def stream():
+    """
+    Streaming counterpart of the index POST. Runs every selected prompt concurrently and
+    returns a text/event-stream of 'warning', 'token' and 'done' events tagged with the
+    prompt name, followed by a final 'end' event.
+    """
+    jobs, warnings, error = build_jobs(request.form)
+    if error:
+        return jsonify(error=error), 400
+
+    events = queue.Queue()
+
+    def produce(job):
+        try:
+            for event in ENGINE.RunStream(**job):
+                events.put((job, event))
+        except Exception as e:
+            result = ENGINE.NewResult(ENGINE.NewController(**job))
+            result['error'] = f"Unable to complete task: {str(e)}"
+            events.put((job, {'event': 'done', 'result': result}))
+
+    for job in jobs:
+        ENGINE.pool.submit(produce, job)
+
+    def generate():
+        for warning in warnings:
+            yield sse('warning', {'message': warning})
+
+        remaining = len(jobs)
+        while remaining > 0:
+            job, event = events.get()
+            if event['event'] == 'token':
+                yield sse('token', {'prompt': job['prompt'], 'text': event['text']})
+                continue
+
+            remaining -= 1
+            result = event['result']
+            if result['status'] != 'ok':
+                yield sse('done', {'prompt': job['prompt'], 'ok': False, 'message': f"❌ Error processing prompt '{job['prompt']}': {result['error']}"})
+            else:
+                usage = result['usage']
+                yield sse('done', {
+                    'prompt': job['prompt'],
+                    'ok': True,
+                    'message': file_status(job['output']),
+                    'ttft': result['ttft'],
+                    'elapsed': result['elapsed'],
+                    'cached': result['cached'],
+                    'coalesced': result['coalesced'],
+                    'hedged_to': result['ai'] if result.get('hedge', {}).get('fired') else '',
+                    'session_turn': result.get('session', {}).get('turn', 0),
+                    'input_tokens': usage.get('input_tokens', 0),
+                    'output_tokens': usage.get('output_tokens', 0),
+                    'cache_read_tokens': usage.get('cache_read_tokens', 0)
+                })
+
+        yield sse('end', {})
+
+    return Response(generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def format_result(result):
+    """
+    Formats a successful engine result for display in the web interface.
+    Args:
+        result (dict): Result dictionary returned by the engine.
+    Returns:
+        str: A one line timing/usage summary followed by the response text.
+    """
+    usage = result['usage']
+    summary = (
+        f"[*] {result['ai']} / {result['model']} responded in {result['elapsed']:.1f}s "
+        f"({usage.get('input_tokens', 0)} tokens in, {usage.get('output_tokens', 0)} tokens out)"
+    )
+    if usage.get('cache_read_tokens', 0) or usage.get('cache_write_tokens', 0):
+        summary += f" [prompt cache: {usage.get('cache_read_tokens', 0)} tokens read, {usage.get('cache_write_tokens', 0)} written]"
+    if result['cached']:
+        summary += " [served from cache]"
+    if result.get('coalesced'):
+        summary += " [shared with an identical request already in flight]"
+    if result.get('hedge', {}).get('fired'):
+        summary += f" [hedged after {result['hedge']['delay']:.1f}s, answered by {result['hedge']['winner']}]"
+    if result.get('session'):
+        summary += f" [turn {result['session']['turn']} of session {result['session']['id']}]"
+    if result.get('warning'):
+        summary += f"\n[-] {result['warning']}"
+
+    return f"{summary}\n\n{result['text']}"
 
 def get_output_paths():
     """
@@ -282,16 +488,11 @@ def get_output_paths():
 
 def get_prompts():
     """
-    Lists available prompt files (without .md extension).
+    Lists available prompt files (without .md extension) from the engine's in-memory prompt store.
     Returns:
         list: List of prompt names.
     """
-    prompt_dir = config.get('promptdir', '/opt/mainstay/prompts')
-    prompts = []
-    for file in os.listdir(prompt_dir):
-        if file.endswith('.md'):
-            prompts.append(file[:-3])  # Remove the .md extension
-    return prompts
+    return ENGINE.prompts.List()
 
 @app.route('/list_prompts')
 def list_prompts():
@@ -312,15 +513,67 @@ def view_prompt(prompt_name):
     Returns:
         JSON: Content of the prompt file or error message.
     """
-    prompt_dir = config.get('promptdir', '/opt/mainstay/prompts')
-    prompt_file = os.path.join(prompt_dir, f"{prompt_name}.md")
     try:
-        with open(prompt_file, 'r') as file:
-            content = file.read()
-        return jsonify(content=content)
+        return jsonify(content=ENGINE.prompts.Text(prompt_name))
     except Exception as e:
         return jsonify(error=f"Unable to read prompt file: {str(e)}"), 404
 
+@app.route('/cache_stats')
+def cache_stats():
+    """
+    API endpoint reporting the response cache, URL cache and request coalescing counters for this server process.
+    Returns:
+        JSON: Hits, misses, stores, evictions and bytes on disk, with the URL cache's fresh, revalidated and
+              fetched counts under 'urls', the provider calls made and coalesced under 'inflight' and the hedged
+              request races, wins and current delay per provider and model under 'hedge', and the requests
+              failed over and each circuit breaker's state, failure rate and latency under 'router'.
+    """
+    stats = ENGINE.cache.Stats()
+    stats['urls'] = URLCACHE.Stats()
+    stats['inflight'] = ENGINE.flights.Stats()
+    stats['hedge'] = ENGINE.hedger.Stats()
+    stats['router'] = ENGINE.router.Stats()
+    return jsonify(stats)
+
+@app.route('/search')
+def search():
+    """
+    API endpoint searching the outputs written earlier.
+    Query parameters:
+        q: Words, an FTS5 query such as 'emotet AND prompt:analyze_incident', or the SHA-256 of an input.
+        limit: Most results returned (default 20).
+    Returns:
+        JSON: The matching outputs, best first, each with path, url, prompt, model, ai, input_hash, written and a
+              snippet of the text around the match.
+    """
+    query = request.args.get('q', '')
+    if not query.strip():
+        return jsonify(error="The q parameter is required"), 400
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), 200)
+        return jsonify(results=ENGINE.search.Search(query, limit))
+    except ValueError:
+        return jsonify(error="limit must be a number"), 400
+    except Exception as e:
+        return jsonify(error=f"Unable to search: {str(e)}"), 500
+
+@app.route('/metrics')
+def metrics():
+    """
+    Prometheus scrape endpoint for this server process.
+    Returns:
+        Response: Request, provider call, token and URL fetch counters and latency histograms by provider and
+                  model, with the response cache, in-flight and circuit breaker gauges, in the Prometheus text format.
+    """
+    stats = ENGINE.cache.Stats()
+    ENGINE.metrics.Set('mainstay_response_cache_lookups_total', stats['hits'], result='hits')
+    ENGINE.metrics.Set('mainstay_response_cache_lookups_total', stats['misses'], result='misses')
+    ENGINE.metrics.Set('mainstay_response_cache_bytes', ENGINE.cache.Size())
+    for name, breaker in ENGINE.router.Stats()['breakers'].items():
+        ai, model = name.split(':', 1)
+        ENGINE.metrics.Set('mainstay_breaker_state', ['closed', 'open', 'half-open'].index(breaker['state']), model=model, provider=ai)
+    return Response(ENGINE.metrics.Render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/list_models')
 def list_models():
     """
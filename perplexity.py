@@ -20,7 +20,7 @@ along with Mainstay v0.4.  If not, see <http://www.gnu.org/licenses/>.
 """
 perplexity.py - Handles connecting to the Perplexity API for Mainstay v0.4
 
-This module provides functionality to list available Perplexity LLM models and to send prompts to the Perplexity API, saving the responses to a file. It is designed to be used as part of the Mainstay framework.
+This module provides functionality to list available Perplexity LLM models and to send prompts to the Perplexity API, returning the responses to the engine. It is designed to be used as part of the Mainstay framework.
 
 Classes:
     perplexity: Handles model listing and API interaction for Perplexity.
@@ -29,16 +29,9 @@ Copyright 2025 James Slaughter. Licensed under GPL v3 or later.
 """
 
 #python imports
-import os
-import sys
 import json
-import datetime
-import requests
-from io import StringIO
 from collections import defaultdict
 from array import *
-from rich.console import Console
-from rich.markdown import Markdown
 
 #programmer generated imports
 from logger import logger
@@ -52,17 +45,20 @@ Class: This class is is responsible for keeping global settings available throug
 class perplexity:
     """
     The perplexity class provides methods to interact with the Perplexity AI API.
-    It can list available models and execute prompts using the API.
+    It can list available models and send prompts to the API.
     """
     '''
     Constructor
     '''
-    def __init__(self):
+    def __init__(self, clients):
         """
         Initializes the perplexity class.
-        Currently, no properties are set in the constructor.
+
+        Args:
+            clients: The process-wide client registry that owns the shared requests session.
         """
-        fn = ''
+        self.clients = clients
+        self.params = {}#sampling parameters sent with every request, the API defaults are used
 
     '''
     ListModels()
@@ -107,140 +103,137 @@ class perplexity:
         return 0
 
     '''
-    Execute()
-    Function: - Does the doing against a target
+    Query()
+    Function: - Sends a prompt and input to the Perplexity API
+              - Returns the response text, citations and metadata to the caller
     '''
-    def Execute(self, CON, LOG):
+    def Query(self, CON, LOG, apikey, system_input, user_input):
         """
-        Sends a prompt to the Perplexity API and writes the response to a file.
+        Sends a single prompt to the Perplexity API and returns the response.
 
         Args:
-            CON: Controller object containing configuration, input, and state.
+            CON: Controller object containing the model and debug settings.
             LOG: Logger object for colored output.
+            apikey: The Perplexity API key.
+            system_input: Content of the prompt file, sent as the system message.
+            user_input: The text to analyze, sent as the user message after the session history in
+                        CON.conversational_history, if any.
 
         Returns:
-            int: 0 on success, -1 on error (e.g., missing API key or prompt file).
+            dict: Response text, citations and token usage.
+
+        Raises:
+            Exception: Any error raised while sending the request or parsing the response.
         """
-        # Initialize variables
-        system_input = ''
-        prompt_read = ''        
-        promptfile = ''
-        data = ''
-        current_dateTime = datetime.date.today()
-        apikey = ''
-        output = ''      
-
-        # Determine output file path
-        if (len(CON.output) != 0):
-            output = CON.output
-        else:
-            output = CON.logroot + '/' + str(current_dateTime) + '.md'
-
-        # Find the Perplexity API key in the config
-        for apikeys in CON.apikeys: 
-            for key, value in apikeys.items():
-                if (CON.debug == True):
-                    print ('[DEBUG] API: ' + str(key) + ' | API Key: ' + str(value))
-                if (key == 'perplexity'):
-                    print ('\r\n[*] API key located!')
-                    apikey = value            
+        url = self.clients.BaseURL('perplexity') + "/chat/completions"
 
-        if (apikey == ''):
-            # API key is required
-            print (LOG.colored('\r\n[x] Unable to execute Mainstay - Perplexity apikey value not input.  Please add one to /opt/mainstay/mainstay.conf', 'echoerror', bold=True))
-            return -1
-        else:
-            # Set API key as environment variable
-            os.environ["PERPLEXITY_API_KEY"] = apikey                        
+        # Prepare the payload for the API request
+        payload = {
+            "model": CON.model,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": system_input
+                },
+                *CON.conversational_history,
+                {
+                    "role": "user",
+                    "content": f"{user_input}"
+                }
+            ],
+            **self.params
+        }
+        headers = {
+            "Authorization": "Bearer " + apikey,
+            "Content-Type": "application/json"
+        }
 
-        console = Console()
+        # Send the request to the Perplexity API
+        response = self.clients.Session().post(url, json=payload, headers=headers, timeout=self.clients.Timeout())
+        response.raise_for_status()
 
-        print ('[*] Model is: ' + CON.model + '\r\n')
+        # Parse the response JSON
+        data = json.loads(response.text)
 
-        # Build the prompt file path
-        promptfile = CON.promptdir + '/' + CON.prompt + '.md'
+        if (CON.debug == True):
+            print(json.dumps(data, indent=4))
 
-        # Read the prompt file
-        try:
-            with open(promptfile, "r+") as read_file:
-                prompt_read = read_file.read()            
-        except Exception as e:
-            print (LOG.colored('[x] Unable to find prompt file: ' + str(e), 'echoerror', bold=True))
-            return -1   
+        usage = {'input_tokens': 0, 'output_tokens': 0}
+        if ('usage' in data):
+            usage['input_tokens'] = data['usage'].get('prompt_tokens', 0)
+            usage['output_tokens'] = data['usage'].get('completion_tokens', 0)
 
-        url = "https://api.perplexity.ai/chat/completions"
+        return {'text': data['choices'][0]['message']['content'], 'citations': data.get('citations', []), 'usage': usage}
 
-        # Prepare the payload for the API request
-        if (len(CON.input) != 0):
-            payload = {
-                "model": CON.model,
-                "messages": [
-                    {
-                        "role": "system", 
-                        "content": prompt_read
-                    },
-                    {
-                        "role": "user", 
-                        "content": f"{CON.input}"
-                    }
-                ]
-            }
-            headers = {
-                "Authorization": "Bearer " + apikey,
-                "Content-Type": "application/json"
-            }
-        else:
-            payload = {
-                "model": CON.model,
-                "messages": [
-                    {
-                        "role": "system", 
-                        "content": prompt_read
-                    },
-                    {
-                        "role": "user", 
-                        "content": f"{CON.pipe}"
-                    }
-                ]
-            }
-            headers = {
-                "Authorization": "Bearer " + apikey,
-                "Content-Type": "application/json"
-            }
+    '''
+    Stream()
+    Function: - Sends a prompt and input to the Perplexity API as a Server-Sent Events stream
+              - Yields the response a token at a time as it arrives
+    '''
+    def Stream(self, CON, LOG, apikey, system_input, user_input, opened=None):
+        """
+        Streaming counterpart of Query().  Perplexity sends the citations and usage with the stream chunks, so they
+        are only complete once the stream ends.  opened, when given, is called with the open response before the
+        first token so another thread can end it with clients.Abort().
 
-        # Send the request to the Perplexity API
-        try:
-            response = requests.request("POST", url, json=payload, headers=headers)
-            print (LOG.colored('[*] Prompt response...\r\n', 'echoinfo', bold=True))        
-        except Exception as e:
-            print (LOG.colored('[x] Unable to complete task: ' + str(e), 'echoerror', bold=True))
-            return -1
-        
-        # Parse the response JSON
-        data = json.loads(response.text)
+        Yields:
+            dict: {'text': <delta>} for each piece of the response, then {'response': <dict as returned by Query()>}.
 
-        if (CON.debug == True):
-            print(json.dumps(data, indent=4))    
-
-        # Write the response and citations to the output file
-        try:          
-            with open(output, "w", encoding='utf-8') as write_file:
-                # Write header lines
-                write_file.write("\n")  # Blank line
-                write_file.write(f"URL: {CON.url}\n")  # URL line - populated with actual URL if available
-                write_file.write("TAGS: \n")  # Tags line
-                write_file.write("\n")  # Another blank line
-                # Write citations
-                for citation in data['citations']:
-                    console.print(Markdown(citation))
-                    write_file.write(citation + '\n')
-                write_file.write("\n")  # Blank line
-                console.print(Markdown(data['choices'][0]['message']['content']))
-                write_file.write(data['choices'][0]['message']['content'] + '\n')                
-                
-            print (LOG.colored('\r\n[*] Prompt response has been written to file here: ', 'echoinfo', bold=True) + LOG.colored(output, 'echolink', bold=True))
-        except Exception as e:
-            print (LOG.colored('[x] Unable to complete task: ' + str(e), 'echoerror', bold=True))
-            return -1
-
-        return 0
\ No newline at end of file
+        Raises:
+            Exception: Any error raised while sending the request or parsing the stream.
+        """
+        url = self.clients.BaseURL('perplexity') + "/chat/completions"
+        text = []
+        citations = []
+        usage = {'input_tokens': 0, 'output_tokens': 0}
+
+        payload = {
+            "model": CON.model,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": system_input
+                },
+                *CON.conversational_history,
+                {
+                    "role": "user",
+                    "content": f"{user_input}"
+                }
+            ],
+            "stream": True,
+            **self.params
+        }
+        headers = {
+            "Authorization": "Bearer " + apikey,
+            "Content-Type": "application/json",
+            "Accept": "text/event-stream"
+        }
+
+        with self.clients.Session().post(url, json=payload, headers=headers, timeout=self.clients.Timeout(), stream=True) as response:
+            response.raise_for_status()
+            if (opened is not None):
+                opened(response)
+            for line in response.iter_lines(decode_unicode=True):
+                # Each event is a 'data: <json>' line, the stream ends with 'data: [DONE]'
+                if ((not line) or (not line.startswith('data:'))):
+                    continue
+                data = line[5:].strip()
+                if (data == '[DONE]'):
+                    break
+                chunk = json.loads(data)
+
+                if (CON.debug == True):
+                    print(json.dumps(chunk, indent=4))
+
+                if ('citations' in chunk):
+                    citations = chunk['citations']
+                if ('usage' in chunk):
+                    usage['input_tokens'] = chunk['usage'].get('prompt_tokens', 0)
+                    usage['output_tokens'] = chunk['usage'].get('completion_tokens', 0)
+                if (len(chunk.get('choices', [])) > 0):
+                    delta = chunk['choices'][0].get('delta', {}).get('content')
+                    if (delta):
+                        text.append(delta)
+                        yield {'text': delta}
+
+        yield {'response': {'text': ''.join(text), 'citations': citations, 'usage': usage}}
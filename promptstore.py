@@ -0,0 +1,184 @@
+'''
+Mainstay v0.4 - Copyright 2025 James Slaughter,
+This file is part of Mainstay v0.4.
+
+Mainstay v0.4 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Mainstay v0.4 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Mainstay v0.4.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+"""
+promptstore.py - In-memory prompt library for Mainstay v0.4
+
+This module keeps the prompt files in promptdir in memory.  Each prompt is read once, along with its SHA-256
+content hash and token count, and is only read again when its modification time changes.  The list of prompts is
+rescanned only when the directory's modification time changes.  Disk checks are rate limited, so repeated lookups
+in a long-running process are served from memory.
+
+Classes:
+    promptstore: Lists prompts and returns their text, hash and token count.
+
+Copyright 2025 James Slaughter. Licensed under GPL v3 or later.
+"""
+
+#python imports
+import os
+import time
+import hashlib
+import threading
+
+'''
+promptstore
+Class: This class is responsible for loading prompt files and keeping them in memory
+'''
+class promptstore:
+    """
+    The promptstore class holds one entry per prompt: name, path, text, hash, tokens and the file's mtime.
+    """
+    '''
+    Constructor
+    '''
+    def __init__(self, promptdir, counter=None, recheck=2.0):
+        """
+        Initializes the store.  Nothing is read until the first lookup.
+
+        Args:
+            promptdir: Directory holding the <name>.md prompt files.
+            counter: Function returning the token count of a string.  A four-characters-per-token estimate is
+                     used when none is given.
+            recheck: Seconds a directory listing or prompt is served from memory before its mtime is checked
+                     again.  0 checks on every lookup.
+        """
+        self.promptdir = promptdir
+        self.counter = counter
+        self.recheck = float(recheck)
+        self.lock = threading.Lock()
+        self.names = []#sorted prompt names
+        self.dirmtime = None#mtime_ns of promptdir when names was built
+        self.dirchecked = 0.0#time.monotonic() of the last directory check
+        self.entries = {}#prompt name -> entry dictionary
+        self.loads = 0#prompt files read from disk
+        self.hits = 0#lookups served from memory
+
+    '''
+    Count()
+    Function: - Returns the token count of a string
+    '''
+    def Count(self, text):
+        if (self.counter is not None):
+            return self.counter(text)
+
+        return len(text) // 4 + 1
+
+    '''
+    List()
+    Function: - Returns the sorted names of the available prompts
+    '''
+    def List(self):
+        """
+        Returns the names of the prompt files in promptdir, without the .md extension.  The directory is only
+        rescanned when its mtime has changed.
+
+        Returns:
+            list: Sorted prompt names, empty if promptdir cannot be read.
+        """
+        now = time.monotonic()
+
+        with self.lock:
+            if ((self.dirmtime is not None) and ((now - self.dirchecked) < self.recheck)):
+                return list(self.names)
+
+            self.dirchecked = now
+            try:
+                dirmtime = os.stat(self.promptdir).st_mtime_ns
+            except Exception:
+                self.names = []
+                self.dirmtime = None
+                return []
+
+            if (dirmtime != self.dirmtime):
+                names = []
+                for entry in os.scandir(self.promptdir):
+                    if (entry.name.endswith('.md') and entry.is_file()):
+                        names.append(entry.name[:-3])
+                self.names = sorted(names)
+                self.dirmtime = dirmtime
+                for name in list(self.entries):
+                    if (name not in self.names):
+                        del self.entries[name]
+
+            return list(self.names)
+
+    '''
+    Get()
+    Function: - Returns the entry for a prompt, reading the file if it is new or has changed
+    '''
+    def Get(self, name):
+        """
+        Returns a prompt.
+
+        Args:
+            name: Prompt name without the .md extension.
+
+        Returns:
+            dict: name, path, text, hash (SHA-256 hex digest of the text), tokens and mtime.
+
+        Raises:
+            Exception: If there is no such prompt or the file cannot be read.
+        """
+        now = time.monotonic()
+
+        with self.lock:
+            entry = self.entries.get(name)
+            if ((entry is not None) and ((now - entry['checked']) < self.recheck)):
+                self.hits += 1
+                return entry
+
+        if (name not in self.List()):
+            raise Exception('No prompt named ' + repr(name) + ' in ' + self.promptdir)
+
+        path = os.path.join(self.promptdir, name + '.md')
+        mtime = os.stat(path).st_mtime_ns
+
+        with self.lock:
+            entry = self.entries.get(name)
+            if ((entry is not None) and (entry['mtime'] == mtime)):
+                entry['checked'] = now
+                self.hits += 1
+                return entry
+
+        with open(path, 'r', encoding='utf-8') as read_file:
+            text = read_file.read()
+
+        entry = {'name': name, 'path': path, 'text': text, 'hash': hashlib.sha256(text.encode('utf-8')).hexdigest(),
+                 'tokens': self.Count(text), 'mtime': mtime, 'checked': now}
+
+        with self.lock:
+            self.entries[name] = entry
+            self.loads += 1
+
+        return entry
+
+    '''
+    Text()
+    Function: - Returns the text of a prompt
+    '''
+    def Text(self, name):
+        return self.Get(name)['text']
+
+    '''
+    Stats()
+    Function: - Returns the store counters
+    '''
+    def Stats(self):
+        with self.lock:
+            return {'prompts': len(self.names), 'loaded': len(self.entries), 'loads': self.loads, 'hits': self.hits}
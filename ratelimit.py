@@ -0,0 +1,352 @@
+'''
+Mainstay v0.4 - Copyright 2025 James Slaughter,
+This file is part of Mainstay v0.4.
+
+Mainstay v0.4 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Mainstay v0.4 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Mainstay v0.4.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+"""
+ratelimit.py - Provider rate limiting and retries for Mainstay v0.4
+
+This module keeps calls to each provider and model under the account's requests-per-minute and tokens-per-minute
+quotas, and retries calls the provider rejects for being over quota or briefly unavailable.  Each provider and
+model has a pair of token buckets filled at a little under the configured quota, so many concurrent jobs queue
+up and run at a steady rate instead of failing together.  Failed calls are retried with exponential backoff and
+full jitter.  A Retry-After header from the provider takes precedence, and pauses every caller sharing the
+bucket, not just the one that was rejected.
+
+Classes:
+    bucket: A requests-per-minute and tokens-per-minute token bucket pair for one provider and model.
+    ratelimiter: Holds the buckets and decides whether and when a failed call is retried.
+
+Copyright 2025 James Slaughter. Licensed under GPL v3 or later.
+"""
+
+#python imports
+import time
+import random
+import threading
+import email.utils
+
+'''
+bucket
+Class: This class is responsible for pacing the calls made to one provider and model
+'''
+class bucket:
+    """
+    The bucket class holds the request and token allowances for one provider and model.  A limit of 0 means
+    unlimited.
+    """
+    '''
+    Constructor
+    '''
+    def __init__(self, rpm, tpm):
+        """
+        Initializes the bucket full.
+
+        Args:
+            rpm: Requests allowed per minute.
+            tpm: Tokens allowed per minute.
+        """
+        self.rpm = float(rpm)
+        self.tpm = float(tpm)
+        self.requests = self.rpm#requests available now
+        self.tokens = self.tpm#tokens available now, negative after a call used more than it reserved
+        self.updated = time.monotonic()
+        self.pausedtill = 0.0#time.monotonic() before which no call may start, set from Retry-After
+        self.lock = threading.Lock()
+
+    '''
+    Refill()
+    Function: - Adds the allowance accrued since the last update, the caller holds the lock
+    '''
+    def Refill(self, now):
+        elapsed = now - self.updated
+        self.updated = now
+        if (self.rpm > 0):
+            self.requests = min(self.rpm, self.requests + elapsed * self.rpm / 60.0)
+        if (self.tpm > 0):
+            self.tokens = min(self.tpm, self.tokens + elapsed * self.tpm / 60.0)
+
+    '''
+    Acquire()
+    Function: - Blocks until one request and the given number of tokens are available, then takes them
+    '''
+    def Acquire(self, tokens):
+        """
+        Takes one request and tokens from the bucket, sleeping until they are available.  A call larger than the
+        whole per-minute token allowance waits for a full bucket rather than forever.
+
+        Returns:
+            float: Seconds spent waiting.
+        """
+        waited = 0.0
+        if (self.tpm > 0):
+            tokens = min(tokens, self.tpm)
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.Refill(now)
+                wait = self.pausedtill - now
+                if (wait <= 0):
+                    if ((self.rpm > 0) and (self.requests < 1)):
+                        wait = (1 - self.requests) * 60.0 / self.rpm
+                    elif ((self.tpm > 0) and (self.tokens < tokens)):
+                        wait = (tokens - self.tokens) * 60.0 / self.tpm
+                    else:
+                        if (self.rpm > 0):
+                            self.requests -= 1
+                        if (self.tpm > 0):
+                            self.tokens -= tokens
+                        return waited
+
+            time.sleep(wait)
+            waited += wait
+
+    '''
+    Adjust()
+    Function: - Charges or refunds the difference between the tokens reserved and the tokens used
+    '''
+    def Adjust(self, tokens):
+        if (self.tpm <= 0):
+            return
+
+        with self.lock:
+            self.Refill(time.monotonic())
+            self.tokens = min(self.tpm, self.tokens - tokens)
+
+    '''
+    Pause()
+    Function: - Stops every caller of this bucket from starting a call for a number of seconds
+    '''
+    def Pause(self, seconds):
+        with self.lock:
+            self.pausedtill = max(self.pausedtill, time.monotonic() + seconds)
+
+'''
+ratelimiter
+Class: This class is responsible for rate limiting and retrying provider calls
+'''
+class ratelimiter:
+    """
+    The ratelimiter class owns one bucket per provider and model and the retry policy.
+    """
+    '''
+    Constructor
+    '''
+    def __init__(self, config):
+        """
+        Initializes the limiter.
+
+        Args:
+            config: Dictionary loaded from mainstay.conf.  Optional keys are ratelimits
+                    ({"<ai>" or "<ai>:<model>": {"rpm": requests per minute, "tpm": tokens per minute}}),
+                    ratelimitheadroom (fraction of the quota to use, default 0.9), maxretries (default 5),
+                    backoffbase (seconds, default 1) and backoffmax (seconds, default 60).
+        """
+        self.ratelimits = config.get('ratelimits', {})
+        self.headroom = float(config.get('ratelimitheadroom', 0.9))
+        self.maxretries = int(config.get('maxretries', 5))
+        self.backoffbase = float(config.get('backoffbase', 1))
+        self.backoffmax = float(config.get('backoffmax', 60))
+        self.retrystatus = [408, 409, 429, 500, 502, 503, 504, 529]#529 is Anthropic's overloaded status
+        self.retryerrors = ['APIConnectionError', 'APITimeoutError', 'ConnectionError', 'ConnectTimeout', 'ReadTimeout',
+                            'Timeout', 'ChunkedEncodingError', 'RemoteProtocolError']
+        self.lock = threading.Lock()
+        self.buckets = {}#(ai, model) -> bucket
+        self.retries = 0
+        self.throttled = 0.0#seconds callers spent waiting for the buckets
+
+    '''
+    Bucket()
+    Function: - Returns the bucket for a provider and model, creating it on first use
+    '''
+    def Bucket(self, ai, model):
+        with self.lock:
+            if ((ai, model) not in self.buckets):
+                limits = self.ratelimits.get(ai + ':' + model, self.ratelimits.get(ai, {}))
+                self.buckets[(ai, model)] = bucket(float(limits.get('rpm', 0)) * self.headroom,
+                                                   float(limits.get('tpm', 0)) * self.headroom)
+
+        return self.buckets[(ai, model)]
+
+    '''
+    Acquire()
+    Function: - Waits until a call of a given size may be made to a provider and model
+    '''
+    def Acquire(self, ai, model, tokens):
+        waited = self.Bucket(ai, model).Acquire(tokens)
+
+        if (waited > 0):
+            with self.lock:
+                self.throttled += waited
+
+        return waited
+
+    '''
+    Settle()
+    Function: - Corrects the bucket once a call's actual token usage is known
+    '''
+    def Settle(self, ai, model, reserved, usage):
+        used = usage.get('input_tokens', 0) + usage.get('output_tokens', 0)
+        if (used > 0):
+            self.Bucket(ai, model).Adjust(used - reserved)
+
+    '''
+    Refund()
+    Function: - Gives back the tokens reserved for a call attempt that failed or was abandoned before its answer
+    '''
+    def Refund(self, ai, model, reserved):
+        current = self.Bucket(ai, model)
+        # Acquire() never takes more than the whole per-minute allowance, so neither is more given back
+        current.Adjust(-min(reserved, current.tpm))
+
+    '''
+    Status()
+    Function: - Returns the HTTP status code carried by a provider error, or 0
+    '''
+    def Status(self, error):
+        status = getattr(error, 'status_code', None)
+        if (status is None):
+            status = getattr(getattr(error, 'response', None), 'status_code', 0)
+
+        try:
+            return int(status)
+        except Exception:
+            return 0
+
+    '''
+    RetryAfter()
+    Function: - Returns the delay a provider asked for in its Retry-After header, or None
+    '''
+    def RetryAfter(self, error):
+        """
+        Reads retry-after-ms or Retry-After (seconds or an HTTP date) from the response attached to error.
+        """
+        headers = getattr(getattr(error, 'response', None), 'headers', None)
+        if (headers is None):
+            return None
+
+        try:
+            if (headers.get('retry-after-ms') is not None):
+                return float(headers.get('retry-after-ms')) / 1000.0
+            value = headers.get('retry-after')
+            if (value is None):
+                return None
+            try:
+                return float(value)
+            except ValueError:
+                return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except Exception:
+            return None
+
+    '''
+    Transient()
+    Function: - Returns True for errors that say the provider is overloaded or unreachable rather than that the request is bad
+    '''
+    def Transient(self, error):
+        return ((self.Status(error) in self.retrystatus) or (type(error).__name__ in self.retryerrors))
+
+    '''
+    Backoff()
+    Function: - Decides whether a failed call is retried and how long to wait first
+    '''
+    def Backoff(self, ai, model, error, attempt):
+        """
+        Returns the number of seconds to wait before retrying a failed call, or None if it should not be retried.
+        Rate limit (429), timeout, overload and 5xx responses and connection errors are retried up to maxretries
+        times.  The wait is the provider's Retry-After when it sends one, which also pauses every other caller of
+        the same provider and model; otherwise it is a random time up to backoffbase * 2^attempt, capped at
+        backoffmax.
+
+        Args:
+            ai: chatgpt, perplexity or claude.
+            model: Model name.
+            error: The exception raised by the provider.
+            attempt: Number of retries already made for this call.
+        """
+        status = self.Status(error)
+        if (attempt >= self.maxretries):
+            return None
+        if (self.Transient(error) == False):
+            return None
+
+        delay = self.RetryAfter(error)
+        if (delay is not None):
+            delay = min(delay, self.backoffmax)
+            self.Bucket(ai, model).Pause(delay)
+        else:
+            delay = random.uniform(0, min(self.backoffmax, self.backoffbase * (2 ** attempt)))
+            if (status == 429):
+                self.Bucket(ai, model).Pause(delay)
+
+        with self.lock:
+            self.retries += 1
+
+        return delay
+
+    '''
+    Call()
+    Function: - Makes a provider call under the rate limit, retrying it when it fails transiently
+    '''
+    def Call(self, ai, model, tokens, function, debug=False):
+        """
+        Runs function() once the bucket for ai and model allows a call of the given size, and retries it as
+        Backoff() decides.  Each attempt reserves the tokens again, and an attempt that fails or is abandoned
+        gives its reservation back, so a run of retries does not drain the bucket several times over.
+
+        Args:
+            ai: chatgpt, perplexity or claude.
+            model: Model name.
+            tokens: Tokens reserved for the call, normally the input size plus the expected output.
+            function: Makes the call and returns a response dictionary with usage.
+            debug: Prints each retry.
+
+        Returns:
+            dict: The response returned by function.
+
+        Raises:
+            Exception: The last error when the call is not retried.
+        """
+        attempt = 0
+
+        while True:
+            self.Acquire(ai, model, tokens)
+            try:
+                response = function()
+            except BaseException as e:
+                self.Refund(ai, model, tokens)
+                if (not isinstance(e, Exception)):
+                    raise
+                delay = self.Backoff(ai, model, e, attempt)
+                if (delay is None):
+                    raise
+                if (debug == True):
+                    print ('[DEBUG] ' + ai + ' ' + model + ' call failed (' + str(e) + '), retry ' + str(attempt + 1) + ' in ' + str(round(delay, 2)) + 's')
+                attempt += 1
+                time.sleep(delay)
+                continue
+
+            self.Settle(ai, model, tokens, response.get('usage', {}))
+
+            return response
+
+    '''
+    Stats()
+    Function: - Returns the limiter counters
+    '''
+    def Stats(self):
+        with self.lock:
+            return {'retries': self.retries, 'throttled_seconds': round(self.throttled, 3)}
@@ -0,0 +1,123 @@
+'''
+Mainstay v0.4 - Copyright 2025 James Slaughter,
+This file is part of Mainstay v0.4.
+
+Mainstay v0.4 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Mainstay v0.4 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Mainstay v0.4.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+"""
+registry.py - Provider plugin registry for Mainstay v0.4
+
+This module maps AI provider names to the modules that implement them and imports a provider only the first
+time it is used.  A run with --ai claude never loads the OpenAI SDK, and commands such as --listprompts load
+no provider at all.  Additional providers can be registered from mainstay.conf without changing Mainstay.
+
+Classes:
+    registry: Name to provider lookup that imports and constructs each provider on first use.
+
+Copyright 2025 James Slaughter. Licensed under GPL v3 or later.
+"""
+
+#python imports
+import importlib
+import threading
+
+'''
+registry
+Class: This class is responsible for loading AI provider modules on demand
+'''
+class registry:
+    """
+    The registry class behaves like a read-only dictionary of provider name -> provider object whose values are
+    created the first time they are looked up.
+    """
+    '''
+    Constructor
+    '''
+    def __init__(self, config, clients):
+        """
+        Initializes the registry.  No provider module is imported here.
+
+        Args:
+            config: Dictionary loaded from mainstay.conf.  The optional plugins key registers extra providers:
+                    {"<name>": {"module": "<python module>", "class": "<class name>", "vendor": "<apikeys key>"}}.
+                    The class is constructed with the shared clients registry, like the built-in providers.
+            clients: The clients registry handed to each provider.
+        """
+        self.clients = clients
+        self.lock = threading.Lock()
+        self.loaded = {}#provider name -> provider object
+        self.plugins = {
+            'chatgpt': {'module': 'chatgpt', 'class': 'chatgpt', 'vendor': 'openai'},
+            'claude': {'module': 'claude', 'class': 'claude', 'vendor': 'anthropic'},
+            'perplexity': {'module': 'perplexity', 'class': 'perplexity', 'vendor': 'perplexity'}
+        }
+        self.plugins.update(config.get('plugins', {}))
+        self.vendors = {}#provider name -> key used for it in apikeys and defaultmodels
+        for name, plugin in self.plugins.items():
+            self.vendors[name] = plugin.get('vendor', name)
+
+    '''
+    get()
+    Function: - Returns the provider object for a name, importing it on first use
+    '''
+    def get(self, name, default=None):
+        """
+        Returns the provider registered as name, or default if there is none.
+
+        Raises:
+            Exception: If the provider's module cannot be imported, for example because its SDK is not installed.
+        """
+        if (name not in self.plugins):
+            return default
+
+        with self.lock:
+            if (name not in self.loaded):
+                plugin = self.plugins[name]
+                module = importlib.import_module(plugin['module'])
+                self.loaded[name] = getattr(module, plugin['class'])(self.clients)
+
+        return self.loaded[name]
+
+    '''
+    __getitem__()
+    Function: - Returns the provider object for a name, raising KeyError for an unknown name
+    '''
+    def __getitem__(self, name):
+        if (name not in self.plugins):
+            raise KeyError(name)
+
+        return self.get(name)
+
+    '''
+    __contains__()
+    Function: - Returns True when a provider is registered under a name
+    '''
+    def __contains__(self, name):
+        return (name in self.plugins)
+
+    '''
+    __iter__()
+    Function: - Iterates over the registered provider names without loading them
+    '''
+    def __iter__(self):
+        return iter(self.plugins)
+
+    '''
+    Loaded()
+    Function: - Returns the names of the providers imported so far
+    '''
+    def Loaded(self):
+        with self.lock:
+            return list(self.loaded)
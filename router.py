@@ -0,0 +1,418 @@
+'''
+Mainstay v0.4 - Copyright 2025 James Slaughter,
+This file is part of Mainstay v0.4.
+
+Mainstay v0.4 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Mainstay v0.4 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Mainstay v0.4.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+"""
+router.py - Provider health tracking and failover for Mainstay v0.4
+
+This module keeps a circuit breaker for each provider and model.  The breaker records every provider call over
+a rolling window.  A call counts as failed when it ends with a rate limit, overload, 5xx, timeout or connection
+error after its retries, or when it takes longer than the slow call threshold.  Once enough calls are recorded
+and the failure rate passes the threshold, the breaker opens.  Calls to that provider and model then fail at once
+instead of waiting out their retries, and the engine fails them over to the next provider in defaultmodels.
+After the cooldown the breaker is half-open: one call is let through as a probe.  The breaker closes if the
+probe succeeds and opens again if it fails.  Breaker state is kept in the state directory, so separate CLI runs
+share what earlier runs learned.
+
+Classes:
+    circuitopen: Raised instead of calling a provider and model whose breaker is open.
+    breaker: Rolling call record and state of one provider and model.
+    router: Holds the breakers and picks the provider a failed request moves to.
+
+Copyright 2025 James Slaughter. Licensed under GPL v3 or later.
+"""
+
+#python imports
+import os
+import json
+import time
+import threading
+
+#programmer generated imports
+from fileio import fileio
+
+'''
+circuitopen
+Class: This class is raised in place of a call to an unhealthy provider
+'''
+class circuitopen(Exception):
+    """
+    Raised when the breaker of the provider and model a request is for does not allow calls.
+    """
+    '''
+    Constructor
+    '''
+    def __init__(self, ai, model, seconds):
+        self.ai = ai
+        self.model = model
+        self.seconds = seconds#time until the breaker lets a probe through
+        super().__init__(ai + ' ' + model + ' is failing; calls are paused for another ' + str(round(seconds)) + 's')
+
+'''
+breaker
+Class: This class is responsible for the health of one provider and model
+'''
+class breaker:
+    """
+    The breaker class holds the calls made to one provider and model within the window and the breaker state:
+    closed (calls allowed), open (calls refused until a time) or half-open (one probe call allowed).  Times are
+    wall clock seconds so that the state can be saved and read by another process.  The caller holds the
+    router's lock.
+    """
+    '''
+    Constructor
+    '''
+    def __init__(self, state=None):
+        """
+        Initializes the breaker closed, or from a dictionary saved by Save().
+        """
+        state = state or {}
+        self.calls = [tuple(call) for call in state.get('calls', [])]#(time, failed, seconds) of each call in the window
+        self.state = state.get('state', 'closed')
+        self.openuntil = float(state.get('openuntil', 0.0))#time the breaker becomes half-open
+        self.probing = float(state.get('probing', 0.0))#time the current half-open probe was let through, 0 if none
+        self.opened = int(state.get('opened', 0))#times the breaker has opened
+
+    '''
+    Allow()
+    Function: - Decides whether a call may be made now
+    '''
+    def Allow(self, now, cooldown):
+        """
+        Returns True when the breaker is closed, or when it is half-open and no probe is out.  A probe that never
+        reported back, for example because the request was answered from the cache, is replaced after the
+        cooldown.
+        """
+        if (self.state == 'closed'):
+            return True
+        if (self.state == 'open'):
+            if (now < self.openuntil):
+                return False
+            self.state = 'half-open'
+        if ((self.probing > 0.0) and (now - self.probing < cooldown)):
+            return False
+
+        self.probing = now
+
+        return True
+
+    '''
+    Healthy()
+    Function: - Returns whether Allow() would let a call through now, without changing the state
+    '''
+    def Healthy(self, now, cooldown):
+        """
+        Read-only counterpart of Allow(), for choosing a provider.  Unlike Allow() it does not take the half-open
+        probe, which is left for the call that Check() lets through.
+        """
+        if (self.state == 'closed'):
+            return True
+        if ((self.state == 'open') and (now < self.openuntil)):
+            return False
+
+        return ((self.probing == 0.0) or (now - self.probing >= cooldown))
+
+    '''
+    Record()
+    Function: - Records one finished call and updates the state
+    '''
+    def Record(self, now, seconds, failed, window, minimum, errorrate, cooldown):
+        if (self.state == 'half-open'):
+            self.probing = 0.0
+            if (failed == True):
+                self.Open(now, cooldown)
+            else:
+                self.state = 'closed'
+                self.calls = []
+            return
+
+        self.calls.append((now, failed, round(seconds, 3)))
+        self.Trim(now, window)
+        if ((self.state == 'closed') and (len(self.calls) >= minimum) and (self.Failures() >= errorrate * len(self.calls))):
+            self.Open(now, cooldown)
+
+    '''
+    Open()
+    Function: - Opens the breaker for the cooldown
+    '''
+    def Open(self, now, cooldown):
+        self.state = 'open'
+        self.openuntil = now + cooldown
+        self.probing = 0.0
+        self.opened += 1
+
+    '''
+    Trim()
+    Function: - Drops the calls older than the window
+    '''
+    def Trim(self, now, window):
+        self.calls = [call for call in self.calls if (now - call[0] <= window)]
+
+    '''
+    Failures()
+    Function: - Returns the number of failed calls in the window
+    '''
+    def Failures(self):
+        return sum(1 for call in self.calls if (call[1] == True))
+
+    '''
+    Save()
+    Function: - Returns the breaker as a JSON-serializable dictionary
+    '''
+    def Save(self):
+        return {'calls': self.calls, 'state': self.state, 'openuntil': self.openuntil, 'probing': self.probing, 'opened': self.opened}
+
+'''
+router
+Class: This class is responsible for tracking provider health and choosing where failed requests go
+'''
+class router:
+    """
+    The router class owns one breaker per provider and model and finds the provider a request fails over to.
+    """
+    '''
+    Constructor
+    '''
+    def __init__(self, ENG):
+        """
+        Initializes the router.
+
+        Args:
+            ENG: The engine whose providers are tracked.  Optional mainstay.conf keys: failover ("false" to keep
+                 requests on the provider they were sent to), breakerwindow (seconds of calls considered, default
+                 300), breakerminimum (calls in the window before the breaker can open, default 5),
+                 breakererrorrate (failed fraction that opens it, default 0.5), breakerslowseconds (calls slower
+                 than this count as failed, default 0 for no limit) and breakercooldown (seconds open before a
+                 probe, default 30).
+        """
+        self.ENG = ENG
+        config = ENG.config
+        self.failover = (str(config.get('failover', 'true')).lower() != 'false')
+        self.window = float(config.get('breakerwindow', 300))
+        self.minimum = int(config.get('breakerminimum', 5))
+        self.errorrate = float(config.get('breakererrorrate', 0.5))
+        self.slowseconds = float(config.get('breakerslowseconds', 0))
+        self.cooldown = float(config.get('breakercooldown', 30))
+        self.statsfile = os.path.join(config.get('statedir', '/opt/mainstay/state'), 'breakers.json')
+        self.lock = threading.Lock()
+        self.saving = threading.Lock()#held from taking the changes to writing them, so older ones are never written last
+        self.breakers = None#'<ai>:<model>' -> breaker, read on first use
+        self.changed = set()#breakers changed since they were last saved
+        self.saved = time.monotonic()#time the breakers were last saved
+        self.saveseconds = 30#longest a change that is not a state change waits to be saved
+        self.failovers = 0#requests moved to another provider
+
+    '''
+    Load()
+    Function: - Reads the breakers saved by an earlier run once; the caller holds the lock
+    '''
+    def Load(self):
+        if (self.breakers is not None):
+            return
+        self.breakers = {}
+        try:
+            with open(self.statsfile, 'r', encoding='utf-8') as read_file:
+                for name, state in json.load(read_file).items():
+                    self.breakers[name] = breaker(state)
+        except Exception:
+            pass
+
+    '''
+    Breaker()
+    Function: - Returns the breaker of a provider and model; the caller holds the lock
+    '''
+    def Breaker(self, ai, model):
+        self.Load()
+        name = ai + ':' + model
+        if (name not in self.breakers):
+            self.breakers[name] = breaker()
+
+        return self.breakers[name]
+
+    '''
+    Allow()
+    Function: - Returns True when a call may be made to a provider and model now
+    '''
+    def Allow(self, ai, model):
+        with self.lock:
+            return self.Breaker(ai, model).Allow(time.time(), self.cooldown)
+
+    '''
+    Healthy()
+    Function: - Returns True when a provider and model would accept a call now, without taking the half-open probe
+    '''
+    def Healthy(self, ai, model):
+        with self.lock:
+            return self.Breaker(ai, model).Healthy(time.time(), self.cooldown)
+
+    '''
+    Check()
+    Function: - Raises circuitopen when the breaker of the request's provider and model refuses calls
+    '''
+    def Check(self, CON):
+        with self.lock:
+            current = self.Breaker(CON.ai, CON.model)
+            if (current.Allow(time.time(), self.cooldown) == True):
+                return
+            seconds = max(current.openuntil - time.time(), 0.0)
+
+        raise circuitopen(CON.ai, CON.model, seconds)
+
+    '''
+    Record()
+    Function: - Records one finished provider call
+    '''
+    def Record(self, ai, model, seconds, error=None):
+        """
+        Records a call in the breaker of ai and model.  Only errors that say the provider is unhealthy, and calls
+        slower than breakerslowseconds, count as failed; a rejected request such as a bad API key or an input that
+        is too large does not.  The breaker is saved at once when its state changed, and otherwise with the next
+        save at most saveseconds later.
+        """
+        failed = ((error is not None) and (self.ENG.limiter.Transient(error) == True))
+        if ((self.slowseconds > 0) and (seconds > self.slowseconds)):
+            failed = True
+
+        with self.lock:
+            current = self.Breaker(ai, model)
+            before = current.state
+            current.Record(time.time(), seconds, failed, self.window, self.minimum, self.errorrate, self.cooldown)
+            self.changed.add(ai + ':' + model)
+            if ((current.state == 'open') and (before != 'open')):
+                print ('[-] ' + ai + ' ' + model + ' is failing, pausing calls to it for ' + str(round(self.cooldown)) + 's')
+
+        self.Save(force=(current.state != before))
+
+    '''
+    Save()
+    Function: - Writes the breakers to the state directory
+    '''
+    def Save(self, force=True):
+        """
+        Writes the breakers changed since the last save into statedir/breakers.json, keeping the breakers other
+        processes saved there (see fileio.UpdateJSONFile()).  Unless force is set, nothing is written until
+        saveseconds have passed since the last save.
+        """
+        with self.saving:
+            with self.lock:
+                if ((self.breakers is None) or (len(self.changed) == 0)):
+                    return
+                if ((force == False) and (time.monotonic() - self.saved < self.saveseconds)):
+                    return
+                now = time.time()
+                entries = {}
+                for name in self.changed:
+                    self.breakers[name].Trim(now, self.window)
+                    entries[name] = self.breakers[name].Save()
+                self.changed = set()
+                self.saved = time.monotonic()
+
+            fileio().UpdateJSONFile(self.statsfile, entries)
+
+    '''
+    Candidates()
+    Function: - Returns the providers a request may move to, in order
+    '''
+    def Candidates(self, CON, prefer=''):
+        """
+        Returns prefer, when given, followed by the providers in defaultmodels order, leaving out CON.ai, the
+        providers the request already failed on and providers that are not registered.
+        """
+        names = []
+        if (prefer != ''):
+            names.append(prefer)
+        for models in CON.defaultmodels:
+            for vendor in models:
+                names.extend(ai for ai, name in self.ENG.vendors.items() if (name == vendor))
+
+        candidates = []
+        for ai in names:
+            if ((ai != CON.ai) and (ai not in CON.tried) and (ai not in candidates) and (ai in self.ENG.providers)):
+                candidates.append(ai)
+
+        return candidates
+
+    '''
+    Next()
+    Function: - Returns a controller for the same request on the next healthy provider
+    '''
+    def Next(self, CON, prefer=''):
+        """
+        Returns a copy of CON for the first candidate that has a default model and an API key and whose breaker
+        would allow a call, with model set to its default model and CON.ai added to tried, or None when there is
+        none.  The breaker is only read (see Healthy()); a half-open probe is taken by the call itself.
+        """
+        for ai in self.Candidates(CON, prefer):
+            NEXT = self.ENG.NewController(CON.input, CON.prompt, ai, '', CON.output, CON.url, CON.debug, CON.nocache, CON.refresh,
+                                          CON.chunking, CON.hedge)
+            NEXT.pipe = CON.pipe
+            NEXT.history = CON.history
+            NEXT.conversational_history = CON.conversational_history
+            NEXT.tried = CON.tried + [CON.ai]
+            NEXT.model = self.ENG.GetDefaultModel(NEXT)
+            if ((NEXT.model == '') or (self.ENG.GetAPIKey(NEXT) == '')):
+                continue
+            if (self.Healthy(NEXT.ai, NEXT.model) == False):
+                continue
+            return NEXT
+
+        return None
+
+    '''
+    Failover()
+    Function: - Returns a controller for the provider a failed request moves to
+    '''
+    def Failover(self, CON, error):
+        """
+        Returns the controller from Next() when failover is on and error says the provider is unhealthy (a
+        circuitopen, or an error the rate limiter retries), otherwise None.
+        """
+        if ((self.failover == False) or ((not isinstance(error, circuitopen)) and (self.ENG.limiter.Transient(error) == False))):
+            return None
+
+        NEXT = self.Next(CON)
+        if (NEXT is not None):
+            with self.lock:
+                self.failovers += 1
+            self.ENG.metrics.Failover(CON.ai, CON.model, NEXT.ai)
+            if (CON.debug == True):
+                print ('[DEBUG] ' + CON.ai + ' ' + CON.model + ' failed (' + str(error) + '), failing over to ' + NEXT.ai + ' ' + NEXT.model)
+
+        return NEXT
+
+    '''
+    Stats()
+    Function: - Returns the state of every breaker
+    '''
+    def Stats(self):
+        """
+        Returns the requests failed over, and per '<ai>:<model>' the breaker state, calls and failures in the
+        window, failure rate, mean latency, times opened and seconds until a probe is allowed.
+        """
+        now = time.time()
+        with self.lock:
+            self.Load()
+            breakers = {}
+            for name, current in self.breakers.items():
+                current.Trim(now, self.window)
+                calls = len(current.calls)
+                breakers[name] = {'state': current.state, 'calls': calls, 'failures': current.Failures(),
+                                  'errorrate': round(current.Failures() / calls, 3) if (calls > 0) else 0.0,
+                                  'latency': round(sum(call[2] for call in current.calls) / calls, 3) if (calls > 0) else 0.0,
+                                  'opened': current.opened, 'retryin': round(max(current.openuntil - now, 0.0), 1) if (current.state == 'open') else 0.0}
+
+            return {'failovers': self.failovers, 'breakers': breakers}
@@ -0,0 +1,229 @@
+'''
+Mainstay v0.4 - Copyright 2025 James Slaughter,
+This file is part of Mainstay v0.4.
+
+Mainstay v0.4 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Mainstay v0.4 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Mainstay v0.4.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+"""
+runlog.py - Structured run log for Mainstay v0.4
+
+This module appends one JSON line per request to the run log: the provider, model, prompt, a hash of the input,
+the status, latency, tokens and output path.  Write() only puts the record on a queue.  A background thread hashes
+the input, writes the queued lines through a file it keeps open, flushes them every few seconds and rotates the
+file when it grows past its size limit, so logging never waits on the disk.  Records still queued when the
+process exits are written by an exit handler.
+
+Classes:
+    runlog: Buffered, rotating JSON lines writer fed from a queue.
+
+Copyright 2025 James Slaughter. Licensed under GPL v3 or later.
+"""
+
+#python imports
+import os
+import json
+import queue
+import atexit
+import hashlib
+import datetime
+import threading
+
+'''
+runlog
+Class: This class is responsible for writing the structured run log without blocking the caller
+'''
+class runlog:
+    """
+    The runlog class owns the log file and the thread that writes it.  An instance created with an empty path
+    discards every record, so callers never need to check whether logging is on.
+    """
+    '''
+    Constructor
+    '''
+    def __init__(self, path, flushseconds=2.0, maxbytes=10 * 1024 * 1024, backups=5, maxqueue=10000):
+        """
+        Initializes the run log.  The writer thread starts with the first record.
+
+        Args:
+            path: File to append to, or an empty string to disable the log.
+            flushseconds: Longest time a record waits in memory before it is written.
+            maxbytes: Size at which the file is rotated to path.1, path.1 to path.2 and so on.
+            backups: Rotated files kept.
+            maxqueue: Records held in memory; further records are counted and dropped until the writer catches up.
+        """
+        self.path = path
+        self.flushseconds = flushseconds
+        self.maxbytes = maxbytes
+        self.backups = backups
+        self.records = queue.Queue(maxsize=maxqueue)
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stopping = threading.Event()
+        self.file = None
+        self.written = 0#records written to disk
+        self.dropped = 0#records discarded because the queue was full
+        self.rotations = 0
+
+    '''
+    Write()
+    Function: - Queues one record for the run log
+    '''
+    def Write(self, record, input_text=None):
+        """
+        Queues a record.  Never blocks; when the queue is full the record is dropped and counted.
+
+        Args:
+            record: JSON-serializable dictionary.
+            input_text: Input of the request.  Its SHA-256 is added as input_hash by the writer thread.
+        """
+        if (self.path == ''):
+            return
+
+        if (self.thread is None):
+            self.Start()
+
+        try:
+            self.records.put_nowait((record, input_text))
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+
+    '''
+    Start()
+    Function: - Starts the writer thread once
+    '''
+    def Start(self):
+        with self.lock:
+            if (self.thread is not None):
+                return
+            self.thread = threading.Thread(target=self.Work, name='mainstay-runlog', daemon=True)
+            self.thread.start()
+        atexit.register(self.Close)
+
+    '''
+    Work()
+    Function: - Writes queued records until the log is closed
+    '''
+    def Work(self):
+        while (self.stopping.is_set() == False):
+            try:
+                batch = [self.records.get(timeout=self.flushseconds)]
+            except queue.Empty:
+                continue
+            # Give a burst of requests the chance to share one write and flush
+            self.stopping.wait(min(self.flushseconds, 0.5))
+            self.Drain(batch)
+
+    '''
+    Drain()
+    Function: - Writes the given records and everything else queued, then flushes
+    '''
+    def Drain(self, batch):
+        while True:
+            try:
+                batch.append(self.records.get_nowait())
+            except queue.Empty:
+                break
+        if (len(batch) == 0):
+            return
+
+        lines = []
+        for record, input_text in batch:
+            if (input_text is not None):
+                record['input_hash'] = hashlib.sha256(input_text.encode('utf-8', errors='replace')).hexdigest()
+            lines.append(json.dumps(record, default=str) + '\n')
+
+        try:
+            if (self.file is None):
+                directory = os.path.dirname(self.path)
+                if (directory != ''):
+                    os.makedirs(directory, exist_ok=True)
+                self.file = open(self.path, 'a', encoding='utf-8')
+            self.file.write(''.join(lines))
+            self.file.flush()
+            with self.lock:
+                self.written += len(lines)
+            if (self.file.tell() >= self.maxbytes):
+                self.Rotate()
+        except OSError as e:
+            with self.lock:
+                self.dropped += len(lines)
+            print ('[x] Unable to write the run log ' + self.path + ': ' + str(e))
+
+    '''
+    Rotate()
+    Function: - Moves the full log aside and starts a new one
+    '''
+    def Rotate(self):
+        self.file.close()
+        self.file = None
+        for number in range(self.backups - 1, 0, -1):
+            if (os.path.exists(self.path + '.' + str(number))):
+                os.replace(self.path + '.' + str(number), self.path + '.' + str(number + 1))
+        if (self.backups > 0):
+            os.replace(self.path, self.path + '.1')
+        else:
+            os.remove(self.path)
+        with self.lock:
+            self.rotations += 1
+
+    '''
+    Close()
+    Function: - Writes every queued record and closes the file
+    '''
+    def Close(self):
+        if (self.thread is None):
+            return
+        self.stopping.set()
+        self.thread.join(timeout=5)
+        self.Drain([])
+        if (self.file is not None):
+            self.file.close()
+            self.file = None
+
+    '''
+    Stats()
+    Function: - Returns the run log counters
+    '''
+    def Stats(self):
+        """
+        Returns the records written, dropped and queued and the number of rotations.
+        """
+        with self.lock:
+            return {'written': self.written, 'dropped': self.dropped, 'queued': self.records.qsize(), 'rotations': self.rotations}
+
+    '''
+    Record()
+    Function: - Builds the run log record for a request
+    '''
+    @staticmethod
+    def Record(result, seconds, stream=False):
+        """
+        Args:
+            result: Result dictionary returned by engine.Process() or sent with the stream's done event.
+            seconds: Time taken to answer the request.
+            stream: True when the response was streamed.
+
+        Returns:
+            dict: The fields written to the run log, without input_hash.
+        """
+        usage = result.get('usage') or {}
+        return {'time': datetime.datetime.now().astimezone().isoformat(timespec='milliseconds'), 'provider': result.get('ai', ''),
+                'model': result.get('model', ''), 'prompt': result.get('prompt', ''), 'status': result.get('status', 'error'),
+                'error': result.get('error', ''), 'latency': round(seconds, 3), 'ttft': round(result.get('ttft', 0.0), 3),
+                'input_tokens': usage.get('input_tokens', 0), 'output_tokens': usage.get('output_tokens', 0),
+                'cache_read_tokens': usage.get('cache_read_tokens', 0), 'cached': result.get('cached', False),
+                'coalesced': result.get('coalesced', False), 'stream': stream, 'chunks': result.get('chunks', 0),
+                'output': result.get('output', ''), 'url': result.get('url', '')}
@@ -0,0 +1,322 @@
+'''
+Mainstay v0.4 - Copyright 2025 James Slaughter,
+This file is part of Mainstay v0.4.
+
+Mainstay v0.4 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Mainstay v0.4 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Mainstay v0.4.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+"""
+searchindex.py - Full-text index of written outputs for Mainstay v0.4
+
+This module keeps a SQLite FTS5 index of every output file Mainstay writes, so earlier analyses can be found
+without grepping the disk or asking the AI again.  Each output is indexed with its URL, prompt, model, AI, the
+SHA-256 of its input and its text.  Outputs are added by a background thread as they are written.  Scan() adds
+files already in a directory, such as logroot, that are new or changed since the last scan.  Search() takes
+words, FTS5 query syntax or an input hash.
+
+Classes:
+    searchindex: SQLite FTS5 index of output files, updated in the background and searched synchronously.
+
+Copyright 2025 James Slaughter. Licensed under GPL v3 or later.
+"""
+
+#python imports
+import os
+import re
+import time
+import queue
+import atexit
+import sqlite3
+import hashlib
+import datetime
+import threading
+from contextlib import contextmanager
+
+'''
+searchindex
+Class: This class is responsible for indexing output files and searching them
+'''
+class searchindex:
+    """
+    The searchindex class keeps a files table (path, modification time and size) and an FTS5 table of the indexed
+    fields, sharing one rowid per file.  An instance created with an empty path indexes nothing and finds nothing.
+    """
+    '''
+    Constructor
+    '''
+    def __init__(self, path):
+        """
+        Initializes the index.  The database is created on first use.
+
+        Args:
+            path: SQLite database file, or an empty string to disable the index.
+        """
+        self.path = path
+        self.pending = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.ready = False
+
+    '''
+    Path()
+    Function: - Returns the index file named by the configuration
+    '''
+    @staticmethod
+    def Path(config):
+        """
+        Returns searchdb from mainstay.conf, /opt/mainstay/outputs.db by default, or an empty string when
+        searchdb is "false".
+        """
+        path = str(config.get('searchdb', '/opt/mainstay/outputs.db'))
+
+        return '' if (path.lower() == 'false') else path
+
+    '''
+    Connect()
+    Function: - Opens a connection to the index, creating it if needed
+    '''
+    @contextmanager
+    def Connect(self):
+        """
+        Yields a new connection, commits if the block succeeds and closes it.  Connections are short lived and
+        never shared between threads.
+        """
+        if (self.ready == False):
+            directory = os.path.dirname(self.path)
+            if (directory != ''):
+                os.makedirs(directory, exist_ok=True)
+
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:
+                if (self.ready == False):
+                    db.execute('PRAGMA journal_mode=WAL')
+                    db.execute('CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, path TEXT UNIQUE, mtime REAL, size INTEGER, written REAL)')
+                    db.execute('CREATE VIRTUAL TABLE IF NOT EXISTS outputs USING fts5(url, prompt, model, ai, input_hash, body, '
+                               'tokenize=\'porter unicode61\')')
+                    self.ready = True
+                yield db
+        finally:
+            db.close()
+
+    '''
+    Add()
+    Function: - Queues a written output for indexing
+    '''
+    def Add(self, output, body, url='', prompt='', model='', ai='', input_text=None):
+        """
+        Queues an output file to be indexed by the background thread.  Returns at once.
+
+        Args:
+            output: Path of the file that was written.
+            body: The response text written to it.
+            url, prompt, model, ai: What produced it.
+            input_text: Input of the request.  Its SHA-256 is indexed as input_hash.
+        """
+        if ((self.path == '') or (output == '')):
+            return
+
+        if (self.thread is None):
+            with self.lock:
+                if (self.thread is None):
+                    self.thread = threading.Thread(target=self.Work, name='mainstay-searchindex', daemon=True)
+                    self.thread.start()
+                    atexit.register(self.Wait)
+
+        self.pending.put((output, body, url, prompt, model, ai, input_text))
+
+    '''
+    Work()
+    Function: - Indexes queued outputs
+    '''
+    def Work(self):
+        while True:
+            batch = [self.pending.get()]
+            while True:
+                try:
+                    batch.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with self.Connect() as db:
+                    for output, body, url, prompt, model, ai, input_text in batch:
+                        input_hash = self.Hash(input_text) if (input_text is not None) else ''
+                        self.Put(db, output, {'url': url, 'prompt': prompt, 'model': model, 'ai': ai, 'input_hash': input_hash, 'body': body})
+            except (OSError, sqlite3.Error) as e:
+                print ('[x] Unable to update the search index ' + self.path + ': ' + str(e))
+            finally:
+                for item in batch:
+                    self.pending.task_done()
+
+    '''
+    Wait()
+    Function: - Blocks until every queued output is indexed
+    '''
+    def Wait(self):
+        if (self.thread is not None):
+            self.pending.join()
+
+    '''
+    Hash()
+    Function: - Returns the SHA-256 of an input, as written to the run log
+    '''
+    @staticmethod
+    def Hash(input_text):
+        return hashlib.sha256(input_text.encode('utf-8', errors='replace')).hexdigest()
+
+    '''
+    Put()
+    Function: - Adds or replaces the index entry of one file
+    '''
+    def Put(self, db, path, fields, written=None):
+        path = os.path.abspath(path)
+        written = time.time() if (written is None) else written
+        try:
+            stat = os.stat(path)
+            mtime, size = stat.st_mtime, stat.st_size
+        except OSError:
+            mtime, size = 0.0, 0
+
+        row = db.execute('SELECT id FROM files WHERE path = ?', (path,)).fetchone()
+        if (row is None):
+            rowid = db.execute('INSERT INTO files (path, mtime, size, written) VALUES (?, ?, ?, ?)', (path, mtime, size, written)).lastrowid
+        else:
+            rowid = row[0]
+            db.execute('UPDATE files SET mtime = ?, size = ?, written = ? WHERE id = ?', (mtime, size, written, rowid))
+            db.execute('DELETE FROM outputs WHERE rowid = ?', (rowid,))
+        db.execute('INSERT INTO outputs (rowid, url, prompt, model, ai, input_hash, body) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                   (rowid, fields['url'], fields['prompt'], fields['model'], fields['ai'], fields['input_hash'], fields['body']))
+
+    '''
+    Scan()
+    Function: - Indexes the output files in a directory that are new or changed since the last scan
+    '''
+    def Scan(self, root):
+        """
+        Walks root for .md files and indexes those whose modification time or size changed.  Files indexed when
+        they were written keep their prompt, model and input hash; files found only by a scan are indexed with
+        their URL header and text.  Entries for files under root that no longer exist are removed.
+
+        Returns:
+            dict: Files added or updated and entries removed.
+        """
+        counts = {'indexed': 0, 'removed': 0}
+        if ((self.path == '') or (root == '') or (not os.path.isdir(root))):
+            return counts
+
+        root = os.path.abspath(root)
+        with self.Connect() as db:
+            prefix = root.rstrip(os.sep) + os.sep
+            known = dict((path, (mtime, size)) for path, mtime, size in
+                         db.execute('SELECT path, mtime, size FROM files WHERE substr(path, 1, ?) = ?', (len(prefix), prefix)))
+            seen = set()
+            for directory, subdirectories, filenames in os.walk(root):
+                for filename in filenames:
+                    if (not filename.endswith('.md')):
+                        continue
+                    path = os.path.join(directory, filename)
+                    seen.add(path)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    if (known.get(path) == (stat.st_mtime, stat.st_size)):
+                        continue
+                    url, body = self.ReadOutput(path)
+                    self.Put(db, path, {'url': url, 'prompt': '', 'model': '', 'ai': '', 'input_hash': '', 'body': body}, stat.st_mtime)
+                    counts['indexed'] += 1
+            for path in known:
+                if (path not in seen):
+                    self.Remove(db, path)
+                    counts['removed'] += 1
+
+        return counts
+
+    '''
+    ReadOutput()
+    Function: - Reads the URL header and text of an output file
+    '''
+    def ReadOutput(self, path):
+        """
+        Returns:
+            tuple: (url, body) - the URL from the header written by engine.WriteOutput(), if any, and the rest of
+                   the file.
+        """
+        with open(path, 'r', encoding='utf-8', errors='replace') as read_file:
+            text = read_file.read()
+
+        match = re.match(r'\s*URL: (.*)\nTAGS:.*\n', text)
+        if (match is None):
+            return '', text
+
+        return match.group(1).strip(), text[match.end():]
+
+    '''
+    Remove()
+    Function: - Deletes the index entry of one file
+    '''
+    def Remove(self, db, path):
+        row = db.execute('SELECT id FROM files WHERE path = ?', (path,)).fetchone()
+        if (row is not None):
+            db.execute('DELETE FROM outputs WHERE rowid = ?', (row[0],))
+            db.execute('DELETE FROM files WHERE id = ?', (row[0],))
+
+    '''
+    Search()
+    Function: - Returns the outputs matching a query, best first
+    '''
+    def Search(self, query, limit=20):
+        """
+        Searches the index.  A 64 character hex string is looked up as an input hash.  Anything else is tried as
+        an FTS5 query, such as 'emotet AND prompt:analyze_incident', and if it is not valid FTS5 syntax each word
+        is searched for as is.  Entries whose file has been deleted are dropped from the index.
+
+        Args:
+            query: The words, FTS5 query or input hash to look for.
+            limit: Most results returned.
+
+        Returns:
+            list: Dictionaries with path, url, prompt, model, ai, input_hash, written (ISO 8601) and snippet.
+        """
+        if ((self.path == '') or (query.strip() == '')):
+            return []
+
+        query = query.strip()
+        if (re.fullmatch(r'[0-9a-fA-F]{64}', query)):
+            queries = ['input_hash:"' + query.lower() + '"']
+        else:
+            queries = [query, ' '.join('"' + word.replace('"', '""') + '"' for word in query.split())]
+
+        rows = []
+        with self.Connect() as db:
+            for match in queries:
+                try:
+                    rows = db.execute('SELECT files.path, outputs.url, outputs.prompt, outputs.model, outputs.ai, outputs.input_hash, '
+                                      'files.written, snippet(outputs, 5, \'[\', \']\', \'...\', 16) FROM outputs '
+                                      'JOIN files ON files.id = outputs.rowid WHERE outputs MATCH ? ORDER BY bm25(outputs) LIMIT ?',
+                                      (match, limit)).fetchall()
+                    break
+                except sqlite3.OperationalError:
+                    continue
+
+            results = []
+            for path, url, prompt, model, ai, input_hash, written, snippet in rows:
+                if (not os.path.exists(path)):
+                    self.Remove(db, path)
+                    continue
+                results.append({'path': path, 'url': url, 'prompt': prompt, 'model': model, 'ai': ai, 'input_hash': input_hash,
+                                'written': datetime.datetime.fromtimestamp(written).isoformat(timespec='seconds'),
+                                'snippet': ' '.join(snippet.split())})
+
+        return results
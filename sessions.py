@@ -0,0 +1,388 @@
+'''
+Mainstay v0.4 - Copyright 2025 James Slaughter,
+This file is part of Mainstay v0.4.
+
+Mainstay v0.4 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Mainstay v0.4 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Mainstay v0.4.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+"""
+sessions.py - Multi-turn conversations for Mainstay v0.4
+
+This module keeps the conversation of a session so that a follow-up question can be asked about a sample without
+sending the sample again.  A session is a JSON file in the session directory named after its ID.  It holds the
+turns, each an input and the answer to it, and a summary of the turns that were compacted.  Before a turn the
+summary and the turns are loaded into the controller's conversational_history, which the providers send between
+the prompt and the new input.  The history is the same from one turn to the next apart from the new turn at its
+end, so the providers' prompt caches serve most of it.
+
+Once the history grows past the session budget, the oldest turns are summarized by the session's model and
+replaced by the summary, until the turns left take half the budget.  Each turn therefore sends at most about the
+budget in history, however long the conversation gets.
+
+Classes:
+    sessionstore: Loads, saves and compacts sessions, and runs one turn of a session at a time.
+
+Copyright 2025 James Slaughter. Licensed under GPL v3 or later.
+"""
+
+#python imports
+import os
+import re
+import copy
+import json
+import time
+import fcntl
+import threading
+import contextlib
+
+#programmer generated imports
+#none
+
+'''
+sessionstore
+Class: This class is responsible for keeping the conversation of each session
+'''
+class sessionstore:
+    """
+    The sessionstore class wraps the engine's requests in session turns and holds the sessions it has read in
+    memory, so a daemon or neomainstay only reads a session file again when another process has changed it.
+    """
+    SUMMARYPROMPT = ('You maintain the memory of an ongoing analysis conversation.  You are given the summary of the '
+                     'conversation so far, if there is one, followed by the turns that come after it.  Write a new '
+                     'summary that replaces both.  Keep every fact, indicator, name, number, finding and conclusion '
+                     'the later turns may refer to, and what the user asked for.  Leave out pleasantries and '
+                     'repetition.  Write it as concise markdown notes, not as a dialogue.')
+    SUMMARYREPLY = 'Understood.  I will use this summary of our earlier conversation.'
+
+    '''
+    Constructor
+    '''
+    def __init__(self, ENG):
+        """
+        Initializes the session store.
+
+        Args:
+            ENG: The engine that answers the turns.  Optional mainstay.conf keys: sessiondir (directory of the
+                 session files, statedir/sessions by default) and sessionbudget (tokens of history a turn may
+                 carry before the oldest turns are compacted, default 8000).
+        """
+        self.ENG = ENG
+        config = ENG.config
+        self.directory = config.get('sessiondir', os.path.join(config.get('statedir', '/opt/mainstay/state'), 'sessions'))
+        self.budget = int(config.get('sessionbudget', 8000))
+        self.lock = threading.Lock()
+        self.locks = {}#session ID -> lock held for the length of a turn
+        self.sessions = {}#session ID -> (mtime of its file when read, session)
+
+    '''
+    Valid()
+    Function: - Returns True when a session ID can be used as a file name
+    '''
+    @staticmethod
+    def Valid(sessionid):
+        return (re.match(r'^[A-Za-z0-9][A-Za-z0-9._-]{0,63}$', sessionid) is not None)
+
+    '''
+    Path()
+    Function: - Returns the file that holds a session
+    '''
+    def Path(self, sessionid):
+        return os.path.join(self.directory, sessionid + '.json')
+
+    '''
+    Lock()
+    Function: - Returns the lock that serializes the turns of a session within this process
+    '''
+    def Lock(self, sessionid):
+        with self.lock:
+            if (sessionid not in self.locks):
+                self.locks[sessionid] = threading.Lock()
+            return self.locks[sessionid]
+
+    '''
+    Hold()
+    Function: - Holds a session for the length of a turn, against other threads and other processes
+    '''
+    @contextlib.contextmanager
+    def Hold(self, sessionid):
+        """
+        Takes the session's thread lock, then an exclusive lock on the session file's sibling .lock file, so turns
+        of the same session from neomainstay, the daemon and the CLI cannot interleave their load, append and save
+        and drop each other's turns.  An invalid ID takes no file lock, since Load() refuses it.
+        """
+        with self.Lock(sessionid):
+            lockfile = None
+            if (sessionstore.Valid(sessionid) == True):
+                try:
+                    os.makedirs(self.directory, exist_ok=True)
+                    lockfile = open(self.Path(sessionid) + '.lock', 'a')
+                    fcntl.flock(lockfile, fcntl.LOCK_EX)
+                except OSError:
+                    # The turn is still serialized within this process, and a directory that cannot be written
+                    # fails the save with a warning
+                    pass
+            try:
+                yield
+            finally:
+                if (lockfile is not None):
+                    lockfile.close()
+
+    '''
+    Load()
+    Function: - Returns a session, read from its file when it is not held in memory or the file has changed
+    '''
+    def Load(self, sessionid):
+        """
+        Returns a copy of the session with the given ID, or a new, empty one when it has no file yet.  The copy
+        held in memory only changes when Save() has written the session, so it always matches the file.
+
+        Raises:
+            Exception: When the ID is not usable as a file name or the file cannot be read.
+        """
+        if (sessionstore.Valid(sessionid) == False):
+            raise Exception('Invalid session ID "' + sessionid + '"; use up to 64 letters, digits, dots, dashes and underscores')
+
+        path = self.Path(sessionid)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return {'id': sessionid, 'created': time.time(), 'updated': 0.0, 'summary': '', 'compacted': 0, 'turns': []}
+
+        with self.lock:
+            held = self.sessions.get(sessionid)
+        if ((held is not None) and (held[0] == mtime)):
+            return copy.deepcopy(held[1])
+
+        with open(path, 'r', encoding='utf-8') as read_file:
+            session = json.load(read_file)
+        with self.lock:
+            self.sessions[sessionid] = (mtime, session)
+
+        return copy.deepcopy(session)
+
+    '''
+    Save()
+    Function: - Writes a session to its file
+    '''
+    def Save(self, session):
+        """
+        Writes a session through a temporary file, so a reader never sees a partial file.
+
+        Raises:
+            OSError: When the file cannot be written.
+        """
+        path = self.Path(session['id'])
+        temp = path + '.' + str(os.getpid()) + '.' + str(threading.get_ident()) + '.tmp'
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            with open(temp, 'w', encoding='utf-8') as write_file:
+                json.dump(session, write_file)
+            os.replace(temp, path)
+        except OSError:
+            if (os.path.exists(temp)):
+                os.remove(temp)
+            raise
+
+        with self.lock:
+            self.sessions[session['id']] = (os.path.getmtime(path), copy.deepcopy(session))
+
+    '''
+    Messages()
+    Function: - Returns the history of a session as the messages sent before the new input
+    '''
+    def Messages(self, session):
+        """
+        Returns the summary, as a user message and its acknowledgement, followed by a user and an assistant
+        message for each turn.  The roles alternate, as every provider requires.
+        """
+        messages = []
+
+        if (session['summary'] != ''):
+            messages.append({'role': 'user', 'content': 'Summary of our earlier conversation:\n\n' + session['summary']})
+            messages.append({'role': 'assistant', 'content': self.SUMMARYREPLY})
+        for turn in session['turns']:
+            messages.append({'role': 'user', 'content': turn['user']})
+            messages.append({'role': 'assistant', 'content': turn['assistant']})
+
+        return messages
+
+    '''
+    Tokens()
+    Function: - Returns the tokens of the conversational history a request carries
+    '''
+    def Tokens(self, CON, messages=None):
+        """
+        Counts the messages, CON.conversational_history by default, for CON.ai and CON.model, with a few tokens
+        of overhead per message.
+        """
+        if (messages is None):
+            messages = CON.conversational_history
+
+        return sum([self.ENG.tokens.Count(CON.ai, CON.model, message['content']) + 4 for message in messages])
+
+    '''
+    Turn()
+    Function: - Answers one turn of the session named by a controller
+    '''
+    def Turn(self, CON, answer):
+        """
+        Runs answer(), which returns a result dictionary (see engine.Process()), as a turn of the session in
+        CON.history.  When CON.history is empty it is simply called.
+
+        Returns:
+            dict: The result of answer(), or an error result when the session cannot be read.
+        """
+        if (CON.history == ''):
+            return answer()
+
+        with self.Hold(CON.history):
+            try:
+                session = self.Begin(CON)
+            except Exception as e:
+                result = self.ENG.NewResult(CON)
+                result['error'] = 'Unable to open session ' + CON.history + ': ' + str(e)
+                return result
+
+            result = answer()
+            self.End(CON, session, result)
+
+        return result
+
+    '''
+    StreamTurn()
+    Function: - Streams one turn of the session named by a controller
+    '''
+    def StreamTurn(self, CON, stream):
+        """
+        Streaming counterpart of Turn().  stream() returns a generator of the events described in engine.Stream().
+        The session is held until the done event has been yielded or the caller stops reading.
+
+        Yields:
+            dict: The events of stream().
+        """
+        if (CON.history == ''):
+            yield from stream()
+            return
+
+        with self.Hold(CON.history):
+            try:
+                session = self.Begin(CON)
+            except Exception as e:
+                result = self.ENG.NewResult(CON)
+                result['error'] = 'Unable to open session ' + CON.history + ': ' + str(e)
+                yield {'event': 'done', 'result': result}
+                return
+
+            for event in stream():
+                if (event['event'] == 'done'):
+                    self.End(CON, session, event['result'])
+                yield event
+
+    '''
+    Begin()
+    Function: - Loads a session's history into the controller before its turn; the caller holds the session's lock
+    '''
+    def Begin(self, CON):
+        session = self.Load(CON.history)
+        CON.conversational_history = self.Messages(session)
+
+        if (CON.debug == True):
+            print ('[DEBUG] Session ' + session['id'] + ': ' + str(len(session['turns'])) + ' turn(s), ' + str(session['compacted']) +
+                   ' compacted')
+
+        return session
+
+    '''
+    End()
+    Function: - Adds an answered turn to its session, compacting the session when it is over budget
+    '''
+    def End(self, CON, session, result):
+        """
+        Adds the input and the answer to session, a copy from Load(), and saves it.  Once saved, result's session
+        is set to the session ID, the number of this turn and the number of turns compacted so far.  A failed turn
+        is not added.  Problems saving or compacting the session are reported in result's warning rather than
+        failing a turn that was answered; a session that could not be saved stays as it was.
+        """
+        if (result['status'] != 'ok'):
+            return
+
+        session['turns'].append({'user': CON.input if (len(CON.input) != 0) else CON.pipe, 'assistant': result['text'],
+                                 'ai': result['ai'], 'model': result['model'], 'time': time.time()})
+        session['updated'] = time.time()
+
+        SCON = self.ENG.NewController(ai=result['ai'], model=result['model'], debug=CON.debug, nocache=CON.nocache)
+        if (self.Tokens(SCON, self.Messages(session)) > self.budget):
+            try:
+                self.Compact(SCON, session)
+            except Exception as e:
+                self.Warn(result, 'Unable to compact session ' + session['id'] + ', its history is kept in full until the next turn: ' + str(e))
+
+        try:
+            self.Save(session)
+        except OSError as e:
+            self.Warn(result, 'Unable to save session ' + session['id'] + ', this turn was not added to it: ' + str(e))
+            return
+
+        result['session'] = {'id': session['id'], 'turn': session['compacted'] + len(session['turns']), 'compacted': session['compacted']}
+
+    '''
+    Warn()
+    Function: - Adds a warning to a result
+    '''
+    def Warn(self, result, warning):
+        result['warning'] = warning if (result['warning'] == '') else result['warning'] + '; ' + warning
+
+    '''
+    Compact()
+    Function: - Summarizes the oldest turns of a session into its summary
+    '''
+    def Compact(self, SCON, session):
+        """
+        Replaces the oldest turns of session, together with its current summary, by a new summary written by
+        SCON's AI and model.  Turns are taken from the oldest until those left fit in half the budget, so the
+        next compaction is several turns away.  The summary request goes through the engine like any other, under
+        the provider's limits and into the response cache, and is split into chunks if it is too large for the
+        model.
+
+        Raises:
+            Exception: Any error from the provider, in which case the session is left as it was.
+        """
+        turns = session['turns']
+        remaining = self.Tokens(SCON, self.Messages({'summary': '', 'turns': turns}))
+        fold = 0
+        while ((fold < len(turns)) and (remaining > self.budget // 2)):
+            remaining -= self.Tokens(SCON, self.Messages({'summary': '', 'turns': [turns[fold]]}))
+            fold += 1
+
+        transcript = []
+        if (session['summary'] != ''):
+            transcript.append('## Summary so far\n\n' + session['summary'])
+        for turn in turns[:fold]:
+            transcript.append('## User\n\n' + turn['user'] + '\n\n## Assistant\n\n' + turn['assistant'])
+        SCON.input = '\n\n'.join(transcript)
+
+        provider = self.ENG.providers.get(SCON.ai)
+        request = self.ENG.Request(SCON, provider, self.ENG.GetAPIKey(SCON), self.SUMMARYPROMPT, SCON.input)
+        if (self.ENG.chunker.Oversize(SCON, request) == True):
+            response = self.ENG.chunker.MapReduce(SCON, request)
+        else:
+            response, cached = self.ENG.Complete(SCON, request)
+
+        session['summary'] = response['text']
+        session['turns'] = turns[fold:]
+        session['compacted'] += fold
+
+        if (SCON.debug == True):
+            print ('[DEBUG] Session ' + session['id'] + ': compacted ' + str(fold) + ' turn(s) into a summary of ' +
+                   str(self.ENG.tokens.Count(SCON.ai, SCON.model, session['summary'])) + ' tokens')
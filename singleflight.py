@@ -0,0 +1,178 @@
+'''
+Mainstay v0.4 - Copyright 2025 James Slaughter,
+This file is part of Mainstay v0.4.
+
+Mainstay v0.4 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Mainstay v0.4 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Mainstay v0.4.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+"""
+singleflight.py - Coalescing of identical in-flight requests for Mainstay v0.4
+
+This module makes sure that identical requests made at the same time reach the provider once.  The first caller
+for a key makes the call.  Callers that arrive while it is still in flight wait for it and receive the same
+response, or the same error.  Once the call completes the key is released, and later requests go to the response
+cache as usual.
+
+Classes:
+    flight: One in-flight call and the callers waiting on it.
+    singleflight: The registry of in-flight calls, keyed on the response cache key.
+
+Copyright 2025 James Slaughter. Licensed under GPL v3 or later.
+"""
+
+#python imports
+import threading
+
+'''
+flight
+Class: This class is responsible for handing the outcome of one call to every caller waiting on it
+'''
+class flight:
+    """
+    The flight class holds the outcome of one call.  Resolve() or Fail() is called once by the caller that made
+    the call, and Wait() returns that outcome to the others.
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.followers = 0#callers attached to this call besides the one making it
+
+    '''
+    Resolve()
+    Function: - Records the result of the call and releases the waiting callers
+    '''
+    def Resolve(self, value):
+        self.value = value
+        self.done.set()
+
+    '''
+    Fail()
+    Function: - Records the error raised by the call and releases the waiting callers
+    '''
+    def Fail(self, error):
+        self.error = error
+        self.done.set()
+
+    '''
+    Wait()
+    Function: - Blocks until the call completes and returns its result
+    '''
+    def Wait(self):
+        """
+        Returns:
+            The value passed to Resolve().
+
+        Raises:
+            Exception: The error passed to Fail().
+        """
+        self.done.wait()
+        if (self.error is not None):
+            raise self.error
+
+        return self.value
+
+'''
+singleflight
+Class: This class is responsible for coalescing identical calls that are in flight at the same time
+'''
+class singleflight:
+    """
+    The singleflight class maps keys to the flight currently making that call.
+    """
+    '''
+    Constructor
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}#key -> flight in progress
+        self.leaders = 0#calls made
+        self.coalesced = 0#calls answered by attaching to one already in flight
+
+    '''
+    Begin()
+    Function: - Joins the call in flight for a key, or starts a new one
+    '''
+    def Begin(self, key):
+        """
+        Returns:
+            tuple: (flight, leader) - leader is True when the caller must make the call and then End() it, and
+                   False when the caller should Wait() on the flight.
+        """
+        with self.lock:
+            current = self.flights.get(key)
+            if (current is not None):
+                current.followers += 1
+                self.coalesced += 1
+                return current, False
+            current = flight()
+            self.flights[key] = current
+            self.leaders += 1
+
+        return current, True
+
+    '''
+    End()
+    Function: - Releases a key once its call has completed
+    '''
+    def End(self, key, current, value=None, error=None):
+        """
+        Removes the flight from the registry, so later callers start a new call, and then hands value or error to
+        the callers waiting on it.
+        """
+        with self.lock:
+            if (self.flights.get(key) is current):
+                del self.flights[key]
+
+        if (error is not None):
+            current.Fail(error)
+        else:
+            current.Resolve(value)
+
+    '''
+    Do()
+    Function: - Makes a call unless an identical one is already in flight
+    '''
+    def Do(self, key, function):
+        """
+        Calls function() for the first caller of a key and hands its result, or the exception it raised, to every
+        caller that arrives for the same key before it returns.
+
+        Returns:
+            tuple: (value, shared) - shared is True when the value came from another caller's call.
+        """
+        current, leader = self.Begin(key)
+        if (leader == False):
+            return current.Wait(), True
+
+        try:
+            value = function()
+        except BaseException as e:
+            self.End(key, current, error=e)
+            raise
+
+        self.End(key, current, value=value)
+
+        return value, False
+
+    '''
+    Stats()
+    Function: - Returns the coalescing counters
+    '''
+    def Stats(self):
+        """
+        Returns the calls made, the calls coalesced onto one in flight and the calls in flight now.
+        """
+        with self.lock:
+            return {'calls': self.leaders, 'coalesced': self.coalesced, 'inflight': len(self.flights)}
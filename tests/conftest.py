@@ -0,0 +1,71 @@
+'''
+Mainstay v0.4 - Copyright 2025 James Slaughter,
+This file is part of Mainstay v0.4.
+
+Mainstay v0.4 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Mainstay v0.4 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Mainstay v0.4.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+"""
+conftest.py - Shared pytest fixtures for the Mainstay v0.4 tests
+
+The tests import the modules from the repository root and keep every file they write under pytest's tmp_path:
+the configuration fixture points promptdir, cachedir and statedir there and turns the run log and search index
+off, so nothing under /opt/mainstay is read or written.  Its providers are the stand-ins in fakeprovider.py,
+primary first and secondary second in defaultmodels, and the rate limiter does not retry.
+"""
+
+#python imports
+import os
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+#programmer generated imports
+from fakeprovider import fakeprovider
+
+'''
+config()
+Function: - Returns a mainstay.conf dictionary whose files all live under tmp_path
+'''
+@pytest.fixture
+def config(tmp_path):
+    promptdir = tmp_path / 'prompts'
+    promptdir.mkdir()
+    (promptdir / 'summarize.md').write_text('Summarize the input in one paragraph.\n', encoding='utf-8')
+    (tmp_path / 'logs').mkdir()
+
+    return {'promptdir': str(promptdir), 'logroot': str(tmp_path / 'logs'), 'cachedir': str(tmp_path / 'cache'),
+            'statedir': str(tmp_path / 'state'), 'searchdb': 'false', 'runlog': 'false', 'maxretries': 0,
+            'plugins': {'primary': {'module': 'fakeprovider', 'class': 'primary', 'vendor': 'primary'},
+                        'secondary': {'module': 'fakeprovider', 'class': 'secondary', 'vendor': 'secondary'}},
+            'defaultai': 'primary', 'defaultmodels': [{'primary': 'primary-model'}, {'secondary': 'secondary-model'}],
+            'apikeys': [{'primary': 'key'}, {'secondary': 'key'}]}
+
+'''
+engine()
+Function: - Returns an engine for the config fixture, with the stand-in providers reset
+'''
+@pytest.fixture
+def engine(config):
+    from engine import engine
+
+    fakeprovider.Reset()
+    ENG = engine(config)
+    yield ENG
+    ENG.pool.shutdown(wait=False)
+    fakeprovider.Reset()
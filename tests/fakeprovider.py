@@ -0,0 +1,116 @@
+'''
+Mainstay v0.4 - Copyright 2025 James Slaughter,
+This file is part of Mainstay v0.4.
+
+Mainstay v0.4 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Mainstay v0.4 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Mainstay v0.4.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+"""
+fakeprovider.py - In-process stand-in providers for the Mainstay v0.4 tests
+
+The providers are registered through the plugins key of mainstay.conf, as any third-party provider would be.
+They answer at once and record each call.  A test makes one fail with an HTTP status, echo its input back or
+stall its stream, through the class attributes of fakeprovider, which Reset() clears.
+
+Classes:
+    providererror: Raised in place of an answer, with the status_code the rate limiter and router read.
+    stalledstream: The open stream of a stalled provider, which the hedger closes to cancel it.
+    fakeprovider: Answers every call with its name, or with its input when echoing.
+    primary, secondary: The two providers the tests route between.
+"""
+
+#python imports
+import threading
+
+'''
+providererror
+Class: This class is raised by a failing stand-in provider
+'''
+class providererror(Exception):
+    def __init__(self, status):
+        self.status_code = status
+        super().__init__('HTTP ' + str(status))
+
+'''
+stalledstream
+Class: This class is responsible for standing in for an open provider stream that another thread can close
+'''
+class stalledstream:
+    def __init__(self):
+        self.closed = threading.Event()
+
+    def close(self):
+        self.closed.set()
+
+'''
+fakeprovider
+Class: This class is responsible for answering calls the way a provider would, without a network
+'''
+class fakeprovider:
+    """
+    The fakeprovider class keeps its behaviour and call record in class attributes shared by every instance, so
+    a test can change them without reaching the instance the engine's registry created.
+    """
+    name = 'fake'
+    failures = {}#provider name -> HTTP status raised by each call
+    echoes = set()#provider names that answer with their input
+    stalls = set()#provider names whose streams open and then send nothing until they are closed
+    calls = []#(provider name, system_input, user_input, messages of history) of each call
+
+    def __init__(self, clients):
+        self.params = {'temperature': 0}
+
+    '''
+    Reset()
+    Function: - Clears the behaviour and call record of every stand-in provider
+    '''
+    @staticmethod
+    def Reset():
+        fakeprovider.failures.clear()
+        fakeprovider.echoes.clear()
+        fakeprovider.stalls.clear()
+        del fakeprovider.calls[:]
+
+    '''
+    Answer()
+    Function: - Records a call and returns its response, or raises the configured failure
+    '''
+    def Answer(self, CON, system_input, user_input):
+        fakeprovider.calls.append((self.name, system_input, user_input, len(CON.conversational_history)))
+        if (self.name in fakeprovider.failures):
+            raise providererror(fakeprovider.failures[self.name])
+        text = user_input if (self.name in fakeprovider.echoes) else self.name + ' answer'
+
+        return {'text': text, 'citations': [], 'usage': {'input_tokens': len(user_input) // 4, 'output_tokens': len(text) // 4}}
+
+    def Query(self, CON, LOG, apikey, system_input, user_input):
+        return self.Answer(CON, system_input, user_input)
+
+    def Stream(self, CON, LOG, apikey, system_input, user_input, opened=None):
+        response = self.Answer(CON, system_input, user_input)
+        if (self.name in fakeprovider.stalls):
+            # Like a provider that has sent its headers, the stream is open but no token arrives
+            handle = stalledstream()
+            if (opened is not None):
+                opened(handle)
+            if (handle.closed.wait(10) == True):
+                raise ConnectionError('stream closed')
+        yield {'text': response['text']}
+        yield {'response': response}
+
+class primary(fakeprovider):
+    name = 'primary'
+
+class secondary(fakeprovider):
+    name = 'secondary'
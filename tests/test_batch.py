@@ -0,0 +1,47 @@
+'''
+Mainstay v0.4 - Copyright 2025 James Slaughter,
+This file is part of Mainstay v0.4.
+
+Mainstay v0.4 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Mainstay v0.4 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Mainstay v0.4.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+"""
+test_batch.py - Tests of batch runs over a directory or JSONL file
+"""
+
+#python imports
+import os
+import json
+
+#programmer generated imports
+from batch import batch
+from logger import logger
+
+def test_sanitized_ids_do_not_collide(engine, tmp_path):
+    source = tmp_path / 'items.jsonl'
+    with open(source, 'w', encoding='utf-8') as write_file:
+        for itemid in ['a b', 'a_b', 'a/b', 'c d']:
+            write_file.write(json.dumps({'id': itemid, 'input': 'notes for ' + itemid}) + '\n')
+    CON = engine.NewController('', 'summarize', 'primary', output=str(tmp_path / 'out'))
+    CON.batch = str(source)
+
+    assert batch(engine).Execute(CON, logger()) == 0
+
+    names = sorted(os.listdir(CON.output))
+    assert len(names) == 5#four outputs and the manifest
+    assert 'a_b_summarize.md' in names
+    assert 'c_d_summarize.md' in names
+    stems = batch(engine).Stems([{'id': 'a b'}, {'id': 'a_b'}, {'id': 'a/b'}])
+    assert len(set(stems.values())) == 3
+    assert stems['a b'].startswith('a_b-') and (stems == batch(engine).Stems([{'id': 'a/b'}, {'id': 'a b'}, {'id': 'a_b'}]))
@@ -0,0 +1,89 @@
+'''
+Mainstay v0.4 - Copyright 2025 James Slaughter,
+This file is part of Mainstay v0.4.
+
+Mainstay v0.4 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Mainstay v0.4 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Mainstay v0.4.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+"""
+test_batchapi.py - Tests of the provider Batch API path against benchmock
+
+Each test submits a batch through the provider's SDK to benchmock's Files, Batches and Message Batches
+endpoints, polls it until it ends and collects the results, as a --batchapi run does.
+"""
+
+#python imports
+import os
+import json
+
+import pytest
+
+#programmer generated imports
+from logger import logger
+from benchmock import mockserver
+
+PROVIDERS = [('chatgpt', 'openai', 'gpt-4o-mini'), ('claude', 'anthropic', 'claude-3-5-haiku-latest')]
+
+'''
+BatchRun()
+Function: - Runs a Batch API job over two items against a stand-in server and returns the exit code and manifest
+'''
+def BatchRun(config, tmp_path, ai, vendor, model, errorrate=0.0):
+    pytest.importorskip(vendor)
+    from engine import engine
+    from batchapi import batchapi
+
+    mock = mockserver(tokens=5, errorrate=errorrate, batchseconds=1)
+    config.update({'baseurls': mock.Start(), 'apikeys': [{vendor: 'benchmock'}], 'defaultmodels': [{vendor: model}],
+                   'batchpollseconds': 1})
+    items = tmp_path / 'items'
+    items.mkdir()
+    (items / 'a.txt').write_text('First incident notes.', encoding='utf-8')
+    (items / 'b.txt').write_text('Second incident notes.', encoding='utf-8')
+
+    try:
+        ENG = engine(config)
+        CON = ENG.NewController('', 'summarize', ai, output=str(tmp_path / 'out'))
+        CON.batch = str(items)
+        CON.batchapi = True
+        ret = batchapi(ENG).Execute(CON, logger())
+    finally:
+        mock.Stop()
+
+    with open(os.path.join(CON.output, 'manifest.jsonl'), 'r', encoding='utf-8') as read_file:
+        manifest = [json.loads(line) for line in read_file]
+
+    return ret, CON, manifest
+
+@pytest.mark.parametrize('ai, vendor, model', PROVIDERS)
+def test_batch_roundtrip(config, tmp_path, ai, vendor, model):
+    ret, CON, manifest = BatchRun(config, tmp_path, ai, vendor, model)
+
+    assert ret == 0
+    assert sorted(record['id'] for record in manifest) == ['a.txt', 'b.txt']
+    assert all((record['status'] == 'ok') and (record['model'] == model) for record in manifest)
+    assert all(record['output_tokens'] == 5 for record in manifest)
+    with open(os.path.join(CON.output, 'a.txt_summarize.md'), 'r', encoding='utf-8') as read_file:
+        assert 'lorem ipsum' in read_file.read()
+    # The job is finished, so a rerun starts afresh instead of resuming it
+    assert not os.path.exists(os.path.join(CON.output, 'batchapi.json'))
+
+@pytest.mark.parametrize('ai, vendor, model', PROVIDERS)
+def test_batch_failures_recorded(config, tmp_path, ai, vendor, model):
+    ret, CON, manifest = BatchRun(config, tmp_path, ai, vendor, model, errorrate=1.0)
+
+    assert ret == -1
+    assert [record['status'] for record in manifest] == ['error', 'error']
+    assert all('benchmock rejected the request' in record['error'] for record in manifest)
+    assert not os.path.exists(os.path.join(CON.output, 'a.txt_summarize.md'))
@@ -0,0 +1,92 @@
+'''
+Mainstay v0.4 - Copyright 2025 James Slaughter,
+This file is part of Mainstay v0.4.
+
+Mainstay v0.4 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Mainstay v0.4 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Mainstay v0.4.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+"""
+test_cache.py - Tests of the on-disk response cache
+"""
+
+#python imports
+import os
+import time
+
+#programmer generated imports
+from cache import responsecache
+
+RESPONSE = {'text': 'x' * 1000, 'citations': [], 'usage': {}}
+
+'''
+Age()
+Function: - Sets the modification time of a file to a number of seconds ago
+'''
+def Age(path, seconds):
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+'''
+Bystanders()
+Function: - Writes files under cachedir that are not cache entries and returns their paths
+'''
+def Bystanders(cachedir):
+    paths = [os.path.join(cachedir, 'sessions', 'case-1.json'), os.path.join(cachedir, 'breakers.json'),
+             os.path.join(cachedir, 'ab', 'notes.json')]
+    for path in paths:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as write_file:
+            write_file.write('{"keep": "' + 'y' * 5000 + '"}')
+        Age(path, 90 * 86400)
+
+    return paths
+
+def test_roundtrip(tmp_path):
+    cache = responsecache(str(tmp_path))
+    key = cache.Key('claude', 'model', {'temperature': 0}, 'system', 'input')
+
+    assert cache.Get(key) is None
+    assert cache.Put(key, RESPONSE) == 0
+    assert cache.Get(key) == RESPONSE
+    assert cache.Key('claude', 'model', {'temperature': 0}, 'system', 'other input') != key
+
+def test_evict_by_size_only_touches_entries(tmp_path):
+    cache = responsecache(str(tmp_path), maxbytes=10 ** 9)
+    keys = [cache.Hash(str(number)) for number in range(5)]
+    for age, key in enumerate(keys):
+        cache.Put(key, RESPONSE)
+        Age(cache.Path(key), (age + 1) * 60)
+    bystanders = Bystanders(str(tmp_path))
+
+    cache.maxbytes = 2500
+    removed = cache.Evict()
+
+    assert removed == 3
+    # The two most recently used entries are kept
+    assert [os.path.exists(cache.Path(key)) for key in keys] == [True, True, False, False, False]
+    assert all(os.path.exists(path) for path in bystanders)
+
+def test_evict_by_age_only_touches_entries(tmp_path):
+    cache = responsecache(str(tmp_path), maxage=86400)
+    old = cache.Hash('old')
+    new = cache.Hash('new')
+    cache.Put(old, RESPONSE)
+    cache.Put(new, RESPONSE)
+    Age(cache.Path(old), 2 * 86400)
+    bystanders = Bystanders(str(tmp_path))
+
+    assert cache.Evict() == 1
+    assert not os.path.exists(cache.Path(old))
+    assert os.path.exists(cache.Path(new))
+    assert all(os.path.exists(path) for path in bystanders)
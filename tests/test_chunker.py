@@ -0,0 +1,54 @@
+'''
+Mainstay v0.4 - Copyright 2025 James Slaughter,
+This file is part of Mainstay v0.4.
+
+Mainstay v0.4 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Mainstay v0.4 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Mainstay v0.4.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+"""
+test_chunker.py - Tests of map-reduce chunking for inputs larger than the context window
+"""
+
+#programmer generated imports
+from fakeprovider import fakeprovider
+
+LARGE = 'Host beaconed to 203.0.113.7 over TLS. ' * 400
+
+'''
+Narrow()
+Function: - Gives the stand-in models a context window far smaller than the input
+'''
+def Narrow(ENG):
+    ENG.tokens.contextlimits.update({'primary-model': 1500, 'secondary-model': 1500})
+    ENG.tokens.reserve = 100
+
+def test_large_input_is_chunked(engine):
+    Narrow(engine)
+
+    result = engine.Run(LARGE, 'summarize', nocache=True)
+
+    assert result['status'] == 'ok'
+    assert result['chunks'] > 1
+    assert result['text'] == 'primary answer'
+    assert len(fakeprovider.calls) == result['chunks'] + 1
+
+def test_merge_that_does_not_shrink_stops(engine):
+    # Partial results as long as their chunks can never be merged into one call
+    Narrow(engine)
+    fakeprovider.echoes.add('primary')
+
+    result = engine.Run(LARGE, 'summarize', nocache=True)
+
+    assert result['status'] == 'error'
+    assert 'Unable to merge' in result['error']
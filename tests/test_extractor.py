@@ -0,0 +1,66 @@
+'''
+Mainstay v0.4 - Copyright 2025 James Slaughter,
+This file is part of Mainstay v0.4.
+
+Mainstay v0.4 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Mainstay v0.4 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Mainstay v0.4.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+"""
+test_extractor.py - Tests of main content extraction from HTML pages
+"""
+
+#programmer generated imports
+from extractor import extractor
+
+ARTICLE = ('<p>The loader beacons every sixty seconds to the command and control server over TLS.</p>'
+           '<p>Persistence is a scheduled task named after a legitimate updater binary.</p>')
+
+def test_boilerplate_dropped():
+    html = ('<html><head><title>Report</title><script>var x = 1;</script></head><body>'
+            '<header>Site banner</header><nav>Home | About</nav><div class="sidebar">Popular posts</div>'
+            '<article><h1>Loader analysis</h1>' + ARTICLE + '</article><footer>Copyright</footer></body></html>')
+
+    text = extractor.Extract(html)
+
+    assert text.startswith('# Loader analysis')
+    assert 'scheduled task' in text
+    for furniture in ['Site banner', 'Home', 'Popular posts', 'Copyright', 'var x']:
+        assert furniture not in text
+
+def test_article_header_kept():
+    html = ('<html><body><header>Site banner</header><article><header><h1>Loader analysis</h1>'
+            '<p class="byline">By the response team</p></header>' + ARTICLE + '</article></body></html>')
+
+    text = extractor.Extract(html)
+
+    assert text.startswith('# Loader analysis')
+    assert 'By the response team' in text
+    assert 'Site banner' not in text
+
+def test_form_wrapped_page_kept():
+    html = ('<html><body><form id="aspnetForm" action="/post"><div id="content"><h1>Loader analysis</h1>' + ARTICLE +
+            '<input type="submit"><button>Search</button></div></form></body></html>')
+
+    text = extractor.Extract(html)
+
+    assert 'scheduled task' in text
+    assert 'Search' not in text
+
+def test_table_has_separator():
+    html = ('<html><body><article>' + ARTICLE + '<table><thead><tr><th>Host</th><th>Port</th></tr></thead>'
+            '<tbody><tr><td>203.0.113.7</td><td>443</td></tr><tr><td>a|b</td></tr></tbody></table></article></body></html>')
+
+    text = extractor.Extract(html)
+
+    assert '| Host | Port |\n| --- | --- |\n| 203.0.113.7 | 443 |\n| a\\|b | |' in text
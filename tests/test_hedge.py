@@ -0,0 +1,74 @@
+'''
+Mainstay v0.4 - Copyright 2025 James Slaughter,
+This file is part of Mainstay v0.4.
+
+Mainstay v0.4 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Mainstay v0.4 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Mainstay v0.4.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+"""
+test_hedge.py - Tests of hedged requests and the hedge statistics
+"""
+
+#python imports
+import os
+import json
+import time
+
+#programmer generated imports
+from fakeprovider import fakeprovider
+
+def test_statistics_saved_on_timer_and_merged(engine, config):
+    statsfile = os.path.join(config['statedir'], 'hedgestats.json')
+    os.makedirs(config['statedir'])
+    with open(statsfile, 'w', encoding='utf-8') as write_file:
+        json.dump({'other:model': {'samples': [1.0], 'percentile': 90}}, write_file)
+
+    # Samples wait for the timer, so a call does not write the file
+    engine.hedger.Observe('primary', 'primary-model', 1.5)
+    with open(statsfile, 'r', encoding='utf-8') as read_file:
+        assert list(json.load(read_file)) == ['other:model']
+
+    engine.hedger.saved -= engine.hedger.saveseconds
+    engine.hedger.Observe('primary', 'primary-model', 2.5)
+    with open(statsfile, 'r', encoding='utf-8') as read_file:
+        saved = json.load(read_file)
+    assert saved['primary:primary-model']['samples'] == [1.5, 2.5]
+    assert saved['other:model']['percentile'] == 90
+
+def test_statistics_flushed_with_state(engine, config):
+    engine.hedger.Observe('primary', 'primary-model', 1.5)
+    engine.SaveState()
+
+    with open(os.path.join(config['statedir'], 'hedgestats.json'), 'r', encoding='utf-8') as read_file:
+        assert json.load(read_file)['primary:primary-model']['samples'] == [1.5]
+    assert not os.path.exists(os.path.join(config['cachedir'], 'hedgestats.json'))
+
+def test_stalled_loser_cancelled(engine, config):
+    engine.hedger.initialdelay = 0.2
+    engine.hedger.mindelay = 0.1
+    fakeprovider.stalls.add('primary')
+    start = time.monotonic()
+
+    result = engine.Run('first question', 'summarize', nocache=True, hedge=True)
+
+    assert result['status'] == 'ok'
+    assert result['hedge']['winner'] == 'secondary'
+    assert time.monotonic() - start < 5
+    # The stalled stream is shut down, so its concurrency slot comes back without waiting for a token
+    deadline = time.monotonic() + 2
+    while ((engine.slots['primary']._value < engine.concurrency['primary']) and (time.monotonic() < deadline)):
+        time.sleep(0.01)
+    assert engine.slots['primary']._value == engine.concurrency['primary']
+    # The time the cut-off stream was given is not a time to first token
+    assert engine.hedger.stats['primary:primary-model']['samples'] == []
@@ -0,0 +1,56 @@
+'''
+Mainstay v0.4 - Copyright 2025 James Slaughter,
+This file is part of Mainstay v0.4.
+
+Mainstay v0.4 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Mainstay v0.4 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Mainstay v0.4.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+"""
+test_metrics.py - Tests of the metrics served to Prometheus
+"""
+
+#python imports
+import os
+
+#programmer generated imports
+from cache import responsecache
+from fakeprovider import primary
+
+INFLIGHT = ('mainstay_provider_calls_inflight', (('model', 'primary-model'), ('provider', 'primary')))
+
+def test_calls_inflight_counted(engine, monkeypatch):
+    seen = []
+    query = primary.Query
+
+    def Query(self, CON, LOG, apikey, system_input, user_input):
+        seen.append(engine.metrics.values[INFLIGHT])
+        return query(self, CON, LOG, apikey, system_input, user_input)
+    monkeypatch.setattr(primary, 'Query', Query)
+
+    assert engine.Run('first question', 'summarize', nocache=True)['status'] == 'ok'
+    assert engine.Run('second question', 'summarize', nocache=True, hedge=True)['status'] == 'ok'
+
+    assert seen == [1]
+    assert engine.metrics.values[INFLIGHT] == 0
+    assert 'mainstay_provider_calls_inflight{model="primary-model",provider="primary"} 0' in engine.metrics.Render()
+
+def test_cache_bytes_counted_before_eviction(tmp_path):
+    responsecache(str(tmp_path)).Put('a' * 64, {'text': 'x' * 1000, 'citations': [], 'usage': {}})
+    written = sum(os.path.getsize(os.path.join(root, name)) for root, dirs, names in os.walk(str(tmp_path)) for name in names)
+
+    # A new process has not scanned the cache, but still reports what is on disk
+    cache = responsecache(str(tmp_path))
+    assert cache.Stats()['bytes'] == -1
+    assert cache.Size() == written
+    assert cache.Stats()['bytes'] == written
@@ -0,0 +1,59 @@
+'''
+Mainstay v0.4 - Copyright 2025 James Slaughter,
+This file is part of Mainstay v0.4.
+
+Mainstay v0.4 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Mainstay v0.4 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Mainstay v0.4.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+"""
+test_ratelimit.py - Tests of the client-side rate limiter
+"""
+
+#python imports
+import pytest
+
+#programmer generated imports
+from ratelimit import ratelimiter
+from fakeprovider import providererror
+
+'''
+Limiter()
+Function: - Returns a limiter with a token bucket for one provider and immediate retries
+'''
+def Limiter(retries):
+    return ratelimiter({'ratelimits': {'primary': {'tpm': 10000}}, 'ratelimitheadroom': 1.0,
+                        'maxretries': retries, 'backoffbase': 0, 'backoffmax': 0})
+
+def test_failed_attempts_refunded():
+    limiter = Limiter(3)
+    attempts = []
+
+    def Fail():
+        attempts.append(limiter.Bucket('primary', 'model').tokens)
+        raise providererror(503)
+
+    with pytest.raises(providererror):
+        limiter.Call('primary', 'model', 4000, Fail)
+
+    # Each retry finds the bucket as the first attempt did, and the last failure leaves it full
+    assert len(attempts) == 4
+    assert all(tokens == pytest.approx(6000, abs=10) for tokens in attempts)
+    assert limiter.Bucket('primary', 'model').tokens == pytest.approx(10000, abs=10)
+
+def test_answered_call_settled():
+    limiter = Limiter(0)
+
+    limiter.Call('primary', 'model', 4000, lambda: {'usage': {'input_tokens': 1000, 'output_tokens': 500}})
+
+    assert limiter.Bucket('primary', 'model').tokens == pytest.approx(8500, abs=10)
@@ -0,0 +1,144 @@
+'''
+Mainstay v0.4 - Copyright 2025 James Slaughter,
+This file is part of Mainstay v0.4.
+
+Mainstay v0.4 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Mainstay v0.4 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Mainstay v0.4.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+"""
+test_router.py - Tests of the circuit breakers and provider failover
+"""
+
+#python imports
+import os
+import json
+import time
+
+#programmer generated imports
+from router import breaker
+from fakeprovider import fakeprovider
+
+'''
+Reopen()
+Function: - Puts a provider's breaker in the state it has once its cooldown is over: open, due a probe
+'''
+def Reopen(ENG, ai, model):
+    with ENG.router.lock:
+        current = ENG.router.Breaker(ai, model)
+        current.Open(time.time() - ENG.router.cooldown - 1, ENG.router.cooldown)
+
+def test_breaker_opens_and_probes():
+    current = breaker()
+    for number in range(5):
+        current.Record(100.0, 0.1, True, 300, 5, 0.5, 30)
+    assert current.state == 'open'
+    assert current.Healthy(110.0, 30) == False
+    assert current.Allow(110.0, 30) == False
+
+    # After the cooldown, Healthy() reports the breaker usable without taking the probe
+    assert current.Healthy(131.0, 30) == True
+    assert current.Healthy(131.0, 30) == True
+    assert current.probing == 0.0
+
+    # Allow() lets exactly one probe through
+    assert current.Allow(131.0, 30) == True
+    assert current.state == 'half-open'
+    assert current.Allow(132.0, 30) == False
+    assert current.Healthy(132.0, 30) == False
+
+    current.Record(133.0, 0.1, False, 300, 5, 0.5, 30)
+    assert current.state == 'closed'
+    assert current.calls == []
+
+def test_failed_probe_reopens():
+    current = breaker({'state': 'open', 'openuntil': 100.0})
+    assert current.Allow(101.0, 30) == True
+    current.Record(102.0, 0.1, True, 300, 5, 0.5, 30)
+    assert current.state == 'open'
+    assert current.openuntil == 132.0
+
+def test_failover_on_transient_error(engine):
+    fakeprovider.failures['primary'] = 503
+
+    result = engine.Run('some input', 'summarize', nocache=True)
+
+    assert result['status'] == 'ok'
+    assert (result['ai'], result['model'], result['text']) == ('secondary', 'secondary-model', 'secondary answer')
+    assert [call[0] for call in fakeprovider.calls] == ['primary', 'secondary']
+    assert engine.router.failovers == 1
+
+def test_no_failover_on_rejected_request(engine):
+    fakeprovider.failures['primary'] = 400
+
+    result = engine.Run('some input', 'summarize', nocache=True)
+
+    assert result['status'] == 'error'
+    assert [call[0] for call in fakeprovider.calls] == ['primary']
+
+def test_open_breaker_skips_the_call(engine):
+    engine.config['breakerminimum'] = 2
+    engine.router.minimum = 2
+    fakeprovider.failures['primary'] = 503
+    engine.Run('first input', 'summarize', nocache=True)
+    engine.Run('second input', 'summarize', nocache=True)
+    assert engine.router.Stats()['breakers']['primary:primary-model']['state'] == 'open'
+    del fakeprovider.calls[:]
+
+    result = engine.Run('third input', 'summarize', nocache=True)
+
+    assert result['ai'] == 'secondary'
+    assert [call[0] for call in fakeprovider.calls] == ['secondary']
+
+def test_failover_to_half_open_provider(engine):
+    # The secondary is due a probe: choosing it must leave the probe for the call that fails over to it
+    Reopen(engine, 'secondary', 'secondary-model')
+    fakeprovider.failures['primary'] = 503
+
+    result = engine.Run('some input', 'summarize', nocache=True)
+
+    assert result['status'] == 'ok'
+    assert result['ai'] == 'secondary'
+    assert engine.router.Stats()['breakers']['secondary:secondary-model']['state'] == 'closed'
+
+def test_next_does_not_take_the_probe(engine):
+    Reopen(engine, 'secondary', 'secondary-model')
+    CON = engine.NewController('some input', 'summarize', 'primary', 'primary-model')
+
+    assert engine.router.Next(CON).ai == 'secondary'
+    assert engine.router.Next(CON).ai == 'secondary'
+    assert engine.router.Allow('secondary', 'secondary-model') == True
+
+def test_breakers_saved_on_state_change(engine, config):
+    statsfile = os.path.join(config['statedir'], 'breakers.json')
+    os.makedirs(config['statedir'])
+    with open(statsfile, 'w', encoding='utf-8') as write_file:
+        json.dump({'other:model': breaker().Save()}, write_file)
+    engine.router.minimum = 2
+    fakeprovider.failures['primary'] = 503
+
+    # One failure changes no state, so it waits for the timer or SaveState()
+    engine.Run('first input', 'summarize', nocache=True)
+    with open(statsfile, 'r', encoding='utf-8') as read_file:
+        assert 'primary:primary-model' not in json.load(read_file)
+
+    # The second opens the breaker, which is saved at once beside the other process's entry
+    engine.Run('second input', 'summarize', nocache=True)
+    with open(statsfile, 'r', encoding='utf-8') as read_file:
+        saved = json.load(read_file)
+    assert saved['primary:primary-model']['state'] == 'open'
+    assert 'other:model' in saved
+
+    # A new process reads the open breaker back
+    from engine import engine as neweng
+    assert neweng(config).router.Healthy('primary', 'primary-model') == False
@@ -0,0 +1,123 @@
+'''
+Mainstay v0.4 - Copyright 2025 James Slaughter,
+This file is part of Mainstay v0.4.
+
+Mainstay v0.4 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Mainstay v0.4 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Mainstay v0.4.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+"""
+test_sessions.py - Tests of multi-turn sessions
+"""
+
+#python imports
+import os
+import json
+import time
+import fcntl
+import threading
+
+#programmer generated imports
+import sessions
+from fakeprovider import fakeprovider
+
+def test_turns_persist(engine, config):
+    first = engine.Run('first question', 'summarize', nocache=True, session='case-1')
+    second = engine.Run('second question', 'summarize', nocache=True, session='case-1')
+
+    assert first['session'] == {'id': 'case-1', 'turn': 1, 'compacted': 0}
+    assert second['session']['turn'] == 2
+    # The second turn carries the first question and answer
+    assert [call[3] for call in fakeprovider.calls] == [0, 2]
+
+    path = os.path.join(config['statedir'], 'sessions', 'case-1.json')
+    with open(path, 'r', encoding='utf-8') as read_file:
+        saved = json.load(read_file)
+    assert [turn['user'] for turn in saved['turns']] == ['first question', 'second question']
+
+    # Another process picks the session up from its file
+    from engine import engine as neweng
+    third = neweng(config).Run('third question', 'summarize', nocache=True, session='case-1')
+    assert third['session']['turn'] == 3
+    assert fakeprovider.calls[-1][3] == 4
+
+def test_sessions_survive_cache_eviction(engine, config):
+    engine.Run('first question', 'summarize', nocache=True, session='case-1')
+
+    assert not engine.sessions.directory.startswith(config['cachedir'])
+    engine.cache.maxbytes = 0
+    engine.cache.maxage = 0
+    engine.cache.Evict()
+    assert os.path.exists(engine.sessions.Path('case-1'))
+
+def test_compaction(engine):
+    engine.sessions.budget = 60
+    for number in range(4):
+        result = engine.Run('question ' + str(number) + ' ' + 'x' * 80, 'summarize', nocache=True, session='case-1')
+        assert result['status'] == 'ok'
+
+    session = engine.sessions.Load('case-1')
+    assert session['compacted'] > 0
+    assert session['summary'] == 'primary answer'
+    assert result['session'] == {'id': 'case-1', 'turn': 4, 'compacted': session['compacted']}
+    assert session['compacted'] + len(session['turns']) == 4
+    assert any(call[1] == engine.sessions.SUMMARYPROMPT for call in fakeprovider.calls)
+    # Later turns carry the summary and its acknowledgement in place of the compacted turns
+    assert engine.sessions.Messages(session)[0]['content'].endswith('primary answer')
+
+def test_failed_save_leaves_session_unchanged(engine, monkeypatch):
+    engine.Run('first question', 'summarize', nocache=True, session='case-1')
+
+    def Fail(source, destination):
+        raise OSError('disk full')
+    monkeypatch.setattr(sessions.os, 'replace', Fail)
+    result = engine.Run('second question', 'summarize', nocache=True, session='case-1')
+    monkeypatch.undo()
+
+    assert result['status'] == 'ok'
+    assert 'session' not in result
+    assert 'disk full' in result['warning']
+    assert len(engine.sessions.Load('case-1')['turns']) == 1
+    assert [name for name in os.listdir(engine.sessions.directory) if name.endswith('.tmp')] == []
+
+def test_failed_turn_is_not_added(engine):
+    fakeprovider.failures['primary'] = 400
+    fakeprovider.failures['secondary'] = 400
+
+    result = engine.Run('first question', 'summarize', nocache=True, session='case-1')
+
+    assert result['status'] == 'error'
+    assert not os.path.exists(engine.sessions.Path('case-1'))
+
+def test_invalid_session_id(engine):
+    result = engine.Run('first question', 'summarize', nocache=True, session='../escape')
+
+    assert result['status'] == 'error'
+    assert 'Invalid session ID' in result['error']
+    assert fakeprovider.calls == []
+
+def test_turn_waits_for_another_process(engine):
+    # Another process holding the session's lock file, as a turn in the daemon or a CLI run would
+    os.makedirs(engine.sessions.directory, exist_ok=True)
+    lockfile = open(engine.sessions.Path('case-1') + '.lock', 'a')
+    fcntl.flock(lockfile, fcntl.LOCK_EX)
+    results = []
+    thread = threading.Thread(target=lambda: results.append(engine.Run('first question', 'summarize', nocache=True, session='case-1')))
+    thread.start()
+
+    time.sleep(0.3)
+    assert (results == []) and (fakeprovider.calls == [])
+    lockfile.close()
+    thread.join(5)
+
+    assert results[0]['session']['turn'] == 1
@@ -0,0 +1,49 @@
+'''
+Mainstay v0.4 - Copyright 2025 James Slaughter,
+This file is part of Mainstay v0.4.
+
+Mainstay v0.4 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Mainstay v0.4 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Mainstay v0.4.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+"""
+test_tokens.py - Tests of local token counting
+"""
+
+#python imports
+import sys
+import builtins
+
+#programmer generated imports
+from tokens import tokencounter
+
+def test_missing_tiktoken_imported_once(config, monkeypatch):
+    attempts = []
+    original = builtins.__import__
+
+    def Import(name, *args, **kwargs):
+        if (name == 'tiktoken'):
+            attempts.append(name)
+            raise ImportError('No module named tiktoken')
+        return original(name, *args, **kwargs)
+    monkeypatch.delitem(sys.modules, 'tiktoken', raising=False)
+    monkeypatch.setattr(builtins, '__import__', Import)
+
+    counter = tokencounter(config)
+    counts = [counter.Count(ai, model, 'x' * 40 + str(number)) for number in range(5)
+              for ai, model in [('chatgpt', 'gpt-4o'), ('chatgpt', 'unknown-model'), ('claude', 'claude-sonnet-4')]]
+
+    assert attempts == ['tiktoken']
+    assert counts[0] == 11
+    assert counter.EncodingName('chatgpt', 'gpt-4o') == 'o200k_base'
+    assert counter.EncodingName('claude', 'claude-3-haiku') == 'cl100k_base'
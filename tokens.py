@@ -0,0 +1,332 @@
+'''
+Mainstay v0.4 - Copyright 2025 James Slaughter,
+This file is part of Mainstay v0.4.
+
+Mainstay v0.4 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Mainstay v0.4 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Mainstay v0.4.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+"""
+tokens.py - Local token counting and request sizing for Mainstay v0.4
+
+This module counts tokens locally, without a network call, and holds the per-model figures needed to size a
+request before it is sent: context window, price and expected speed.  Counts use tiktoken when it is installed and
+a four-characters-per-token estimate otherwise.  OpenAI models get their own encoding.  Claude and Perplexity
+models are counted with a close OpenAI encoding, since neither provider publishes a local tokenizer.  Counts are
+memoized by content hash, in memory and in tokencounts.json in the state directory, so counting the same prompt
+or input again costs only the hash.
+
+Classes:
+    tokencounter: Counts tokens and looks up context limits, prices and expected latency per model.
+
+Copyright 2025 James Slaughter. Licensed under GPL v3 or later.
+"""
+
+#python imports
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+'''
+tokencounter
+Class: This class is responsible for counting tokens and estimating the size, cost and duration of a request
+'''
+class tokencounter:
+    """
+    The tokencounter class counts tokens per model and holds the model tables used by preflight checks.
+    """
+    '''
+    Constructor
+    '''
+    def __init__(self, config):
+        """
+        Initializes the counter.  tiktoken and the memo file are loaded on first use.
+
+        Args:
+            config: Dictionary loaded from mainstay.conf.  Optional keys are contextlimits and pricing
+                    ({"<model prefix>": tokens} and {"<model prefix>": [USD per million input tokens, USD per million
+                    output tokens]}), latency ({"<ai>": {"ttft": seconds, "tps": output tokens per second}}),
+                    reserve (tokens kept free for the response), expectedoutput (output tokens assumed per call)
+                    and statedir (where tokencounts.json is kept, /opt/mainstay/state by default).
+        """
+        self.contextlimits = {
+            'gpt-3.5-turbo': 16385,
+            'gpt-4': 8192,
+            'gpt-4-turbo': 128000,
+            'gpt-4-0125-preview': 128000,
+            'gpt-4-1106-preview': 128000,
+            'gpt-4o': 128000,
+            'gpt-4.1': 1047576,
+            'o1': 200000,
+            'o3': 200000,
+            'o4-mini': 200000,
+            'claude-': 200000,
+            'sonar': 127072,
+            'sonar-pro': 200000,
+            'sonar-reasoning-pro': 127072
+        }
+        self.contextlimits.update(config.get('contextlimits', {}))
+        self.defaultlimits = {'chatgpt': 128000, 'claude': 200000, 'perplexity': 127072}
+        # USD per million tokens, [input, output].  Perplexity's per-request search fees are not included.
+        self.pricing = {
+            'gpt-3.5-turbo': [0.50, 1.50],
+            'gpt-4': [30.00, 60.00],
+            'gpt-4-turbo': [10.00, 30.00],
+            'gpt-4-0125-preview': [10.00, 30.00],
+            'gpt-4-1106-preview': [10.00, 30.00],
+            'gpt-4o': [2.50, 10.00],
+            'gpt-4o-mini': [0.15, 0.60],
+            'gpt-4.1': [2.00, 8.00],
+            'gpt-4.1-mini': [0.40, 1.60],
+            'gpt-4.1-nano': [0.10, 0.40],
+            'o1': [15.00, 60.00],
+            'o3': [2.00, 8.00],
+            'o4-mini': [1.10, 4.40],
+            'claude-3-haiku': [0.25, 1.25],
+            'claude-3-5-haiku': [0.80, 4.00],
+            'claude-haiku': [0.80, 4.00],
+            'claude-3-5-sonnet': [3.00, 15.00],
+            'claude-3-7-sonnet': [3.00, 15.00],
+            'claude-sonnet': [3.00, 15.00],
+            'claude-3-opus': [15.00, 75.00],
+            'claude-opus': [15.00, 75.00],
+            'sonar': [1.00, 1.00],
+            'sonar-pro': [3.00, 15.00],
+            'sonar-reasoning': [1.00, 5.00],
+            'sonar-reasoning-pro': [2.00, 8.00]
+        }
+        self.pricing.update(config.get('pricing', {}))
+        self.latency = {
+            'chatgpt': {'ttft': 0.8, 'tps': 60.0},
+            'claude': {'ttft': 1.2, 'tps': 50.0},
+            'perplexity': {'ttft': 1.5, 'tps': 80.0}
+        }
+        self.latency.update(config.get('latency', {}))
+        self.prefill = 5000.0#input tokens a provider reads per second before the first output token
+        self.reserve = int(config.get('reserve', 4096))#tokens kept free for the response
+        self.expectedoutput = int(config.get('expectedoutput', 1000))#output tokens assumed per call when estimating
+        # Kept out of cachedir, whose eviction would otherwise throw the counts away
+        self.memofile = os.path.join(config.get('statedir', '/opt/mainstay/state'), 'tokencounts.json')
+        self.memosize = 10000#counts kept in memory and on disk
+        self.lock = threading.Lock()
+        self.tiktoken = None#tiktoken module, or False when it is not installed, imported on first use
+        self.encodings = {}#encoding name -> tiktoken encoding, or None when it cannot be loaded
+        self.encodingnames = {}#(ai, model) -> encoding name
+        self.memo = None#(encoding name, content hash) -> count, loaded on first use
+        self.dirty = False
+
+    '''
+    Match()
+    Function: - Returns the value of the longest model-name prefix in a table
+    '''
+    def Match(self, table, model, default=None):
+        match = ''
+
+        for prefix in table:
+            if (model.lower().startswith(prefix.lower()) and (len(prefix) > len(match))):
+                match = prefix
+
+        if (match != ''):
+            return table[match]
+
+        return default
+
+    '''
+    ContextLimit()
+    Function: - Returns the context window of a model in tokens
+    '''
+    def ContextLimit(self, ai, model):
+        return int(self.Match(self.contextlimits, model, self.defaultlimits.get(ai, 128000)))
+
+    '''
+    Budget()
+    Function: - Returns the number of input tokens that fit beside a prompt of a given size
+    '''
+    def Budget(self, ai, model, prompt_tokens):
+        return self.ContextLimit(ai, model) - prompt_tokens - self.reserve
+
+    '''
+    Tiktoken()
+    Function: - Returns the tiktoken module, or False when it is not installed
+    '''
+    def Tiktoken(self):
+        """
+        Imports tiktoken on first use and keeps the result, including its absence, so a missing package costs one
+        failed import per process instead of one per count.
+        """
+        if (self.tiktoken is None):
+            try:
+                import tiktoken
+                self.tiktoken = tiktoken
+            except Exception:
+                self.tiktoken = False
+
+        return self.tiktoken
+
+    '''
+    EncodingName()
+    Function: - Returns the tiktoken encoding used to count tokens for a model
+    '''
+    def EncodingName(self, ai, model):
+        """
+        Returns the encoding for an OpenAI model.  Claude and Perplexity models, and OpenAI models that tiktoken does
+        not know, are counted with o200k_base for current models and cl100k_base otherwise.  The name is kept per
+        model after the first lookup.
+        """
+        if ((ai, model) in self.encodingnames):
+            return self.encodingnames[(ai, model)]
+
+        name = None
+        tiktoken = self.Tiktoken()
+        if ((ai == 'chatgpt') and (tiktoken != False)):
+            try:
+                name = tiktoken.encoding_name_for_model(model)
+            except Exception:
+                pass
+
+        if (name is None):
+            if (model.lower().startswith(('gpt-4o', 'gpt-4.1', 'gpt-5', 'o1', 'o3', 'o4'))):
+                name = 'o200k_base'
+            else:
+                name = 'cl100k_base'
+        self.encodingnames[(ai, model)] = name
+
+        return name
+
+    '''
+    Encoding()
+    Function: - Returns a tiktoken encoding, or None when tiktoken or its data is unavailable
+    '''
+    def Encoding(self, name):
+        with self.lock:
+            if (name in self.encodings):
+                return self.encodings[name]
+
+        encoding = None
+        tiktoken = self.Tiktoken()
+        if (tiktoken != False):
+            try:
+                encoding = tiktoken.get_encoding(name)
+            except Exception:
+                pass
+
+        with self.lock:
+            self.encodings[name] = encoding
+
+        return encoding
+
+    '''
+    LoadMemo()
+    Function: - Loads the memoized counts from disk on first use
+    '''
+    def LoadMemo(self):
+        memo = OrderedDict()
+
+        try:
+            with open(self.memofile, 'r', encoding='utf-8') as read_file:
+                for key, count in json.load(read_file):
+                    memo[tuple(key)] = count
+        except Exception:
+            pass
+
+        return memo
+
+    '''
+    Save()
+    Function: - Writes the memoized counts to disk if any were added
+    '''
+    def Save(self):
+        with self.lock:
+            if ((self.dirty == False) or (self.memo is None)):
+                return 0
+            entries = [[list(key), count] for key, count in self.memo.items()]
+            self.dirty = False
+
+        temp = self.memofile + '.' + str(os.getpid()) + '.' + str(threading.get_ident()) + '.tmp'
+        try:
+            os.makedirs(os.path.dirname(self.memofile), exist_ok=True)
+            with open(temp, 'w', encoding='utf-8') as write_file:
+                json.dump(entries, write_file)
+            os.replace(temp, self.memofile)
+        except Exception:
+            return -1
+
+        return 0
+
+    '''
+    Count()
+    Function: - Returns the number of tokens in a string for a model
+    '''
+    def Count(self, ai, model, text, texthash=None):
+        """
+        Counts the tokens in text as the model would see them.
+
+        Args:
+            ai: chatgpt, perplexity or claude.
+            model: Model name.
+            text: The text to count.
+            texthash: SHA-256 hex digest of text when the caller already has it, such as the prompt store's hash.
+
+        Returns:
+            int: Number of tokens.
+        """
+        name = self.EncodingName(ai, model)
+        encoding = self.Encoding(name)
+        if (encoding is None):
+            name = 'estimate'
+
+        if (texthash is None):
+            texthash = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        key = (name, texthash)
+
+        with self.lock:
+            if (self.memo is None):
+                self.memo = self.LoadMemo()
+            if (key in self.memo):
+                self.memo.move_to_end(key)
+                return self.memo[key]
+
+        if (encoding is None):
+            count = len(text) // 4 + 1
+        else:
+            count = len(encoding.encode(text, disallowed_special=()))
+
+        with self.lock:
+            self.memo[key] = count
+            self.dirty = True
+            while (len(self.memo) > self.memosize):
+                self.memo.popitem(last=False)
+
+        return count
+
+    '''
+    Cost()
+    Function: - Returns the expected cost of a request in USD, or None when the model's price is unknown
+    '''
+    def Cost(self, model, input_tokens, output_tokens):
+        price = self.Match(self.pricing, model)
+        if (price is None):
+            return None
+
+        return (input_tokens * price[0] + output_tokens * price[1]) / 1000000.0
+
+    '''
+    Latency()
+    Function: - Returns the expected duration of one call in seconds
+    '''
+    def Latency(self, ai, input_tokens, output_tokens):
+        profile = self.latency.get(ai, {'ttft': 1.0, 'tps': 50.0})
+
+        return profile['ttft'] + input_tokens / self.prefill + output_tokens / profile['tps']
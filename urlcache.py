@@ -0,0 +1,188 @@
+'''
+Mainstay v0.4 - Copyright 2025 James Slaughter,
+This file is part of Mainstay v0.4.
+
+Mainstay v0.4 is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Mainstay v0.4 is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Mainstay v0.4.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+"""
+urlcache.py - Conditional-GET cache for fetched URLs for Mainstay v0.4
+
+This module keeps the pages neomainstay fetches for URL input on disk, together with the ETag and Last-Modified
+validators the server sent.  A page fetched within the last few minutes is served without contacting the server.
+After that the cached copy is revalidated with If-None-Match/If-Modified-Since, and a 304 Not Modified answer is
+served from disk instead of downloading the page again.  Pages are streamed and the download stops at a byte
+limit, so a very large page is never read into memory whole.  Storage, size limit and LRU eviction are those of
+the response cache.
+
+Classes:
+    urlcache: On-disk store of fetched pages that revalidates them with conditional requests.
+
+Copyright 2025 James Slaughter. Licensed under GPL v3 or later.
+"""
+
+#python imports
+import time
+import codecs
+
+#programmer generated imports
+from cache import responsecache
+
+'''
+urlcache
+Class: This class is responsible for fetching URLs and revalidating the copies it keeps on disk
+'''
+class urlcache(responsecache):
+    """
+    The urlcache class stores one entry per URL: the page text, its content type, its validators and the time it
+    was last confirmed current.  Fetch() reports whether a page was served fresh from the cache, revalidated with a
+    304 or downloaded.
+    """
+    '''
+    Constructor
+    '''
+    def __init__(self, cachedir, session, ttl=300, maxbytes=64 * 1024 * 1024, maxage=7 * 86400, maxdownload=5 * 1024 * 1024):
+        """
+        Initializes the cache.
+
+        Args:
+            cachedir: Directory holding the cache entries.  It must not be inside the response cache directory.
+            session: Function returning the requests session to fetch with, such as clients.Session.
+            ttl: Seconds a page is served without revalidating it.
+            maxbytes: Total size the cache is trimmed back to.
+            maxage: Seconds an entry is kept after it was last confirmed current.
+            maxdownload: Bytes of a page that are downloaded; the rest is discarded.
+        """
+        responsecache.__init__(self, cachedir, maxbytes=maxbytes, maxage=maxage)
+        self.session = session
+        self.ttl = ttl
+        self.maxdownload = maxdownload
+        self.fresh = 0#served without contacting the server
+        self.revalidated = 0#served after a 304 Not Modified
+        self.fetched = 0#downloaded in full
+
+    '''
+    Fetch()
+    Function: - Returns the content of a URL from the cache or the server
+    '''
+    def Fetch(self, url, headers=None, timeout=30):
+        """
+        Fetches a URL.  A cached copy younger than ttl is returned as is.  An older copy is revalidated with a
+        conditional request and reused on 304.  Otherwise the first maxdownload bytes of the page are downloaded
+        and, unless the server sent Cache-Control: no-store, stored with its validators.  Content that is not text
+        is neither downloaded nor stored, and is returned with empty text.
+
+        Args:
+            url: The URL to fetch.
+            headers: Extra request headers, such as the User-Agent.
+            timeout: Seconds to wait for the server.
+
+        Returns:
+            dict: text, content_type, cache ('fresh', 'revalidated' or 'fetched') and truncated (True when the page
+                  was larger than maxdownload).
+
+        Raises:
+            requests.exceptions.RequestException: If the request fails or the server returns an error status.
+        """
+        key = self.Hash(url)
+        entry = self.Get(key)
+
+        if ((entry is not None) and ((time.time() - entry['checked']) < self.ttl)):
+            self.Count('fresh')
+            return self.Page(entry, 'fresh')
+
+        request_headers = dict(headers or {})
+        if (entry is not None):
+            if (entry['etag'] != ''):
+                request_headers['If-None-Match'] = entry['etag']
+            if (entry['last_modified'] != ''):
+                request_headers['If-Modified-Since'] = entry['last_modified']
+
+        with self.session().get(url, headers=request_headers, timeout=timeout, stream=True) as response:
+            if ((response.status_code == 304) and (entry is not None)):
+                entry['checked'] = time.time()
+                entry['etag'] = response.headers.get('ETag', entry['etag'])
+                entry['last_modified'] = response.headers.get('Last-Modified', entry['last_modified'])
+                self.Put(key, entry)
+                self.Count('revalidated')
+                return self.Page(entry, 'revalidated')
+
+            response.raise_for_status()
+
+            entry = {'url': url, 'checked': time.time(), 'etag': response.headers.get('ETag', ''),
+                     'last_modified': response.headers.get('Last-Modified', ''),
+                     'content_type': response.headers.get('content-type', '').lower(), 'text': '', 'truncated': False}
+            if (('text' not in entry['content_type']) and ('html' not in entry['content_type'])):
+                return self.Page(entry, 'fetched')
+
+            body = bytearray()
+            for block in response.iter_content(chunk_size=65536):
+                body.extend(block)
+                if (len(body) > self.maxdownload):
+                    entry['truncated'] = True
+                    del body[self.maxdownload:]
+                    break
+
+        entry['text'] = bytes(body).decode(self.Charset(entry['content_type']), errors='replace')
+        if ('no-store' not in response.headers.get('Cache-Control', '').lower()):
+            self.Put(key, entry)
+        self.Count('fetched')
+
+        return self.Page(entry, 'fetched')
+
+    '''
+    Page()
+    Function: - Builds the dictionary returned by Fetch() from a cache entry
+    '''
+    def Page(self, entry, cache):
+        return {'text': entry['text'], 'content_type': entry['content_type'], 'cache': cache,
+                'truncated': entry.get('truncated', False)}
+
+    '''
+    Charset()
+    Function: - Returns the character set named in a Content-Type header
+    '''
+    def Charset(self, content_type):
+        """
+        Returns the charset parameter of content_type when Python knows it, and utf-8 otherwise.
+        """
+        for parameter in content_type.split(';')[1:]:
+            name, _, value = parameter.strip().partition('=')
+            if (name.strip() == 'charset'):
+                try:
+                    return codecs.lookup(value.strip().strip('"\'')).name
+                except LookupError:
+                    break
+
+        return 'utf-8'
+
+    '''
+    Count()
+    Function: - Increments one of the fetch counters
+    '''
+    def Count(self, counter):
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    '''
+    Stats()
+    Function: - Returns the fetch counters
+    '''
+    def Stats(self):
+        """
+        Returns how many fetches were served fresh, revalidated or downloaded, and the bytes on disk.
+        """
+        with self.lock:
+            return {'fresh': self.fresh, 'revalidated': self.revalidated, 'fetched': self.fetched,
+                    'evictions': self.evictions, 'bytes': self.size}